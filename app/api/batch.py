@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+# batch.py
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+import orjson
+from fastapi import Request
+from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
+from starlette.types import Message
+
+from app.api.schemas.batch import BatchOperation
+from app.core.config import API_PREFIX, BATCH_CONCURRENCY
+from app.services.authentication import Principal, current_principal
+
+logger = logging.getLogger(__name__)
+
+# サブリクエストに引き継がないレスポンスヘッダ
+DROP_HEADERS = ("content-length",)
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class BatchDispatcher:
+    """
+    バッチのサブリクエストをHTTPを経由せずアプリ内(ASGI)で実行する。
+    サブリクエストは並行に実行し、認証済みのアカウントを共有する(トークンの検証/権限確認の再取得を省略)。
+    """
+
+    request: Request
+    principal: Principal
+    concurrency: int
+
+    def __init__(
+        self,
+        request: Request,
+        principal: Principal,
+        concurrency: int = BATCH_CONCURRENCY,
+    ) -> None:
+        self.request = request
+        self.principal = principal
+        self.concurrency = concurrency
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def run(self, operations: List[BatchOperation]) -> List[Dict[str, Any]]:
+        """サブリクエストを実行し、レスポンスをリクエスト順に返却する"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(operation: BatchOperation) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.dispatch(operation)
+
+        # 並行実行するタスクはここで設定したコンテキストを引き継ぐ
+        reset = current_principal.set(self.principal)
+        try:
+            return await asyncio.gather(*(limited(op) for op in operations))
+        finally:
+            current_principal.reset(reset)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def dispatch(self, operation: BatchOperation) -> Dict[str, Any]:
+        """サブリクエスト1件の実行"""
+        body = b"" if operation.body is None else orjson.dumps(operation.body)
+        received = False
+        finished = asyncio.Event()
+
+        async def receive() -> Message:
+            nonlocal received
+            if received:
+                # サブリクエストの切断はバッチの応答完了時(バッチ自体のキャンセルは親で処理)
+                await finished.wait()
+                return {"type": "http.disconnect"}
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status: Optional[int] = None
+        headers: Dict[str, str] = {}
+        chunks: List[bytes] = []
+
+        async def send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers.update(
+                    (k.decode("latin-1"), v.decode("latin-1"))
+                    for k, v in message.get("headers", [])
+                    if k.decode("latin-1") not in DROP_HEADERS
+                )
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.request.app(self.scope(operation, body), receive, send)
+        except Exception:
+            # 応答送信後に再送出された例外(500応答済み)、または応答前の例外
+            logger.exception(
+                "batch operation failed: %s %s", operation.method, operation.path
+            )
+            if status is None:
+                status = HTTP_500_INTERNAL_SERVER_ERROR
+        finally:
+            finished.set()
+
+        return {
+            "id": operation.id,
+            "status": status,
+            "headers": headers,
+            "body": self.parse(b"".join(chunks), headers),
+        }
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]サブリクエストのASGIスコープの作成
+    def scope(self, operation: BatchOperation, body: bytes) -> Dict[str, Any]:
+        parent = self.request.scope
+        path, _, query = operation.path.partition("?")
+        if operation.query:
+            query = "&".join(
+                q for q in (query, urlencode(operation.query, doseq=True)) if q
+            )
+
+        headers = {
+            k.lower(): v
+            for k, v in operation.headers.items()
+            if k.lower() not in ("authorization", "content-length", "host")
+        }
+        headers["authorization"] = self.request.headers.get("authorization", "")
+        headers["host"] = self.request.headers.get("host", "")
+        if body:
+            headers["content-type"] = "application/json"
+            headers["content-length"] = str(len(body))
+
+        return {
+            "type": "http",
+            "asgi": parent.get("asgi", {"version": "3.0"}),
+            "http_version": parent.get("http_version", "1.1"),
+            "method": operation.method,
+            "scheme": parent.get("scheme", "http"),
+            "server": parent.get("server"),
+            "client": parent.get("client"),
+            "root_path": parent.get("root_path", ""),
+            "path": f"{API_PREFIX}{path}",
+            "raw_path": f"{API_PREFIX}{path}".encode(),
+            "query_string": query.encode(),
+            "headers": [
+                (k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()
+            ],
+        }
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]レスポンスボディの復元(JSON以外は文字列のまま返却)
+    def parse(self, content: bytes, headers: Dict[str, str]) -> Any:
+        if not content:
+            return None
+        if headers.get("content-type", "").startswith("application/json"):
+            return orjson.loads(content)
+        return content.decode(errors="replace")
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# cancellation.py
+
+import asyncio
+import functools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Set, Tuple
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy.exc import DBAPIError
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from app.api.profiling import PROFILE_HEADER, profile_request
+from app.core.config import (
+    PROFILE_ENABLED,
+    REQUEST_TIMEOUT_SECONDS,
+    ROUTE_STATEMENT_TIMEOUTS,
+    ROUTE_TIMEOUTS,
+    SERVER_TIMING_ENABLED,
+    STATEMENT_TIMEOUT_MILLISECONDS,
+)
+from app.core.database import cancel_backends, request_backends, statement_timeout
+from app.core.metrics import queries_per_request, request_latency, requests_in_flight
+from app.core.tracing import (
+    RequestTrace,
+    log_over_budget,
+    request_trace,
+    server_timing,
+)
+
+logger = logging.getLogger(__name__)
+
+# クライアント切断(nginx互換のステータス。クライアントには届かずアクセスログ用)
+HTTP_499_CLIENT_CLOSED_REQUEST = 499
+
+# 文のタイムアウト/キャンセルによるクエリ中断(SQLSTATE: query_canceled)
+QUERY_CANCELED = "57014"
+
+# タイムアウト例外
+timeout_exception: HTTPException = HTTPException(
+    status_code=HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Request timed out.",
+)
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+async def wait_disconnect(request: Request) -> None:
+    """クライアントの切断を待つ(ボディ受信後に届くメッセージは切断通知のみ)"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel(task: asyncio.Task, backends: Set[Tuple[str, int]]) -> None:
+    """実行中のクエリをサーバー側で中断した上でタスクをキャンセルし、終了を待つ"""
+    try:
+        await cancel_backends(backends)
+    except Exception:
+        logger.exception("cancel backends failed.")
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, DBAPIError):
+        pass
+    except Exception:
+        logger.exception("cancelled request failed.")
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class CancellableRoute(APIRoute):
+    """
+    タイムアウト/クライアント切断時に処理中のリクエストをキャンセルするルート。
+    キャンセル時は処理中のタスクが使用しているDB接続のクエリもサーバー側で中断する。
+    タイムアウト(ROUTE_TIMEOUTS)/DBの文のタイムアウト(ROUTE_STATEMENT_TIMEOUTS)はルート名ごとに設定できる。
+    ルート名ごとの処理時間/SQL文の実行件数をメトリクスに記録し、DB/認証/シリアライズの
+    処理時間をServer-Timingヘッダで返却する。
+    管理ユーザーはX-Profileヘッダの指定でリクエストをプロファイラで実行できる(PROFILE_ENABLED)。
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        self.trace_endpoint()
+        handler = super().get_route_handler()
+        # ルート名ごとのメトリクス(リクエストごとに取得しないよう事前に取得する)
+        latency = request_latency.labels(self.name)
+        queries_count = queries_per_request.labels(self.name)
+
+        async def measured_handler(request: Request) -> Response:
+            # バッチのサブリクエストの処理はバッチのリクエストにも記録する
+            trace = RequestTrace(parent=request_trace.get())
+            reset = request_trace.set(trace)
+            requests_in_flight.inc()
+            started = time.perf_counter()
+            try:
+                if PROFILE_ENABLED and PROFILE_HEADER in request.headers:
+                    response = await profile_request(
+                        request, cancellable_handler, self.name
+                    )
+                else:
+                    response = await cancellable_handler(request)
+                finished = time.perf_counter()
+                if SERVER_TIMING_ENABLED:
+                    serialize = None
+                    if trace.endpoint_done is not None:
+                        serialize = finished - trace.endpoint_done
+                    response.headers.append(
+                        "Server-Timing",
+                        server_timing(trace, finished - started, serialize),
+                    )
+                return response
+            finally:
+                total = time.perf_counter() - started
+                latency.observe(total)
+                queries_count.observe(trace.queries)
+                requests_in_flight.dec()
+                request_trace.reset(reset)
+                log_over_budget(self.name, trace, total)
+
+        async def cancellable_handler(request: Request) -> Response:
+            timeout = ROUTE_TIMEOUTS.get(self.name, REQUEST_TIMEOUT_SECONDS)
+            db_timeout = ROUTE_STATEMENT_TIMEOUTS.get(
+                self.name, STATEMENT_TIMEOUT_MILLISECONDS
+            )
+
+            # 切断の監視でボディを読み捨てないよう先に受信する(Requestにキャッシュされる)
+            await request.body()
+
+            # 処理タスクはここで設定した文のタイムアウト(get_sessionで適用)と
+            # 使用するDB接続の記録先を引き継ぐ
+            backends: Set[Tuple[str, int]] = set()
+            reset = statement_timeout.set(db_timeout), request_backends.set(backends)
+            try:
+                work = asyncio.create_task(handler(request))
+            finally:
+                statement_timeout.reset(reset[0])
+                request_backends.reset(reset[1])
+            disconnect = asyncio.create_task(wait_disconnect(request))
+
+            try:
+                done, _ = await asyncio.wait(
+                    {work, disconnect},
+                    timeout=timeout or None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                disconnect.cancel()
+                if not work.done():
+                    await cancel(work, backends)
+
+            if work in done:
+                try:
+                    return work.result()
+                except DBAPIError as e:
+                    if getattr(e.orig, "sqlstate", None) != QUERY_CANCELED:
+                        raise
+                    logger.warning("statement timed out: %s", self.name)
+                    raise timeout_exception from e
+            if disconnect in done:
+                logger.info("client disconnected: %s", self.name)
+                return Response(status_code=HTTP_499_CLIENT_CLOSED_REQUEST)
+            logger.warning("request timed out: %s", self.name)
+            raise timeout_exception
+
+        return measured_handler
+
+    def trace_endpoint(self) -> None:
+        """エンドポイント関数の終了時刻を記録する(以降をシリアライズの処理時間とする)"""
+        call = self.dependant.call
+        if not asyncio.iscoroutinefunction(call):
+            return
+
+        @functools.wraps(call)
+        async def traced_call(*args, **kwargs):
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                trace = request_trace.get()
+                if trace is not None:
+                    trace.endpoint_done = time.perf_counter()
+
+        self.dependant.call = traced_call
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+# conditional.py
+
+import zlib
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Optional
+
+from fastapi import Request, Response
+from starlette.status import HTTP_304_NOT_MODIFIED
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def version_of(modified_at: Optional[datetime]) -> int:
+    """更新日時をバージョン値(エポックからのマイクロ秒)に変換する"""
+    if modified_at is None:
+        return 0
+    return (modified_at - EPOCH) // timedelta(microseconds=1)
+
+
+def modified_at_of(version: int) -> datetime:
+    """バージョン値を更新日時に変換する"""
+    return EPOCH + timedelta(microseconds=version)
+
+
+def entity_tag(key: str, versions: List[Optional[datetime]]) -> str:
+    """リソースキー/更新日時からETagを生成する"""
+    parts = [format(zlib.crc32(key.encode()), "08x")]
+    parts += [format(version_of(v), "x") for v in versions]
+    return '"{}"'.format("-".join(parts))
+
+
+def parse_entity_tag(tag: str) -> Optional[List[int]]:
+    """ETagからバージョン値を取り出す(不正な形式の場合はNone)"""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return [int(v, 16) for v in tag.strip('"').split("-")[1:]]
+    except ValueError:
+        return None
+
+
+def if_match(request: Request, key: str) -> Optional[List[datetime]]:
+    """
+    If-Matchヘッダ(楽観的排他制御)から更新の条件とする更新日時を取り出す。
+    ヘッダ無し/「*」の場合はNone(無条件)。弱いETag、他のリソースのETag、不正な形式は
+    一致しないETagとして扱う(いずれも一致しない場合は空のリスト)。
+    ETagの先頭のバージョン値(リソース自体の更新日時)のみを比較する。
+    """
+    header = request.headers.get("if-match")
+    if header is None:
+        return None
+    tags = [t.strip() for t in header.split(",")]
+    if "*" in tags:
+        return None
+
+    prefix = entity_tag(key, [])[:-1]
+    modified_at = []
+    for tag in tags:
+        if not tag.startswith(prefix + "-"):
+            continue
+        versions = parse_entity_tag(tag)
+        if versions:
+            modified_at.append(modified_at_of(versions[0]))
+    return modified_at
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class Conditional:
+    """更新日時によるリソースの条件付きリクエスト(ETag/Last-Modified)"""
+
+    request: Request
+    etag: str
+    last_modified: datetime
+
+    def __init__(
+        self, request: Request, key: str, versions: List[Optional[datetime]]
+    ) -> None:
+        self.request = request
+        self.etag = entity_tag(key, versions)
+        self.last_modified = max(v for v in versions if v is not None)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(
+                self.last_modified.astimezone(timezone.utc), usegmt=True
+            ),
+            "Cache-Control": "private, no-cache",
+        }
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def not_modified(self) -> bool:
+        """クライアントのキャッシュが有効な場合にTrue(If-None-Match優先)"""
+        if_none_match = self.request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags
+
+        if_modified_since = self.request.headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                return False
+            # HTTP日付は秒単位のため、秒未満を切り捨てて比較する
+            return self.last_modified.replace(microsecond=0) <= since
+        return False
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def not_modified_response(self) -> Response:
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers=self.headers)
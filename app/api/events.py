@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+# events.py
+
+import asyncio
+from typing import AsyncIterator, Optional, Set
+
+import orjson
+
+from app.core.config import (
+    SSE_KEEPALIVE_SECONDS,
+    SSE_QUEUE_SIZE,
+    SSE_RETRY_MILLISECONDS,
+)
+from app.core.notify import ChangeBus, ChangeEvent, change_bus
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def sse_message(event: str, data: dict) -> bytes:
+    """SSEのメッセージを生成する"""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class WatchTaskStream:
+    """
+    監視タスクの更新通知(Server-Sent Events)。
+    ワーカーで共有するテーブル更新通知(change_bus)を購読し、接続ごとのキューを経由して配信する。
+    - task: 監視中のタスクの更新 {"id": タスクID, "op": INSERT/UPDATE/DELETE}
+    - watch: 監視タスクの登録/ノート更新/解除 {"id": タスクID, "op": INSERT/UPDATE/DELETE}
+    - resync: 通知の欠落(再接続/キュー溢れ/TRUNCATE)。ストリームを終了するため、再接続して一覧を取得し直すこと
+    """
+
+    account_id: str
+    task_ids: Set[int]
+    keepalive: float
+    overflow: bool
+    subscribed: bool
+
+    def __init__(
+        self,
+        account_id: str = "",
+        task_ids: Optional[Set[int]] = None,
+        bus: ChangeBus = change_bus,
+        keepalive: float = SSE_KEEPALIVE_SECONDS,
+        queue_size: int = SSE_QUEUE_SIZE,
+    ) -> None:
+        self.account_id = account_id
+        self.task_ids = set() if task_ids is None else task_ids
+        self.bus = bus
+        self.keepalive = keepalive
+        self.overflow = False
+        self.subscribed = False
+        self.queue: asyncio.Queue[Optional[ChangeEvent]] = asyncio.Queue(queue_size)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def subscribe(self) -> None:
+        """
+        購読の開始。
+        監視タスクIDの取得前に購読し、取得中の通知はキューに積んで配信開始時に処理する。
+        """
+        if not self.subscribed:
+            self.bus.subscribe(self.on_change)
+            self.subscribed = True
+
+    def close(self) -> None:
+        """購読の終了(ストリームが開始されなかった場合も呼び出すこと)"""
+        if self.subscribed:
+            self.bus.unsubscribe(self.on_change)
+            self.subscribed = False
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def on_change(self, event: Optional[ChangeEvent]) -> None:
+        """更新通知の購読(通知の受信をブロックしないようキューに積むのみ)"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflow = True
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def events(self) -> AsyncIterator[bytes]:
+        """SSEのストリーム(クライアントの切断まで、またはresync送信まで継続する)"""
+        self.subscribe()
+        try:
+            yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n".encode()
+            while True:
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+
+                if self.overflow or event is None or event.op == "TRUNCATE":
+                    yield sse_message("resync", {})
+                    return
+                message = self.message(event)
+                if message is not None:
+                    yield message
+        finally:
+            self.close()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]更新通知からメッセージを生成する(対象外の通知はNone)
+    def message(self, event: ChangeEvent) -> Optional[bytes]:
+        if event.schema != "todo":
+            return None
+        if event.table == "tasks":
+            task_id = event.keys.get("id")
+            if task_id not in self.task_ids:
+                return None
+            return sse_message("task", {"id": task_id, "op": event.op})
+        if event.table == "watcher":
+            if event.keys.get("watcher_id") != self.account_id:
+                return None
+            task_id = event.keys.get("task_id")
+            if event.op == "DELETE":
+                self.task_ids.discard(task_id)
+            else:
+                self.task_ids.add(task_id)
+            return sse_message("watch", {"id": task_id, "op": event.op})
+        return None
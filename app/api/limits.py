@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+# limits.py
+
+import math
+import time
+from typing import Any, Dict, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.status import (
+    HTTP_500_INTERNAL_SERVER_ERROR,
+    HTTP_503_SERVICE_UNAVAILABLE,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import (
+    API_PREFIX,
+    CONCURRENCY_INITIAL_LIMITS,
+    CONCURRENCY_MAX_LIMIT,
+    CONCURRENCY_MIN_LIMIT,
+    CONCURRENCY_RETRY_AFTER_SECONDS,
+)
+
+# 更新系のHTTPメソッド
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def route_group(method: str, path: str) -> Optional[str]:
+    """
+    同時実行数を制限するルートグループの判定(制限対象外の場合はNone)。
+    - login: ログイン/パスワード変更(パスワードのハッシュ計算を伴う)
+    - search: 検索(クエリメソッド)
+    - write: その他の更新系
+    ※参照系(GET)、バッチ(サブリクエストごとに判定する)は対象外
+    """
+    if not path.startswith(API_PREFIX):
+        return None
+    path = path[len(API_PREFIX) :]
+    if method not in WRITE_METHODS or path == "/batch":
+        return None
+    if path == "/login" or path.endswith("/password"):
+        return "login"
+    if "/search" in path:
+        return "search"
+    return "write"
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class AdaptiveLimit:
+    """
+    観測したレイテンシに基づいて調整する同時実行数の上限(Gradient方式)。
+    長期平均のレイテンシに対して直近のレイテンシが悪化した割合で上限を縮小し、
+    悪化していなければ待ち行列分(上限の平方根)ずつ拡大する。
+    ※イベントループ上でのみ操作するためロックは不要
+    """
+
+    limit: float
+    min_limit: int
+    max_limit: int
+    inflight: int
+    rejected: int
+    long_rtt: Optional[float]
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = CONCURRENCY_MIN_LIMIT,
+        max_limit: int = CONCURRENCY_MAX_LIMIT,
+        smoothing: float = 0.2,
+        tolerance: float = 1.5,
+        long_window: int = 600,
+    ) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.long_window = long_window
+        self.inflight = 0
+        self.rejected = 0
+        self.long_rtt = None
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def try_acquire(self) -> bool:
+        """実行枠の取得(上限に達している場合はFalse)"""
+        if self.inflight >= int(self.limit):
+            self.rejected += 1
+            return False
+        self.inflight += 1
+        return True
+
+    def release(self, rtt: float, dropped: bool = False) -> None:
+        """実行枠の返却(処理時間/失敗有無で上限を更新する)"""
+        self.update(rtt, dropped)
+        self.inflight -= 1
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def update(self, rtt: float, dropped: bool) -> None:
+        if dropped:
+            # タイムアウト/サーバーエラーは過負荷とみなして縮小する
+            self.limit = max(self.min_limit, self.limit * 0.9)
+            return
+
+        if self.long_rtt is None:
+            self.long_rtt = rtt
+        else:
+            self.long_rtt += (rtt - self.long_rtt) / self.long_window
+
+        # 上限の半分も使われていない間は上限を変更しない(負荷が無いまま拡大し続けないため)
+        if self.inflight < self.limit / 2:
+            return
+
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / rtt))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        new_limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, new_limit))
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def info(self) -> Dict[str, Any]:
+        """同時実行数の状況"""
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "rejected": self.rejected,
+            "long_rtt": self.long_rtt,
+        }
+
+
+def adaptive_limits(
+    initial_limits: Dict[str, int] = CONCURRENCY_INITIAL_LIMITS
+) -> Dict[str, AdaptiveLimit]:
+    """ルートグループごとの同時実行数の上限を作成する"""
+    return {group: AdaptiveLimit(initial) for group, initial in initial_limits.items()}
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    ルートグループごとに同時実行数を制限するミドルウェア。
+    上限を超えたリクエストは待たせずに503(Retry-After付き)を返却し、過負荷時に応答時間が
+    際限なく延びることを防ぐ。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limits: Dict[str, AdaptiveLimit],
+        retry_after: int = CONCURRENCY_RETRY_AFTER_SECONDS,
+    ) -> None:
+        self.app = app
+        self.limits = limits
+        self.retry_after = retry_after
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = self.limits.get(route_group(scope["method"], scope["path"]))
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not limit.try_acquire():
+            response = JSONResponse(
+                {"detail": "Server is busy. Retry later."},
+                status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        status = HTTP_500_INTERNAL_SERVER_ERROR
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            limit.release(time.monotonic() - started, dropped=status >= 500)
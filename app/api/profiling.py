@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# profiling.py
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Callable, Coroutine
+
+from fastapi import HTTPException, Request, Response
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED
+
+from app.core.config import PROFILE_DIR, PROFILE_TOP_N
+from app.core.database import get_session
+from app.services.permittion import CkPermission
+
+logger = logging.getLogger(__name__)
+
+# プロファイルを要求するリクエストヘッダ(値は出力方法)
+PROFILE_HEADER = "X-Profile"
+# inline: レスポンスの代わりに集計結果(テキスト)を返却する
+# file: 集計結果(pstats形式)をPROFILE_DIRに出力し、ファイル名をヘッダで返却する
+PROFILE_MODES = ("inline", "file")
+
+# 未認証例外
+not_authenticated_exception: HTTPException = HTTPException(
+    status_code=HTTP_401_UNAUTHORIZED,
+    detail="Not authenticated",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+# 出力方法の指定誤り例外
+invalid_mode_exception: HTTPException = HTTPException(
+    status_code=HTTP_400_BAD_REQUEST,
+    detail=f"{PROFILE_HEADER} must be one of: {', '.join(PROFILE_MODES)}.",
+)
+
+# プロファイル中のリクエストの有無(cProfileはスレッドで同時に1つのみ有効)
+active = False
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+async def authorize(request: Request) -> None:
+    """プロファイルを要求したアカウントが管理ユーザーであることの確認"""
+    scheme, token = get_authorization_scheme_param(
+        request.headers.get("Authorization")
+    )
+    if scheme.lower() != "bearer" or not token:
+        raise not_authenticated_exception
+
+    # DBの向き先はエンドポイントと同じ(テストでの上書きを含む)
+    provider = request.app.dependency_overrides.get(get_session, get_session)
+    async with asynccontextmanager(provider)() as session:
+        await CkPermission(session=session, token=token).activate_and_admin()
+
+
+def report(profile: cProfile.Profile, name: str, status: int, total: float) -> str:
+    """集計結果(累積時間の多い順)のテキスト"""
+    stream = io.StringIO()
+    stream.write(f"{name} status={status} total={total * 1000:.1f}ms\n")
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_N)
+    return stream.getvalue()
+
+
+def dump(profile: cProfile.Profile, name: str) -> str:
+    """集計結果をpstats形式(snakeviz/gprof2dot等で呼び出しツリー/フレームグラフを表示)で出力する"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    filename = "{}-{:%Y%m%dT%H%M%S%f}.prof".format(
+        name.replace(":", "_"), datetime.now()
+    )
+    profile.dump_stats(os.path.join(PROFILE_DIR, filename))
+    return filename
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+async def profile_request(
+    request: Request,
+    handler: Callable[[Request], Coroutine[Any, Any, Response]],
+    name: str,
+) -> Response:
+    """
+    リクエスト1件をプロファイラ(cProfile)で実行する。管理ユーザーのみ。
+    ※計測はスレッド単位のため、同時に処理中の他のリクエストの処理も含む。
+    既に他のリクエスト(バッチの親リクエスト等)をプロファイル中の場合は計測せず処理する。
+    """
+    global active
+
+    mode = request.headers[PROFILE_HEADER].lower()
+    if mode not in PROFILE_MODES:
+        raise invalid_mode_exception
+    await authorize(request)
+    if active:
+        return await handler(request)
+
+    profile = cProfile.Profile()
+    active = True
+    started = time.perf_counter()
+    profile.enable()
+    try:
+        response = await handler(request)
+    finally:
+        profile.disable()
+        active = False
+    total = time.perf_counter() - started
+
+    if mode == "inline":
+        return Response(
+            report(profile, name, response.status_code, total),
+            headers={"Content-Type": "text/plain; charset=utf-8"},
+        )
+    filename = dump(profile, name)
+    logger.info("request profiled: %s %s", name, filename)
+    response.headers["X-Profile-Artifact"] = filename
+    return response
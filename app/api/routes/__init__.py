@@ -3,16 +3,19 @@
 
 from fastapi import APIRouter
 
+from app.api.cancellation import CancellableRoute
 from app.api.routes.accounts import router as account_router
+from app.api.routes.batch import router as batch_router
 from app.api.routes.mine import router as mine_router
 from app.api.routes.tasks import router as task_router
 from app.api.schemas.base import Message
 
-router = APIRouter()
+router = APIRouter(route_class=CancellableRoute)
 
 router.include_router(mine_router, tags=["mine"])
 router.include_router(account_router, prefix="/accounts", tags=["accounts"])
 router.include_router(task_router, prefix="/tasks", tags=["tasks"])
+router.include_router(batch_router, tags=["batch"])
 
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
@@ -1,9 +1,14 @@
 #!/usr/bin/python3
 # accouts.py
 
-from fastapi import APIRouter, Body, Depends
+from typing import Union
+
+from fastapi import APIRouter, Body, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.cancellation import CancellableRoute
+from app.api.conditional import Conditional, entity_tag, if_match
 from app.api.routes.mine import oauth2_scheme
 from app.api.schemas.accounts import (
     AccountCreate,
@@ -16,11 +21,12 @@ from app.api.schemas.accounts import (
     p_account_id,
 )
 from app.api.schemas.base import Message, q_limit, q_offset, q_sort
+from app.core.cache import cache_key, result_cache
 from app.core.database import get_session
 from app.services.accounts import AccountService
 from app.services.permittion import CkPermission
 
-router = APIRouter()
+router = APIRouter(route_class=CancellableRoute)
 
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
@@ -91,16 +97,21 @@ async def create(
             },
         },
         200: {"model": ProfilePublic, "description": "Get profile successful"},
+        304: {"description": "Not modified"},
     },
 )
 async def get_profile(
+    request: Request,
+    response: Response,
     id: str = p_account_id,
     session: AsyncSession = Depends(get_session),
     token: str = Depends(oauth2_scheme),
-) -> ProfilePublic:
+) -> Union[ProfilePublic, Response]:
     """
     アカウント1件の取得。</br>
-    PROVISIONALユーザーは実行不可。
+    PROVISIONALユーザーは実行不可。</br>
+    `ETag`/`Last-Modified`ヘッダを返却する。`If-None-Match`/`If-Modified-Since`指定時、
+    アカウントが未更新であれば304を返却する。
 
     [PATH]
 
@@ -110,7 +121,13 @@ async def get_profile(
     await checker.activate_and_upper_general()
 
     service = AccountService()
+    modified_at = await service.get_version(session=session, id=id)
+    conditional = Conditional(request, f"profiles:{id}", [modified_at])
+    if conditional.not_modified():
+        return conditional.not_modified_response()
+
     account = await service.get_by_id(session=session, id=id)
+    response.headers.update(conditional.headers)
     return account
 
 
@@ -137,10 +154,24 @@ async def get_profile(
                 "application/json": {"example": {"detail": "Resource not found."}}
             },
         },
+        412: {
+            "model": Message,
+            "description": "Precondition failed Error",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "detail": "Account resource has been modified. "
+                        "Get the latest version and retry."
+                    }
+                }
+            },
+        },
         200: {"model": ProfilePublic, "description": "Update profile successful"},
     },
 )
 async def patch_profile(
+    request: Request,
+    response: Response,
     id: str = p_account_id,
     patch_params: ProfileBaseUpdate = Body(...),
     session: AsyncSession = Depends(get_session),
@@ -149,7 +180,9 @@ async def patch_profile(
     """
     管理者によるアカウント1件の更新。</br>
     ADMINユーザーのみ実行可能。</br>
-    **nickname**、**email** は本人管轄項目のため変更できない。
+    **nickname**、**email** は本人管轄項目のため変更できない。</br>
+    `If-Match`(取得時の`ETag`)指定時、アカウントが他のユーザーにより更新済みであれば
+    412を返却する。更新後の`ETag`を返却する。
 
     [PATH]
 
@@ -164,9 +197,13 @@ async def patch_profile(
     await checker.activate_and_admin()
 
     service = AccountService()
-    account = await service.patch_base_profile(
-        session=session, id=id, patch_params=patch_params
+    account, modified_at = await service.patch_base_profile(
+        session=session,
+        id=id,
+        patch_params=patch_params,
+        modified_at=if_match(request, f"profiles:{id}"),
     )
+    response.headers["ETag"] = entity_tag(f"profiles:{id}", [modified_at])
     return account
 
 
@@ -276,7 +313,7 @@ async def search(
     filter: ProfileFilter = Body(...),
     session: AsyncSession = Depends(get_session),
     token: str = Depends(oauth2_scheme),
-) -> ProfilePublicList:
+) -> Response:
     """
     プロフィール検索。</br>
     PROVISIONALユーザーは実行不可。</br>
@@ -303,6 +340,17 @@ async def search(
     checker = CkPermission(session=session, token=token)
     await checker.activate_and_upper_general()
 
+    # 同一条件の検索結果はキャッシュから返却する(アカウント更新時に無効化)
+    key = cache_key(
+        "accounts:search-profile", offset, limit, sort.replace(" ", ""), filter.dict()
+    )
+    version = result_cache.version(("profiles",))
+    cached = result_cache.get(key, version)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
     service = AccountService()
     profiles = await service.search(offset, limit, sort, session=session, filter=filter)
-    return profiles
+    response = ORJSONResponse(content=profiles)
+    result_cache.set(key, version, response.body)
+    return response
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+# batch.py
+
+from fastapi import APIRouter, Body, Depends, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.cancellation import CancellableRoute
+from app.api.batch import BatchDispatcher
+from app.api.routes.mine import oauth2_scheme
+from app.api.schemas.base import Message
+from app.api.schemas.batch import BatchRequest, BatchResponse
+from app.core.database import get_session
+from app.services.authentication import Principal
+from app.services.permittion import CkPermission
+
+router = APIRouter(route_class=CancellableRoute)
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@router.post(
+    "/batch",
+    name="batch:run",
+    responses={
+        200: {"model": BatchResponse, "description": "Run batch successful"},
+        401: {
+            "model": Message,
+            "description": "Auth Error",
+            "content": {
+                "application/json": {"example": {"detail": "Not an active user."}}
+            },
+        },
+    },
+)
+async def run(
+    request: Request,
+    batch: BatchRequest = Body(...),
+    session: AsyncSession = Depends(get_session),
+    token: str = Depends(oauth2_scheme),
+) -> ORJSONResponse:
+    """
+    複数のAPI呼び出しを1リクエストで実行する。</br>
+    アクティベート後のすべてのユーザーが実行可能。</br>
+    サブリクエストは並行に実行し、レスポンスをリクエスト順に返却する。
+    認証はバッチで1回のみ行い、各サブリクエストの権限確認はバッチのアカウントで行う。
+    サブリクエストのエラーはバッチ全体のエラーとせず、各レスポンスのstatusで返却する。
+
+    [BODY]
+
+    - **requests**: サブリクエストのリスト[reqired] ※最大件数はBATCH_MAX_REQUESTS
+        - **id**: レスポンスとの対応付けに使用する任意のID
+        - **method**: HTTPメソッド[reqired]
+        - **path**: APIのパス(/api以降)[reqired] ※バッチの入れ子は不可
+        - **query**: クエリパラメータ
+        - **headers**: 追加のリクエストヘッダ
+        - **body**: リクエストボディ(JSON)
+    """
+    checker = CkPermission(session=session, token=token)
+    await checker.activate_only()
+
+    dispatcher = BatchDispatcher(request, Principal(token, checker.profile))
+    responses = await dispatcher.run(batch.requests)
+    return ORJSONResponse(content={"responses": responses})
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+# debug.py
+
+import asyncio
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.status import HTTP_404_NOT_FOUND, HTTP_409_CONFLICT
+
+from app.api.routes.mine import oauth2_scheme
+from app.core.config import (
+    MEMORY_TRACE_FRAMES,
+    PROFILE_ENABLED,
+    PROFILE_MAX_SECONDS,
+    PROFILE_SAMPLE_HZ,
+)
+from app.core.database import get_session
+from app.core.memory import memory_profiler
+from app.core.sampling import StackSampler
+from app.core.watchdog import loop_watchdog
+from app.services.permittion import CkPermission
+
+router = APIRouter()
+
+# 無効時の例外(エンドポイントの存在を示さない)
+disabled_exception: HTTPException = HTTPException(
+    status_code=HTTP_404_NOT_FOUND, detail="Not Found"
+)
+
+# メモリの割り当ての計測の未開始例外
+not_tracing_exception: HTTPException = HTTPException(
+    status_code=HTTP_409_CONFLICT, detail="Memory tracing is not started."
+)
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+async def admin_only(
+    session: AsyncSession = Depends(get_session),
+    token: str = Depends(oauth2_scheme),
+) -> None:
+    """デバッグ用エンドポイントの利用条件(PROFILE_ENABLED、かつ管理ユーザー)"""
+    if not PROFILE_ENABLED:
+        raise disabled_exception
+    await CkPermission(session=session, token=token).activate_and_admin()
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@router.get(
+    "/profile",
+    name="debug:profile",
+    dependencies=[Depends(admin_only)],
+    include_in_schema=False,
+)
+async def profile(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+) -> Response:
+    """
+    サンプリングプロファイラ。:
+    指定秒数の間、全スレッドのスタック(イベントループは実行中のタスクを含む)を
+    PROFILE_SAMPLE_HZの頻度で採取し、collapsed stack形式で返却する。
+    """
+    sampler = StackSampler(1 / PROFILE_SAMPLE_HZ)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    return Response(
+        sampler.collapsed(),
+        headers={
+            "Content-Type": "text/plain; charset=utf-8",
+            "X-Profile-Samples": str(sampler.samples),
+        },
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@router.get(
+    "/loop-stalls",
+    name="debug:loop-stalls",
+    dependencies=[Depends(admin_only)],
+    include_in_schema=False,
+)
+async def loop_stalls() -> List[Dict[str, Any]]:
+    """
+    イベントループの直近の停止(新しい順)。:
+    遅延がLOOP_LAG_THRESHOLD_MILLISECONDSを超えた時点のループのスレッドのスタックを返却する。
+    """
+    return loop_watchdog.recent()
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@router.post(
+    "/memory/start",
+    name="debug:memory-start",
+    dependencies=[Depends(admin_only)],
+    include_in_schema=False,
+)
+async def memory_start(
+    frames: int = Query(MEMORY_TRACE_FRAMES, ge=1, le=100),
+) -> Dict[str, Any]:
+    """
+    メモリの割り当ての計測(tracemalloc)の開始。:
+    現時点のスナップショットを差分の基準とする(計測中の場合は基準のみ取り直す)。
+    """
+    baseline_at = await asyncio.to_thread(memory_profiler.start, frames)
+    return {"tracing": True, "baseline_at": baseline_at}
+
+
+@router.get(
+    "/memory",
+    name="debug:memory",
+    dependencies=[Depends(admin_only)],
+    include_in_schema=False,
+)
+async def memory(
+    top: int = Query(20, ge=1, le=200),
+    rebase: bool = Query(False),
+) -> Dict[str, Any]:
+    """
+    メモリの割り当ての差分。:
+    基準のスナップショットからの増加量の多いモジュール/割り当て箇所を返却する。
+    pydantic/SQLAlchemy等の内部での割り当ては呼び出し元のアプリのモジュール
+    (app.services.*、app.repositries.*等)に計上する。
+    rebase=trueの場合は今回のスナップショットを次回の基準とする。
+    """
+    # 計測中かはスナップショットの取得と同じロック内で確認する(並行して終了される場合がある)
+    diff = await asyncio.to_thread(memory_profiler.diff, top, rebase)
+    if diff is None:
+        raise not_tracing_exception
+    return diff
+
+
+@router.post(
+    "/memory/stop",
+    name="debug:memory-stop",
+    dependencies=[Depends(admin_only)],
+    include_in_schema=False,
+)
+async def memory_stop() -> Dict[str, Any]:
+    """メモリの割り当ての計測の終了(追跡の負荷と記録を解放する)"""
+    memory_profiler.stop()
+    return {"tracing": False}
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+# metrics.py
+
+from typing import Dict
+
+from fastapi import APIRouter, Response
+
+from app.api.limits import AdaptiveLimit
+from app.core.cache import result_cache
+from app.core.metrics import CONTENT_TYPE, CallbackMetric, registry
+from app.repositries import statement_cache
+
+router = APIRouter()
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def register_collectors(limits: Dict[str, AdaptiveLimit]) -> None:
+    """スクレイプ時に値を取得するメトリクス(キャッシュ/同時実行数の状況)を登録する"""
+
+    def cache_hit_ratio():
+        statement = statement_cache.info()
+        total = statement["hits"] + statement["misses"]
+        yield ("result",), result_cache.info()["hit_rate"]
+        yield ("statement",), statement["hits"] / total if total else 0.0
+
+    registry.register(
+        CallbackMetric(
+            "megami_cache_hit_ratio",
+            "In-process cache hit ratio.",
+            "gauge",
+            ["cache"],
+            cache_hit_ratio,
+        )
+    )
+    registry.register(
+        CallbackMetric(
+            "megami_cache_hits",
+            "In-process cache hits.",
+            "counter",
+            ["cache"],
+            lambda: [
+                (("result",), result_cache.hits),
+                (("statement",), statement_cache.hits),
+            ],
+        )
+    )
+    registry.register(
+        CallbackMetric(
+            "megami_cache_misses",
+            "In-process cache misses.",
+            "counter",
+            ["cache"],
+            lambda: [
+                (("result",), result_cache.misses),
+                (("statement",), statement_cache.misses),
+            ],
+        )
+    )
+
+    # ルートグループごとの同時実行数(loginはbcryptの処理待ちを含むリクエスト数)
+    for key, kind, help in (
+        ("inflight", "gauge", "Requests in flight by concurrency group."),
+        ("limit", "gauge", "Adaptive concurrency limit by group."),
+        ("rejected", "counter", "Requests shed by concurrency group."),
+    ):
+        registry.register(
+            CallbackMetric(
+                f"megami_concurrency_{key}",
+                help,
+                kind,
+                ["group"],
+                lambda key=key: [
+                    ((group,), limit.info()[key]) for group, limit in limits.items()
+                ],
+            )
+        )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@router.get("/metrics", name="metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Prometheus形式のメトリクス(リクエスト/DB/キャッシュ/同時実行数/イベントループ)"""
+    return Response(registry.render(), headers={"Content-Type": CONTENT_TYPE})
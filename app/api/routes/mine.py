@@ -1,22 +1,29 @@
 #!/usr/bin/python3
 # login.py
 
-from typing import List
+from typing import List, Union
 
-from fastapi import APIRouter, Body, Depends
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
 
+from app.api.cancellation import CancellableRoute
+from app.api.conditional import Conditional
+from app.api.events import WatchTaskStream
 from app.api.schemas.accounts import PasswordChange, ProfilePublic, ProfileUpdate
 from app.api.schemas.base import Message
 from app.api.schemas.tasks import TaskWithWatchNote, WatchTask, p_task_id
 from app.api.schemas.token import AccessToken
 from app.core.config import API_PREFIX
 from app.core.database import get_session
+from app.core.notify import change_bus
 from app.services.accounts import AccountService
 from app.services.permittion import CkPermission
 
-router = APIRouter()
+router = APIRouter(route_class=CancellableRoute)
 
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
@@ -78,19 +85,30 @@ async def login(
             },
         },
         200: {"model": ProfilePublic, "description": "Get profile successful"},
+        304: {"description": "Not modified"},
     },
 )
 async def get_profile(
+    request: Request,
+    response: Response,
     session: AsyncSession = Depends(get_session),
     token: str = Depends(oauth2_scheme),
-) -> ProfilePublic:
+) -> Union[ProfilePublic, Response]:
     """
     ログイン中のアカウント情報を入手する。</br>
-    すべてのユーザーが、アクティベート前でも実行可能。
+    すべてのユーザーが、アクティベート前でも実行可能。</br>
+    `ETag`/`Last-Modified`ヘッダを返却する。`If-None-Match`/`If-Modified-Since`指定時、
+    アカウントが未更新であれば304を返却する。
 
     """
     service = AccountService()
+    account_id, modified_at = await service.get_my_version(session=session, token=token)
+    conditional = Conditional(request, f"profiles:{account_id}", [modified_at])
+    if conditional.not_modified():
+        return conditional.not_modified_response()
+
     profile = await service.get_my_profile(session=session, token=token)
+    response.headers.update(conditional.headers)
     return profile
 
 
@@ -217,7 +235,7 @@ async def change_password(
 async def get_watch_tasks(
     session: AsyncSession = Depends(get_session),
     token: str = Depends(oauth2_scheme),
-) -> List[TaskWithWatchNote]:
+) -> ORJSONResponse:
     """
     監視タスクの一覧を取得する。</br>
     アクティベート後のすべてのユーザーが実行可能。
@@ -228,7 +246,84 @@ async def get_watch_tasks(
 
     service = AccountService()
     result = await service.get_watch_tasks(session=session, token=token)
-    return result
+    return ORJSONResponse(content=result)
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@router.get(
+    "/mine/watch-tasks/events",
+    name="mine:watch-task-events",
+    response_class=StreamingResponse,
+    responses={
+        401: {
+            "model": Message,
+            "description": "Auth Error",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Authentication was unsuccessful."}
+                }
+            },
+        },
+        503: {
+            "model": Message,
+            "description": "Change notification is disabled",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Change notification is disabled."}
+                }
+            },
+        },
+        200: {
+            "content": {"text/event-stream": {}},
+            "description": "Stream of watch-task events",
+        },
+    },
+)
+async def watch_task_events(
+    session: AsyncSession = Depends(get_session),
+    token: str = Depends(oauth2_scheme),
+) -> StreamingResponse:
+    """
+    監視タスクの更新通知をServer-Sent Eventsで配信する。</br>
+    アクティベート後のすべてのユーザーが実行可能。</br>
+    監視タスク一覧のポーリングの代わりに使用し、通知を受けたタスクのみ取得し直す。
+
+    [EVENT]
+
+    - **task**: 監視中のタスクの更新 `{"id": タスクID, "op": "INSERT"|"UPDATE"|"DELETE"}`
+    - **watch**: 監視タスクの登録/ノート更新/解除 `{"id": タスクID, "op": ...}`
+    - **resync**: 通知の欠落。ストリームを終了するため、再接続して一覧を取得し直すこと
+    """
+    if not change_bus.enabled:
+        raise HTTPException(
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Change notification is disabled.",
+        )
+    checker = CkPermission(session=session, token=token)
+    await checker.activate_only()
+
+    # 監視タスクIDの取得中の更新を取りこぼさないよう、取得前に購読を開始する
+    stream = WatchTaskStream()
+    stream.subscribe()
+    try:
+        service = AccountService()
+        stream.account_id, stream.task_ids = await service.get_watch_task_ids(
+            session=session, token=token
+        )
+        # 配信中はDB接続を保持しない(通知はワーカーで共有する接続から受信する)
+        await session.close()
+    except BaseException:
+        stream.close()
+        raise
+
+    return StreamingResponse(
+        stream.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(stream.close),
+    )
 
 
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
@@ -1,29 +1,39 @@
 #!/usr/bin/python3
 # tasks.py
 
-from typing import Union
+from typing import Optional, Union
 
 from fastapi import APIRouter, Body, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_201_CREATED
 
+from app.api.cancellation import CancellableRoute
+from app.api.conditional import Conditional, entity_tag, if_match
 from app.api.routes.mine import oauth2_scheme
 from app.api.schemas.base import Message, q_limit, q_offset, q_sort
 from app.api.schemas.tasks import (
+    TaskChanges,
     TaskCreate,
     TaskFilter,
     TaskPublic,
     TaskPublicList,
+    TaskStats,
     TaskUpdate,
     TaskWithAccount,
     p_task_id,
+    q_include_archived,
+    q_live,
+    q_since,
     q_sub_resources,
 )
+from app.core.cache import cache_key, result_cache
+from app.core.config import DB_RENDERED_ROUTES
 from app.core.database import get_session
 from app.services.permittion import CkPermission
 from app.services.tasks import TaskService
 
-router = APIRouter()
+router = APIRouter(route_class=CancellableRoute)
 
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
@@ -83,10 +93,11 @@ async def search(
     limit: int = q_limit,
     sort: str = q_sort(default="+id", example="+deadline,-id"),
     sub_resources: str = q_sub_resources,
+    include_archived: bool = q_include_archived,
     filter: TaskFilter = Body(...),
     session: AsyncSession = Depends(get_session),
     token: str = Depends(oauth2_scheme),
-) -> TaskPublicList:
+) -> Response:
     """
     タスク検索。</br>
     アクティベート後のすべてのユーザーが実行可能。</br>
@@ -100,6 +111,7 @@ async def search(
         - 指定可能キー: `id`, `title`, `description`, `asaignee_id`, `status`, `is_significant`, `deadline`
     - **sub-resources**: レスポンスに含めるサブリソース
         - 指定可能キー: `account`…「登録者」「担当者」サブリソースをレスポンスに含める。
+    - **include-archived**: アーカイブ済み(完了後一定期間経過)のタスクを検索対象に含める[default=false]
 
     [BODY]
 
@@ -115,11 +127,131 @@ async def search(
     checker = CkPermission(session=session, token=token)
     await checker.activate_only()
 
-    service = TaskService()
-    tasks = await service.search(
-        offset, limit, sort, sub_resources, session=session, filter=filter
+    # 同一条件の検索結果はキャッシュから返却する(タスク/アカウント更新時に無効化)
+    key = cache_key(
+        "tasks:search",
+        offset,
+        limit,
+        sort.replace(" ", ""),
+        sorted(set(sub_resources.split(","))) if sub_resources else [],
+        include_archived,
+        filter.dict(),
     )
-    return tasks
+    version = result_cache.version(("tasks", "tasks_archive", "profiles"))
+    cached = result_cache.get(key, version)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    service = TaskService()
+    if "tasks:search" in DB_RENDERED_ROUTES:
+        document = await service.search_document(
+            offset,
+            limit,
+            sort,
+            sub_resources,
+            session=session,
+            filter=filter,
+            include_archived=include_archived,
+        )
+        response = Response(content=document, media_type="application/json")
+    else:
+        tasks = await service.search(
+            offset,
+            limit,
+            sort,
+            sub_resources,
+            session=session,
+            filter=filter,
+            include_archived=include_archived,
+        )
+        response = ORJSONResponse(content=tasks)
+    result_cache.set(key, version, response.body)
+    return response
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@router.get(
+    "/stats",
+    name="tasks:stats",
+    responses={
+        200: {"model": TaskStats, "description": "Get task statistics successful"},
+    },
+)
+async def stats(
+    live: bool = q_live,
+    session: AsyncSession = Depends(get_session),
+    token: str = Depends(oauth2_scheme),
+) -> TaskStats:
+    """
+    タスク集計。</br>
+    アクティベート後のすべてのユーザーが実行可能。</br>
+    タスク登録/更新/削除時にトリガーで更新される集計テーブルから取得する。
+
+    [QUERY]
+
+    - **live**: 集計テーブルを使わずタスクテーブルから再集計する(検証用)[default=false]
+
+    [RESPONSE]
+
+    - **count**: タスク総件数
+    - **overdue**: 期限切れ(`DONE`以外かつ期限日が当日より前)のタスク件数
+    - **by_status**: タスクステータス別件数
+    - **by_asaignee**: 担当者別件数 ※担当者未設定は`asaignee_id`がnull
+    - **by_significant**: 重要フラグ別件数
+    """
+    checker = CkPermission(session=session, token=token)
+    await checker.activate_only()
+
+    service = TaskService()
+    task_stats = await service.stats(live, session=session)
+    return task_stats
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@router.get(
+    "/changes",
+    name="tasks:changes",
+    responses={
+        410: {
+            "model": Message,
+            "description": "Sync cursor expired",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Sync cursor expired. Full resync required."}
+                }
+            },
+        },
+        200: {"model": TaskChanges, "description": "Get task changes successful"},
+    },
+)
+async def changes(
+    since: Optional[str] = q_since,
+    limit: int = q_limit,
+    session: AsyncSession = Depends(get_session),
+    token: str = Depends(oauth2_scheme),
+) -> Response:
+    """
+    タスクの差分取得(クライアント同期用)。</br>
+    アクティベート後のすべてのユーザーが実行可能。</br>
+    カーソル以降に登録/更新されたタスクを(更新日時, ID)順に、削除されたタスクのIDを削除順に返却する。
+    レスポンスの**cursor**を次回の**since**に指定する。**has_more**がtrueの間は続けて取得すること。</br>
+    削除記録の保持期間を過ぎたカーソルを指定した場合は410を返却する(カーソル無しでの再同期が必要)。
+
+    [QUERY]
+
+    - **since**: 前回取得時のカーソル ※未指定の場合は全タスクを対象とする
+    - **limit**: タスク/削除IDそれぞれの最大件数[default=10] ※システム制限として最大1000件まで指定可能
+    """
+    checker = CkPermission(session=session, token=token)
+    await checker.activate_only()
+
+    service = TaskService()
+    task_changes = await service.changes(since, limit, session=session)
+    return ORJSONResponse(content=task_changes)
 
 
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
@@ -140,17 +272,22 @@ async def search(
             "model": Union[TaskPublic, TaskWithAccount],
             "description": "Get task successful",
         },
+        304: {"description": "Not modified"},
     },
 )
 async def get(
+    request: Request,
+    response: Response,
     id: int = p_task_id,
     sub_resources: str = q_sub_resources,
     session: AsyncSession = Depends(get_session),
     token: str = Depends(oauth2_scheme),
-) -> Union[TaskPublic, TaskWithAccount]:
+) -> Union[TaskPublic, TaskWithAccount, Response]:
     """
     タスク1件の取得。</br>
-    アクティベート後のすべてのユーザーが実行可能。
+    アクティベート後のすべてのユーザーが実行可能。</br>
+    `ETag`/`Last-Modified`ヘッダを返却する。`If-None-Match`/`If-Modified-Since`指定時、
+    タスク(sub-resources指定時は登録者/担当者を含む)が未更新であれば304を返却する。
 
     [PATH]
 
@@ -165,7 +302,22 @@ async def get(
     await checker.activate_only()
 
     service = TaskService()
+    # 更新日時のみを先に取得し、未更新であればタスク本体を取得せずに応答する
+    versions = await service.get_versions(sub_resources, session=session, id=id)
+    conditional = Conditional(request, f"tasks:{id}", versions)
+    if conditional.not_modified():
+        return conditional.not_modified_response()
+
+    if "tasks:get" in DB_RENDERED_ROUTES:
+        document = await service.get_document(sub_resources, session=session, id=id)
+        return Response(
+            content=document,
+            media_type="application/json",
+            headers=conditional.headers,
+        )
+
     task = await service.get_by_id(sub_resources, session=session, id=id)
+    response.headers.update(conditional.headers)
     return task
 
 
@@ -183,10 +335,24 @@ async def get(
                 "application/json": {"example": {"detail": "Resource not found."}}
             },
         },
+        412: {
+            "model": Message,
+            "description": "Precondition failed Error",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "detail": "Task resource has been modified. "
+                        "Get the latest version and retry."
+                    }
+                }
+            },
+        },
         200: {"model": TaskPublic, "description": "Update task successful"},
     },
 )
 async def patch(
+    request: Request,
+    response: Response,
     id: int = p_task_id,
     patch_params: TaskUpdate = Body(...),
     session: AsyncSession = Depends(get_session),
@@ -195,7 +361,9 @@ async def patch(
     """
     タスク1件の更新。</br>
     PROVISIONALユーザーは実行不可。</br>
-    **title**、**is_significant** は変更できない。
+    **title**、**is_significant** は変更できない。</br>
+    `If-Match`(取得時の`ETag`)指定時、タスクが他のユーザーにより更新済みであれば
+    412を返却する。更新後の`ETag`を返却する。
 
     [PATH]
 
@@ -212,7 +380,13 @@ async def patch(
     await checker.activate_and_upper_general()
 
     service = TaskService()
-    task = await service.patch(session=session, id=id, patch_params=patch_params)
+    task, modified_at = await service.patch(
+        session=session,
+        id=id,
+        patch_params=patch_params,
+        modified_at=if_match(request, f"tasks:{id}"),
+    )
+    response.headers["ETag"] = entity_tag(f"tasks:{id}", [modified_at])
     return task
 
 
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# batch.py
+
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import Extra, Field, validator
+
+from app.api.schemas.base import CoreModel
+from app.core.config import BATCH_MAX_REQUESTS
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class BatchOperation(CoreModel, extra=Extra.forbid):
+    id: Optional[str] = Field(
+        default=None,
+        title="Operation id",
+        description="レスポンスとの対応付けに使用する任意のID",
+        example="profile",
+    )
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"] = Field(
+        title="Method", description="HTTPメソッド", example="GET"
+    )
+    path: str = Field(
+        title="Path",
+        description="APIのパス(/api以降)",
+        regex=r"^/",
+        example="/mine/profile",
+    )
+    query: Dict[str, Any] = Field(
+        default={}, title="Query", description="クエリパラメータ", example={"limit": 10}
+    )
+    headers: Dict[str, str] = Field(
+        default={},
+        title="Headers",
+        description="追加のリクエストヘッダ(If-None-Match等) ※Authorizationはバッチのものを使用",
+    )
+    body: Optional[Any] = Field(
+        default=None, title="Body", description="リクエストボディ(JSON)"
+    )
+
+    @validator("path")
+    def not_batch(cls, v: str):
+        """バッチの入れ子は不可"""
+        if v.split("?")[0].rstrip("/") == "/batch":
+            raise ValueError("batch request cannot be nested.")
+        return v
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class BatchRequest(CoreModel, extra=Extra.forbid):
+    requests: List[BatchOperation] = Field(
+        title="Requests",
+        description="サブリクエストのリスト",
+        min_items=1,
+        max_items=BATCH_MAX_REQUESTS,
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class BatchResult(CoreModel):
+    id: Optional[str] = Field(title="Operation id", description="サブリクエストのID")
+    status: int = Field(title="Status", description="HTTPステータス", example=200)
+    headers: Dict[str, str] = Field(title="Headers", description="レスポンスヘッダ")
+    body: Optional[Any] = Field(title="Body", description="レスポンスボディ(JSON)")
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class BatchResponse(CoreModel):
+    responses: List[BatchResult] = Field(
+        title="Responses", description="サブリクエストのレスポンス(リクエスト順)"
+    )
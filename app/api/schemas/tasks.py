@@ -24,6 +24,25 @@ q_sub_resources: Query = Query(
     example="account",
     alias="sub-resources",
 )
+q_include_archived: Query = Query(
+    default=False,
+    title="Include archived tasks",
+    description="アーカイブ済みのタスクを検索対象に含める",
+    example=False,
+    alias="include-archived",
+)
+q_since: Query = Query(
+    default=None,
+    title="Sync cursor",
+    description="前回の差分取得で返却されたカーソル(未指定の場合は全件)",
+    example="1760857200000000.12.1760857200000000.2147483647",
+)
+q_live: Query = Query(
+    default=False,
+    title="Recompute live",
+    description="集計テーブルを使わずタスクテーブルから再集計する(検証用)",
+    example=False,
+)
 
 # ボディパラメータ
 b_task_id: Field = Field(title="TaskId", description="タスクID", ge=1, example=10)
@@ -45,6 +64,7 @@ b_deadline: Field = Field(
     example="2025-12-31",
 )
 b_note: Field = Field(title="Note", description="ノート", example="要チェック！")
+b_count: Field = Field(title="Count", description="タスク件数", ge=0, example=1)
 
 # ボディパラメータ(クエリメソッド用)
 s_title_cn: Field = Field(
@@ -223,4 +243,47 @@ class WatchTask(CoreModel):
 
 
 class TaskWithWatchNote(TaskBase):
-    note: str = b_note
+    note: Optional[str] = b_note
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class StatusCount(CoreModel):
+    status: TaskStatus = b_status
+    count: int = b_count
+
+
+class AsaigneeCount(CoreModel):
+    asaignee_id: Optional[str] = b_account_id("担当者ID")
+    count: int = b_count
+
+
+class SignificantCount(CoreModel):
+    is_significant: bool = b_is_significant
+    count: int = b_count
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TaskStats(CoreModel):
+    count: int = Field(title="Count", description="タスク総件数", ge=0, example=20)
+    overdue: int = Field(
+        title="Overdue", description="期限切れ(未完了かつ期限日経過)のタスク件数", ge=0, example=3
+    )
+    by_status: List[StatusCount] = Field(description="タスクステータス別件数")
+    by_asaignee: List[AsaigneeCount] = Field(description="担当者別件数")
+    by_significant: List[SignificantCount] = Field(description="重要フラグ別件数")
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TaskChanges(CoreModel):
+    tasks: List[TaskInDB] = Field(description="カーソル以降に登録/更新されたタスク")
+    deleted: List[int] = Field(description="カーソル以降に削除されたタスクのID")
+    cursor: str = Field(title="Cursor", description="次回の差分取得に指定するカーソル")
+    has_more: bool = Field(
+        title="HasMore", description="未取得の差分が残っている場合にTrue", example=False
+    )
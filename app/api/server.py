@@ -4,13 +4,33 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.api.limits import ConcurrencyLimitMiddleware, adaptive_limits
 from app.api.routes import router as api_router
-from app.core.config import API_PREFIX, PROJECT_NAME, VERSION
+from app.api.routes.debug import router as debug_router
+from app.api.routes.metrics import register_collectors
+from app.api.routes.metrics import router as metrics_router
+from app.core.cache import result_cache
+from app.core.config import (
+    API_PREFIX,
+    CONCURRENCY_LIMIT_ENABLED,
+    PROJECT_NAME,
+    VERSION,
+)
+from app.core.notify import change_bus
+from app.core.watchdog import loop_watchdog
+from app.services.archives import archive_job
 
 
 def get_application():
     app = FastAPI(title=PROJECT_NAME, version=VERSION)
 
+    # 同時実行数の制限(CORSより内側に配置し、503応答にもCORSヘッダを付与する)
+    app.state.concurrency_limits = adaptive_limits()
+    if CONCURRENCY_LIMIT_ENABLED:
+        app.add_middleware(
+            ConcurrencyLimitMiddleware, limits=app.state.concurrency_limits
+        )
+
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -20,6 +40,25 @@ def get_application():
     )
 
     app.include_router(api_router, prefix=API_PREFIX)
+
+    # メトリクス(APIの外に配置し、処理時間等の計測対象にも含めない)
+    register_collectors(app.state.concurrency_limits)
+    app.include_router(metrics_router)
+    # 管理ユーザー向けのプロファイル(PROFILE_ENABLED時のみ応答する)
+    app.include_router(debug_router, prefix="/debug")
+
+    # 他ワーカーでの更新通知によるキャッシュ無効化
+    change_bus.subscribe(result_cache.invalidate)
+    app.add_event_handler("startup", change_bus.start)
+    app.add_event_handler("shutdown", change_bus.stop)
+
+    # イベントループの遅延の監視
+    app.add_event_handler("startup", loop_watchdog.start)
+    app.add_event_handler("shutdown", loop_watchdog.stop)
+
+    # バックグラウンドジョブ
+    app.add_event_handler("startup", archive_job.start)
+    app.add_event_handler("shutdown", archive_job.stop)
     return app
 
 
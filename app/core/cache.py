@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+# cache.py
+
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+
+from app.core.config import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_TTL_SECONDS,
+)
+from app.core.notify import ChangeEvent
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def cache_key(name: str, *parts: Any) -> Tuple[str, str]:
+    """キャッシュキーの生成(パラメータはJSON化して正規化する)"""
+    return name, json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class Entry(NamedTuple):
+    value: bytes
+    version: Tuple[int, ...]
+    expires_at: float
+
+
+class ResultCache:
+    """
+    検索結果(シリアライズ済みレスポンス)のLRUキャッシュ。
+    テーブルごとの更新バージョンを保持し、登録時と参照時のバージョンが異なるエントリは無効とする。
+    """
+
+    enabled: bool
+    maxbytes: int
+    ttl: float
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(
+        self,
+        maxbytes: int = RESULT_CACHE_MAX_BYTES,
+        ttl: float = RESULT_CACHE_TTL_SECONDS,
+        enabled: bool = RESULT_CACHE_ENABLED,
+    ) -> None:
+        self.enabled = enabled
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: OrderedDict[Hashable, Entry] = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = Lock()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def version(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """
+        参照テーブルの現在のバージョン。
+        ※検索実行前に取得し、get/setに渡すこと(検索中の更新を取りこぼさないため)
+        """
+        return tuple(self._versions.get(table, 0) for table in tables)
+
+    def bump(self, *tables: str) -> None:
+        """テーブルの更新バージョンを進める(該当テーブルを参照するエントリが無効になる)"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def invalidate(self, event: Optional[ChangeEvent]) -> None:
+        """テーブル更新通知の購読(他ワーカーでの更新を反映する。Noneの場合は全件破棄)"""
+        if event is not None:
+            self.bump(event.table)
+            return
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def get(self, key: Hashable, version: Tuple[int, ...]) -> Optional[bytes]:
+        """キャッシュ済みの値を返却する。未登録/期限切れ/バージョン不一致の場合はNone"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.version != version or entry.expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def set(self, key: Hashable, version: Tuple[int, ...], value: bytes) -> None:
+        """値を登録する。上限サイズを超えた場合は参照の古いエントリから破棄する"""
+        if not self.enabled or len(value) > self.maxbytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = Entry(value, version, time.monotonic() + self.ttl)
+            self._bytes += len(value)
+            while self._bytes > self.maxbytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def info(self) -> Dict[str, Any]:
+        """キャッシュの利用状況"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "maxbytes": self.maxbytes,
+        }
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.value)
+
+
+result_cache = ResultCache()
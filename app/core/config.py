@@ -2,7 +2,7 @@
 # config.py
 
 from starlette.config import Config
-from starlette.datastructures import Secret
+from starlette.datastructures import CommaSeparatedStrings, Secret
 
 config = Config(".env")
 
@@ -24,8 +24,114 @@ POSTGRES_SERVER = config("POSTGRES_SERVER", cast=str, default="db")
 POSTGRES_PORT = config("POSTGRES_PORT", cast=str, default="5432")
 POSTGRES_DB = config("POSTGRES_DB", cast=str)
 
+ARCHIVE_ENABLED = config("ARCHIVE_ENABLED", cast=bool, default=False)
+ARCHIVE_AFTER_DAYS = config("ARCHIVE_AFTER_DAYS", cast=int, default=90)
+ARCHIVE_BATCH_SIZE = config("ARCHIVE_BATCH_SIZE", cast=int, default=1000)
+ARCHIVE_INTERVAL_SECONDS = config("ARCHIVE_INTERVAL_SECONDS", cast=int, default=60 * 60)
+
+# 差分同期: 実行中のトランザクションの開始日時に加えて差し引く猶予(秒)と削除記録の保持日数
+SYNC_SETTLE_SECONDS = config("SYNC_SETTLE_SECONDS", cast=float, default=5)
+SYNC_TOMBSTONE_RETENTION_DAYS = config(
+    "SYNC_TOMBSTONE_RETENTION_DAYS", cast=int, default=30
+)
+
+RESULT_CACHE_ENABLED = config("RESULT_CACHE_ENABLED", cast=bool, default=True)
+RESULT_CACHE_MAX_BYTES = config(
+    "RESULT_CACHE_MAX_BYTES", cast=int, default=64 * 1024 * 1024
+)
+RESULT_CACHE_TTL_SECONDS = config("RESULT_CACHE_TTL_SECONDS", cast=float, default=30)
+
+NOTIFY_ENABLED = config("NOTIFY_ENABLED", cast=bool, default=True)
+NOTIFY_HEALTH_CHECK_SECONDS = config(
+    "NOTIFY_HEALTH_CHECK_SECONDS", cast=float, default=30
+)
+NOTIFY_RECONNECT_MAX_SECONDS = config(
+    "NOTIFY_RECONNECT_MAX_SECONDS", cast=float, default=30
+)
+
+# レスポンス(JSON)をDBで生成するエンドポイント(ルート名のカンマ区切り: tasks:get,tasks:search)
+DB_RENDERED_ROUTES = config(
+    "DB_RENDERED_ROUTES", cast=CommaSeparatedStrings, default=""
+)
+
+BATCH_MAX_REQUESTS = config("BATCH_MAX_REQUESTS", cast=int, default=20)
+BATCH_CONCURRENCY = config("BATCH_CONCURRENCY", cast=int, default=4)
+
+SSE_KEEPALIVE_SECONDS = config("SSE_KEEPALIVE_SECONDS", cast=float, default=15)
+SSE_RETRY_MILLISECONDS = config("SSE_RETRY_MILLISECONDS", cast=int, default=3000)
+SSE_QUEUE_SIZE = config("SSE_QUEUE_SIZE", cast=int, default=256)
+
+
+def route_settings(values: CommaSeparatedStrings, cast: type) -> dict:
+    """ルート名/グループ名ごとの設定値(名前=値 のカンマ区切り)を辞書に変換する"""
+    return {
+        name.strip(): cast(value)
+        for name, _, value in (v.partition("=") for v in values)
+    }
+
+
+# リクエストのタイムアウト(秒。0は無制限)。ルート名ごとの上書き: tasks:search=5,tasks:get=2
+REQUEST_TIMEOUT_SECONDS = config("REQUEST_TIMEOUT_SECONDS", cast=float, default=30)
+ROUTE_TIMEOUTS = route_settings(
+    config("ROUTE_TIMEOUTS", cast=CommaSeparatedStrings, default=""), float
+)
+# DBの文のタイムアウト(ミリ秒。0は無制限)。ルート名ごとの上書き: tasks:search=3000
+STATEMENT_TIMEOUT_MILLISECONDS = config(
+    "STATEMENT_TIMEOUT_MILLISECONDS", cast=int, default=20000
+)
+ROUTE_STATEMENT_TIMEOUTS = route_settings(
+    config("ROUTE_STATEMENT_TIMEOUTS", cast=CommaSeparatedStrings, default=""), int
+)
+
+# ルートグループ(login/search/write)ごとの同時実行数の制限(上限は観測したレイテンシで調整する)
+CONCURRENCY_LIMIT_ENABLED = config("CONCURRENCY_LIMIT_ENABLED", cast=bool, default=True)
+CONCURRENCY_INITIAL_LIMITS = route_settings(
+    config(
+        "CONCURRENCY_INITIAL_LIMITS",
+        cast=CommaSeparatedStrings,
+        default="login=4,search=20,write=20",
+    ),
+    int,
+)
+CONCURRENCY_MIN_LIMIT = config("CONCURRENCY_MIN_LIMIT", cast=int, default=1)
+CONCURRENCY_MAX_LIMIT = config("CONCURRENCY_MAX_LIMIT", cast=int, default=200)
+CONCURRENCY_RETRY_AFTER_SECONDS = config(
+    "CONCURRENCY_RETRY_AFTER_SECONDS", cast=int, default=1
+)
+
+# リクエストごとのDB処理時間等をServer-Timingヘッダで返却する
+SERVER_TIMING_ENABLED = config("SERVER_TIMING_ENABLED", cast=bool, default=True)
+# SQL文の実行件数/処理時間(ミリ秒)がこの値を超えたリクエストは実行した文を含めてログ出力する
+# SQL文の実行件数のルート名ごとの上書き: tasks:search=5
+REQUEST_QUERY_BUDGET = config("REQUEST_QUERY_BUDGET", cast=int, default=30)
+ROUTE_QUERY_BUDGETS = route_settings(
+    config("ROUTE_QUERY_BUDGETS", cast=CommaSeparatedStrings, default=""), int
+)
+REQUEST_TIME_BUDGET_MILLISECONDS = config(
+    "REQUEST_TIME_BUDGET_MILLISECONDS", cast=int, default=1000
+)
+
+# 管理ユーザー向けのプロファイル(X-Profileヘッダ: inline|file、/debug/*)を有効にする
+# 出力先(file)のディレクトリと、集計結果(inline)の表示件数
+PROFILE_ENABLED = config("PROFILE_ENABLED", cast=bool, default=False)
+PROFILE_DIR = config("PROFILE_DIR", cast=str, default="profiles")
+PROFILE_TOP_N = config("PROFILE_TOP_N", cast=int, default=60)
+# サンプリングプロファイラ(/debug/profile)の採取頻度(回/秒)と採取時間の上限(秒)
+PROFILE_SAMPLE_HZ = config("PROFILE_SAMPLE_HZ", cast=int, default=100)
+PROFILE_MAX_SECONDS = config("PROFILE_MAX_SECONDS", cast=int, default=60)
+# メモリの割り当ての計測(/debug/memory)で記録する呼び出し元のフレーム数
+MEMORY_TRACE_FRAMES = config("MEMORY_TRACE_FRAMES", cast=int, default=25)
+
+# イベントループの遅延の監視(計測間隔(秒)、停止とみなしてスタックをログ出力する遅延(ミリ秒))
+LOOP_LAG_ENABLED = config("LOOP_LAG_ENABLED", cast=bool, default=True)
+LOOP_LAG_INTERVAL_SECONDS = config("LOOP_LAG_INTERVAL_SECONDS", cast=float, default=0.1)
+LOOP_LAG_THRESHOLD_MILLISECONDS = config(
+    "LOOP_LAG_THRESHOLD_MILLISECONDS", cast=int, default=100
+)
+
 SYNC_DIALECT = "postgresql+psycopg2"
 ASYNC_DIALECT = "postgresql+asyncpg"
+NATIVE_DIALECT = "postgresql"
 
 
 def db_url(dialect: str, server: str = POSTGRES_SERVER) -> str:
@@ -34,3 +140,4 @@ def db_url(dialect: str, server: str = POSTGRES_SERVER) -> str:
 
 SYNC_URL = db_url(dialect=SYNC_DIALECT)
 ASYNC_URL = db_url(dialect=ASYNC_DIALECT)
+NATIVE_URL = db_url(dialect=NATIVE_DIALECT)
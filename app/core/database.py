@@ -1,25 +1,125 @@
 #!/usr/bin/python3
 # database.py
 
-from sqlalchemy import create_engine
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
-from app.core.config import ASYNC_URL, SYNC_URL
+from app.core.config import ASYNC_URL, STATEMENT_TIMEOUT_MILLISECONDS, SYNC_URL
+from app.core.metrics import db_checked_out, db_connections_opened
+from app.core.tracing import RequestTrace, request_trace
+
+# 処理中のリクエストに適用するDBの文のタイムアウト(ミリ秒。ルートごとに設定する)
+statement_timeout: ContextVar[int] = ContextVar(
+    "statement_timeout", default=STATEMENT_TIMEOUT_MILLISECONDS
+)
+
+# 処理中のリクエストがチェックアウト中のDB接続(接続先URL, バックエンドのプロセスID)。
+# キャンセル時に使用する(返却済みの接続のプロセスIDは他のセッションで再利用され得るため除く)
+request_backends: ContextVar[Optional[Set[Tuple[str, int]]]] = ContextVar(
+    "request_backends", default=None
+)
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class RowCountingCursor:
+    """
+    DBAPIカーソルから取得した行数を処理中のリクエストの計測に記録する(その他の操作は委譲する)。
+    結果(CursorResult)は実行コンテキストのカーソルから行を取得するため、実行後に差し替える。
+    """
+
+    __slots__ = ("cursor", "trace")
+
+    def __init__(self, cursor: Any, trace: RequestTrace) -> None:
+        self.cursor = cursor
+        self.trace = trace
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.cursor, name)
+
+    def fetchone(self) -> Any:
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.trace.add_rows(1)
+        return row
+
+    def fetchmany(self, *args: Any) -> List[Any]:
+        rows = self.cursor.fetchmany(*args)
+        self.trace.add_rows(len(rows))
+        return rows
+
+    def fetchall(self) -> List[Any]:
+        rows = self.cursor.fetchall()
+        self.trace.add_rows(len(rows))
+        return rows
+
 
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
 
 class AsyncCon:
     url: str
+    timeout: Optional[int]
 
-    def __init__(self, url: str = ASYNC_URL) -> None:
+    def __init__(self, url: str = ASYNC_URL, timeout: Optional[int] = None) -> None:
         self.url = url
+        self.timeout = timeout
 
     def engine(self, echo: bool = True) -> AsyncEngine:
-        return create_async_engine(self.url, echo=echo, poolclass=NullPool)
+        timeout = statement_timeout.get() if self.timeout is None else self.timeout
+        engine = create_async_engine(
+            self.url,
+            echo=echo,
+            poolclass=NullPool,
+            connect_args={"server_settings": {"statement_timeout": str(timeout)}},
+        )
+        event.listen(engine.sync_engine, "checkout", self.track_backend)
+        event.listen(engine.sync_engine, "connect", self.count_connect)
+        event.listen(engine.sync_engine, "checkin", self.count_checkin)
+        event.listen(engine.sync_engine, "before_cursor_execute", self.start_query)
+        event.listen(engine.sync_engine, "after_cursor_execute", self.trace_query)
+        return engine
+
+    def track_backend(self, dbapi_connection, connection_record, connection_proxy):
+        """処理中のリクエストが使用するDB接続を記録する(チェックアウト中の接続数も数える)"""
+        backends = request_backends.get()
+        if backends is not None:
+            backend = (self.url, connection_proxy.driver_connection.get_server_pid())
+            backends.add(backend)
+            # 返却時に記録先から除く(返却は別のタスクから行われる場合がある)
+            connection_record.info["request_backend"] = (backends, backend)
+        db_checked_out.inc()
+
+    def count_connect(self, dbapi_connection, connection_record):
+        db_connections_opened.inc()
+
+    def count_checkin(self, dbapi_connection, connection_record):
+        tracked = connection_record.info.pop("request_backend", None)
+        if tracked is not None:
+            backends, backend = tracked
+            backends.discard(backend)
+        db_checked_out.dec()
+
+    def start_query(self, conn, cursor, statement, parameters, context, executemany):
+        if request_trace.get() is not None:
+            conn.info["query_started"] = perf_counter()
+
+    def trace_query(self, conn, cursor, statement, parameters, context, executemany):
+        """処理中のリクエストで実行したSQL文(処理時間/取得件数)を記録する"""
+        trace = request_trace.get()
+        started = conn.info.pop("query_started", None)
+        if trace is not None and started is not None:
+            trace.record(statement, perf_counter() - started)
+            # 取得件数は結果から行を取得した時点で記録する(asyncpgのSELECTはrowcountが-1)
+            if cursor.description is not None:
+                context.cursor = RowCountingCursor(cursor, trace)
 
     def session(self, echo: bool = True) -> AsyncSession:
         return sessionmaker(
@@ -46,7 +146,35 @@ class SyncCon:
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
 
+async def cancel_backends(backends: Iterable[Tuple[str, int]]) -> None:
+    """
+    DB接続で実行中のクエリをサーバー側でキャンセルする。
+    ※asyncpgのキャンセル要求は接続の破棄(キャンセルされたタスクの後始末)で取り消されるため、
+    別の接続からpg_cancel_backendで中断する
+    """
+    # 接続の返却(記録先からの除外)と並行するため、開始時点の記録を対象とする
+    backends = list(backends)
+    for url in {url for url, _ in backends}:
+        engine = AsyncCon(url).engine(echo=False)
+        try:
+            async with engine.connect() as con:
+                for pid in (pid for u, pid in backends if u == url):
+                    await con.execute(
+                        text("SELECT pg_cancel_backend(:pid)"), {"pid": pid}
+                    )
+        finally:
+            await engine.dispose()
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
 async def get_session():  # pragma: no cover
     con = AsyncCon()
     async with con.session()() as session:
-        yield session
+        try:
+            yield session
+        except Exception:
+            # 例外(タイムアウトによるキャンセルを含む)時は実行中のトランザクションを戻す
+            await session.rollback()
+            raise
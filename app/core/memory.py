@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+# memory.py
+
+import os
+import sys
+import threading
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# 割り当て箇所を集計するアプリのパッケージ
+APP_PACKAGE = "app."
+
+# 集計対象外(計測自体の割り当て)
+EXCLUDES = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def module_names() -> Dict[str, str]:
+    """読み込み済みモジュールのファイルパスからモジュール名への対応"""
+    names = {}
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, "__file__", None)
+        if filename:
+            names[os.path.abspath(filename)] = name
+    return names
+
+
+def attribute(
+    traceback: tracemalloc.Traceback, names: Dict[str, str]
+) -> Tuple[str, tracemalloc.Frame]:
+    """
+    割り当てを計上するモジュールとフレーム。
+    呼び出し元を遡ってアプリのモジュール(app.*)で最も内側のフレームに計上する
+    (pydantic/SQLAlchemy等の内部での割り当ても呼び出したアプリのコードに計上する)。
+    アプリのフレームが無い場合は割り当てたフレームのモジュールに計上する。
+    """
+    frames = list(reversed(traceback))  # 新しい順
+    for frame in frames:
+        name = names.get(os.path.abspath(frame.filename), "")
+        if name.startswith(APP_PACKAGE):
+            return name, frame
+    frame = frames[0]
+    return names.get(os.path.abspath(frame.filename), frame.filename), frame
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class MemoryProfiler:
+    """
+    tracemallocによるメモリ割り当ての計測。
+    開始時点(または前回のrebase時点)のスナップショットとの差分を、割り当てたアプリの
+    モジュール/行ごとに集計する。計測中は全ての割り当てに追跡の負荷がかかる。
+    """
+
+    baseline: Optional[tracemalloc.Snapshot]
+    baseline_at: Optional[datetime]
+
+    def __init__(self) -> None:
+        self.baseline = None
+        self.baseline_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        """計測中(差分の基準あり)"""
+        return tracemalloc.is_tracing() and self.baseline is not None
+
+    def start(self, frames: int) -> str:
+        """計測の開始(計測中の場合は差分の基準のみ取り直す)。基準の時刻を返す"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._rebase()
+            return self.baseline_at.isoformat(timespec="seconds")
+
+    def stop(self) -> None:
+        with self._lock:
+            tracemalloc.stop()
+            self.baseline = None
+            self.baseline_at = None
+
+    def _rebase(self, snapshot: Optional[tracemalloc.Snapshot] = None) -> None:
+        if snapshot is None:
+            snapshot = tracemalloc.take_snapshot().filter_traces(EXCLUDES)
+        self.baseline = snapshot
+        self.baseline_at = datetime.now()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def diff(self, top: int, rebase: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        基準のスナップショットとの差分(増加量の多い順)。
+        - modules: モジュールごとの増加量
+        - sites: 割り当て箇所(モジュール/行)ごとの増加量
+        rebase=Trueの場合は今回のスナップショットを次回の基準とする。
+        計測中でない場合(確認後に終了された場合を含む)はNoneを返す。
+        """
+        with self._lock:
+            if not self.tracing:
+                return None
+            snapshot = tracemalloc.take_snapshot().filter_traces(EXCLUDES)
+            baseline_at = self.baseline_at
+            stats = snapshot.compare_to(self.baseline, "traceback")
+            if rebase:
+                self._rebase(snapshot)
+        current, peak = tracemalloc.get_traced_memory()
+
+        names = module_names()
+        modules: Dict[str, List[int]] = defaultdict(lambda: [0, 0, 0, 0])
+        sites: Dict[Tuple[str, str, int], List[int]] = defaultdict(
+            lambda: [0, 0, 0, 0]
+        )
+        for stat in stats:
+            name, frame = attribute(stat.traceback, names)
+            values = (stat.size_diff, stat.count_diff, stat.size, stat.count)
+            for totals in (modules[name], sites[(name, frame.filename, frame.lineno)]):
+                for i, value in enumerate(values):
+                    totals[i] += value
+
+        def ranked(items: Dict[Any, List[int]]) -> List[Tuple[Any, List[int]]]:
+            return sorted(items.items(), key=lambda v: v[1][0], reverse=True)[:top]
+
+        def amounts(totals: List[int]) -> Dict[str, int]:
+            return dict(zip(("size_diff", "count_diff", "size", "count"), totals))
+
+        return {
+            "baseline_at": baseline_at.isoformat(timespec="seconds"),
+            "traced": {"current": current, "peak": peak},
+            "modules": [
+                {"module": name, **amounts(totals)}
+                for name, totals in ranked(modules)
+            ],
+            "sites": [
+                {"module": name, "file": filename, "line": lineno, **amounts(totals)}
+                for (name, filename, lineno), totals in ranked(sites)
+            ],
+        }
+
+
+memory_profiler = MemoryProfiler()
@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+# metrics.py
+
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Prometheusテキスト形式のContent-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 処理時間のバケット(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# サンプル: (サフィックス, ラベル(名前, 値)の組, 値)
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def escape(value: str) -> str:
+    """ラベル値のエスケープ"""
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class Metric:
+    """
+    メトリクス(ラベル値ごとの子を保持する)。
+    子はlabels()で事前に取得して保持し、リクエストごとには生成しないこと。
+    ※イベントループ上でのみ更新するためロックは不要
+    """
+
+    kind: str = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """ラベル値に対応する子を取得する(未登録の場合は作成する)"""
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.create()
+        return child
+
+    def create(self) -> GaugeChild:
+        """子の作成(untypedは値を設定/増減する子。種類ごとに上書きする)"""
+        return GaugeChild()
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in list(self.children.items()):
+            yield "", tuple(zip(self.labelnames, values)), child.value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def create(self) -> CounterChild:
+        return CounterChild()
+
+    def samples(self) -> Iterable[Sample]:
+        for suffix, labels, value in super().samples():
+            yield "_total", labels, value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def create(self) -> GaugeChild:
+        return GaugeChild()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def create(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def samples(self) -> Iterable[Sample]:
+        for values, child in list(self.children.items()):
+            labels = tuple(zip(self.labelnames, values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                yield "_bucket", labels + (("le", format_value(bound)),), cumulative
+            yield "_sum", labels, child.sum
+            yield "_count", labels, child.count
+
+
+class CallbackMetric(Metric):
+    """スクレイプ時に値を取得するメトリクス(キャッシュ/同時実行数の状況など)"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]],
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self) -> Iterable[Sample]:
+        suffix = "_total" if self.kind == "counter" else ""
+        for values, value in self.collect():
+            yield suffix, tuple(zip(self.labelnames, values)), value
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class Registry:
+    """メトリクスの登録とPrometheusテキスト形式での出力"""
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """メトリクスの登録(同名のメトリクスは置き換える)"""
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                label = ",".join(f'{k}="{escape(v)}"' for k, v in labels)
+                label = f"{{{label}}}" if label else ""
+                lines.append(f"{metric.name}{suffix}{label} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+# リクエスト(ルート名ごと)
+request_latency = registry.register(
+    Histogram(
+        "megami_request_duration_seconds", "Request latency by route name.", ["route"]
+    )
+)
+requests_in_flight = registry.register(
+    Gauge("megami_requests_in_flight", "Requests currently being processed.")
+).labels()
+queries_per_request = registry.register(
+    Histogram(
+        "megami_db_queries_per_request",
+        "Number of SQL statements executed per request by route name.",
+        ["route"],
+        buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34),
+    )
+)
+
+# DB接続(NullPoolのため、チェックアウト中の接続数=開いている接続数)
+db_checked_out = registry.register(
+    Gauge("megami_db_connections_checked_out", "DB connections checked out.")
+).labels()
+db_connections_opened = registry.register(
+    Counter("megami_db_connections_opened", "DB connections opened.")
+).labels()
+
+# パスワードのハッシュ計算(bcrypt。イベントループ上で同期的に実行するため処理時間=ループの停止時間)
+bcrypt_latency = registry.register(
+    Histogram(
+        "megami_bcrypt_duration_seconds",
+        "bcrypt hash/verify latency.",
+        ["operation"],
+        buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0),
+    )
+)
+
+# イベントループの遅延(定期的なsleepの予定からの超過時間)と閾値を超えた停止の回数
+# ※停止の回数は監視スレッドのみが更新する
+loop_lag = registry.register(
+    Histogram(
+        "megami_event_loop_lag_seconds",
+        "Event loop lag (sleep overshoot).",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    )
+).labels()
+loop_stalls = registry.register(
+    Counter("megami_event_loop_stalls", "Event loop stalls over the lag threshold.")
+).labels()
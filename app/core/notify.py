@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+# notify.py
+
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import asyncpg
+
+from app.core.config import (
+    NATIVE_URL,
+    NOTIFY_ENABLED,
+    NOTIFY_HEALTH_CHECK_SECONDS,
+    NOTIFY_RECONNECT_MAX_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# 通知チャネル(notify_change()トリガー関数が送信する)
+CHANNEL = "megami_change"
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class ChangeEvent(NamedTuple):
+    """テーブル更新通知"""
+
+    schema: str
+    table: str
+    op: str
+    keys: Dict[str, Any]
+
+
+# 購読者: 更新通知を受け取る関数(Noneの場合は通知の欠落 → 全件無効化を要求)
+Subscriber = Callable[[Optional[ChangeEvent]], None]
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class ChangeBus:
+    """
+    PostgreSQLのLISTEN/NOTIFYによるテーブル更新通知の受信。
+    ワーカーごとに専用の接続を1本保持し、受信した通知を購読者に配信する。
+    接続断から再接続した場合、断中の通知は失われるため購読者に全件無効化(None)を配信する。
+    """
+
+    dsn: str
+    channel: str
+    enabled: bool
+    health_check: float
+    reconnect_max: float
+    task: Optional[asyncio.Task] = None
+
+    def __init__(
+        self,
+        dsn: str = NATIVE_URL,
+        channel: str = CHANNEL,
+        enabled: bool = NOTIFY_ENABLED,
+        health_check: float = NOTIFY_HEALTH_CHECK_SECONDS,
+        reconnect_max: float = NOTIFY_RECONNECT_MAX_SECONDS,
+    ) -> None:
+        self.dsn = dsn
+        self.channel = channel
+        self.enabled = enabled
+        self.health_check = health_check
+        self.reconnect_max = reconnect_max
+        self.subscribers: List[Subscriber] = []
+        self.connected = asyncio.Event()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        """購読の登録(登録済みの購読者は重複して登録しない)"""
+        if subscriber not in self.subscribers:
+            self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.remove(subscriber)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def publish(self, event: Optional[ChangeEvent]) -> None:
+        """購読者への配信(購読者の例外は他の購読者に影響させない)"""
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber(event)
+            except Exception:
+                logger.exception("change subscriber failed.")
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def start(self) -> None:
+        if not self.enabled or self.task is not None:
+            return
+        self.task = asyncio.create_task(self._run(), name="change-bus")
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def _run(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                await self._listen()
+                delay = 1.0  # 接続できていた場合は待機時間を戻す
+                logger.warning("change bus disconnected.")
+            except Exception:
+                # 接続/受信中のいかなる例外でも受信を終了させず再接続する
+                # (asyncpg.InterfaceError等。CancelledErrorは停止のため捕捉しない)
+                logger.exception("change bus connection failed.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def _listen(self) -> None:
+        """接続が切れるまで通知を受信する"""
+        con: asyncpg.Connection = await asyncpg.connect(self.dsn)
+        lost = asyncio.Event()
+        try:
+            con.add_termination_listener(lambda _: lost.set())
+            await con.add_listener(self.channel, self._on_notify)
+            # 接続前(接続断の間)の通知は受信できていないため全件無効化する
+            self.publish(None)
+            self.connected.set()
+
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=self.health_check)
+                except asyncio.TimeoutError:
+                    # 無通信時の死活監視(応答が無い場合は再接続)
+                    await asyncio.wait_for(con.fetchval("SELECT 1"), self.health_check)
+        finally:
+            self.connected.clear()
+            if not con.is_closed():
+                con.terminate()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def _on_notify(
+        self, con: asyncpg.Connection, pid: int, channel: str, payload: str
+    ) -> None:
+        try:
+            event = ChangeEvent(**json.loads(payload))
+        except (TypeError, ValueError):
+            logger.warning("invalid change payload: %s", payload)
+            self.publish(None)
+            return
+        self.publish(event)
+
+
+change_bus = ChangeBus()
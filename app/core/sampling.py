@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+# sampling.py
+
+import asyncio
+import sys
+import threading
+from collections import Counter
+from types import FrameType
+from typing import List, Optional
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def frame_name(frame: FrameType) -> str:
+    """スタックの1フレームの表示名(モジュール名:関数の修飾名)"""
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+
+def frame_stack(frame: Optional[FrameType]) -> List[str]:
+    """フレームからスタック(呼び出し元から順)を取得する"""
+    stack = []
+    while frame is not None:
+        stack.append(frame_name(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def task_name(loop: asyncio.AbstractEventLoop) -> str:
+    """イベントループで実行中のタスクのコルーチン名(実行中のタスクが無い場合はidle)"""
+    # 別スレッドからの参照のためasyncio.current_task(ループ内専用)を使用しない
+    task = asyncio.tasks._current_tasks.get(loop)
+    if task is None:
+        return "idle"
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", type(coro).__name__)
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class StackSampler:
+    """
+    全スレッドのスタックを一定間隔で採取し、同一スタックの出現回数を集計する(サンプリングプロファイラ)。
+    イベントループのスレッドは実行中のタスクのコルーチン名をスタックの根元に付与する。
+    採取は専用のスレッドで行い、採取対象のスレッドは停止しない(採取時点の近似値)。
+    """
+
+    interval: float
+    loop: Optional[asyncio.AbstractEventLoop]
+    loop_thread: Optional[int]
+    counts: Counter
+    samples: int
+
+    def __init__(
+        self, interval: float, loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> None:
+        self.interval = interval
+        self.loop = loop
+        self.loop_thread = None
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def start(self) -> None:
+        """採取の開始(イベントループのスレッドから呼び出す)"""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def sample(self) -> None:
+        """全スレッド(採取用のスレッドを除く)のスタックを1回採取する"""
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            root = [names.get(ident, str(ident))]
+            if ident == self.loop_thread and self.loop is not None:
+                root.append(f"task:{task_name(self.loop)}")
+            self.counts[";".join(root + frame_stack(frame))] += 1
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        """集計結果(collapsed stack形式: スタック(;区切り) 出現回数)。flamegraph.pl等で描画する"""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.counts.most_common()
+        )
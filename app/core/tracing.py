@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+# tracing.py
+
+import asyncio
+import functools
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import (
+    REQUEST_QUERY_BUDGET,
+    REQUEST_TIME_BUDGET_MILLISECONDS,
+    ROUTE_QUERY_BUDGETS,
+)
+
+logger = logging.getLogger(__name__)
+
+# 文の指紋の生成(バインドパラメータ/リテラルを除き、空白を詰める)
+PARAMS = re.compile(r"\$\d+(?:\s*,\s*\$\d+)*|%\(\w+\)s")
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SPACES = re.compile(r"\s+")
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def fingerprint(statement: str) -> str:
+    """SQL文の指紋(IN句の個数違い等を同一視する)"""
+    statement = PARAMS.sub("?", statement)
+    statement = LITERALS.sub("?", statement)
+    return SPACES.sub(" ", statement).strip()
+
+
+class StatementStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+
+class RequestTrace:
+    """
+    処理中のリクエストでのSQL文の実行件数/DB処理時間/取得件数と認証の処理時間。
+    親(バッチのリクエスト/クエリの予算の外側の計測)がある場合は親にも記録する。
+    ※リクエストのタスク(と引き継いだタスク)からのみ更新する
+    """
+
+    __slots__ = (
+        "parent",
+        "queries",
+        "db_seconds",
+        "rows",
+        "auth_seconds",
+        "endpoint_done",
+        "statements",
+    )
+
+    def __init__(self, parent: Optional["RequestTrace"] = None) -> None:
+        self.parent = parent
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.auth_seconds = 0.0
+        self.endpoint_done: Optional[float] = None
+        self.statements: Dict[str, StatementStats] = {}
+
+    def record(self, statement: str, seconds: float) -> None:
+        """実行したSQL文の記録"""
+        key = fingerprint(statement)
+        trace: Optional[RequestTrace] = self
+        while trace is not None:
+            trace.queries += 1
+            trace.db_seconds += seconds
+            stats = trace.statements.get(key)
+            if stats is None:
+                stats = trace.statements[key] = StatementStats()
+            stats.count += 1
+            stats.seconds += seconds
+            trace = trace.parent
+
+    def add_rows(self, rows: int) -> None:
+        """取得した行数の記録"""
+        trace: Optional[RequestTrace] = self
+        while trace is not None:
+            trace.rows += rows
+            trace = trace.parent
+
+    def add_auth(self, seconds: float) -> None:
+        """認証の処理時間の記録"""
+        trace: Optional[RequestTrace] = self
+        while trace is not None:
+            trace.auth_seconds += seconds
+            trace = trace.parent
+
+    def top_statements(
+        self, n: int = 5, by_count: bool = False
+    ) -> List[Tuple[str, int, float]]:
+        """処理時間(実行件数)の多い順のSQL文の指紋(指紋, 実行件数, 処理時間(秒))"""
+        stats = sorted(
+            self.statements.items(),
+            key=lambda v: v[1].count if by_count else v[1].seconds,
+            reverse=True,
+        )
+        return [(key, v.count, v.seconds) for key, v in stats[:n]]
+
+
+# 処理中のリクエストの計測の記録先
+request_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "request_trace", default=None
+)
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@contextmanager
+def auth_timer() -> Iterator[None]:
+    """認証(トークンの検証/アカウントの取得/パスワードの照合)の処理時間を記録する"""
+    trace = request_trace.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add_auth(time.perf_counter() - started)
+
+
+def server_timing(
+    trace: RequestTrace, total: float, serialize: Optional[float]
+) -> str:
+    """Server-Timingヘッダの値(処理時間はミリ秒)"""
+    metrics = [
+        f'db;desc="{trace.queries} queries, {trace.rows} rows"'
+        f";dur={trace.db_seconds * 1000:.1f}",
+        f"auth;dur={trace.auth_seconds * 1000:.1f}",
+    ]
+    if serialize is not None:
+        metrics.append(f"serialize;dur={serialize * 1000:.1f}")
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
+
+
+def log_over_budget(name: str, trace: RequestTrace, total: float) -> None:
+    """SQL文の実行件数/処理時間が予算を超えたリクエストを実行した文の指紋と共にログ出力する"""
+    if (
+        trace.queries <= ROUTE_QUERY_BUDGETS.get(name, REQUEST_QUERY_BUDGET)
+        and total * 1000 <= REQUEST_TIME_BUDGET_MILLISECONDS
+    ):
+        return
+    logger.warning(
+        "request over budget: %s %d queries, db %.1fms, total %.1fms, statements: %s",
+        name,
+        trace.queries,
+        trace.db_seconds * 1000,
+        total * 1000,
+        format_statements(trace.top_statements()),
+    )
+
+
+def format_statements(statements: List[Tuple[str, int, float]]) -> str:
+    return "; ".join(
+        f"{count}x {seconds * 1000:.1f}ms {statement}"
+        for statement, count, seconds in statements
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class QueryBudgetExceeded(AssertionError):
+    """SQL文の実行件数の予算超過"""
+
+
+class QueryBudget:
+    """
+    ブロック(with文)/関数(デコレータ)内で実行するSQL文の件数の予算。
+    行ごとのリレーションの遅延ロード/ループ内でのget_by_id等(N+1)の混入を検知する。
+    - strict=True: 超過時にQueryBudgetExceededを送出する(テスト用)
+    - strict=False: 超過時にログ出力のみ行う(本番用)
+    ブロック内のリクエスト(テストクライアントからの呼び出し)で実行した文も数える。
+    """
+
+    limit: int
+    strict: bool
+    name: Optional[str]
+    trace: Optional[RequestTrace]
+
+    def __init__(
+        self, limit: int, *, strict: bool = False, name: Optional[str] = None
+    ) -> None:
+        self.limit = limit
+        self.strict = strict
+        self.name = name
+        self.trace = None
+        self._reset: Optional[Token] = None
+
+    @property
+    def used(self) -> int:
+        """ブロック内で実行したSQL文の件数"""
+        return self.trace.queries if self.trace is not None else 0
+
+    def __enter__(self) -> "QueryBudget":
+        self.trace = RequestTrace(parent=request_trace.get())
+        self._reset = request_trace.set(self.trace)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        request_trace.reset(self._reset)
+        if exc_type is None:
+            self.check()
+
+    def check(self) -> None:
+        if self.used <= self.limit:
+            return
+        message = "query budget exceeded: %s %d > %d queries, statements: %s" % (
+            self.name or "block",
+            self.used,
+            self.limit,
+            format_statements(self.trace.top_statements(by_count=True)),
+        )
+        if self.strict:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    def __call__(self, func: Callable) -> Callable:
+        """デコレータ(呼び出しごとに予算を適用する)"""
+        name = self.name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                with QueryBudget(self.limit, strict=self.strict, name=name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> Any:
+            with QueryBudget(self.limit, strict=self.strict, name=name):
+                return func(*args, **kwargs)
+
+        return wrapper
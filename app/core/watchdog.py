@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# watchdog.py
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.config import (
+    LOOP_LAG_ENABLED,
+    LOOP_LAG_INTERVAL_SECONDS,
+    LOOP_LAG_THRESHOLD_MILLISECONDS,
+)
+from app.core.metrics import loop_lag, loop_stalls
+
+logger = logging.getLogger(__name__)
+
+# 保持する直近の停止の件数
+STALL_HISTORY = 20
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class LoopWatchdog:
+    """
+    イベントループの遅延の監視。
+    ループ上のタスクが一定間隔でsleepし、予定からの超過時間(遅延)をメトリクスに記録する。
+    監視スレッドはループ上のタスクの最終の記録時刻を確認し、閾値を超えて記録がない場合は
+    ループのスレッドのスタック(ループを止めている同期処理の呼び出し箇所)をログ出力する。
+    """
+
+    interval: float
+    threshold: float
+    enabled: bool
+    heartbeat: float
+    stalls: Deque[Dict[str, Any]]
+    task: Optional[asyncio.Task] = None
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL_SECONDS,
+        threshold: float = LOOP_LAG_THRESHOLD_MILLISECONDS / 1000,
+        enabled: bool = LOOP_LAG_ENABLED,
+    ) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.enabled = enabled
+        self.heartbeat = time.monotonic()
+        self.stalls = deque(maxlen=STALL_HISTORY)
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def start(self) -> None:
+        if not self.enabled or self.task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._stop.clear()
+        self.task = asyncio.create_task(self._tick(), name="loop-watchdog")
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self._stop.set()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        self._thread.join()
+        self._thread = None
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def _tick(self) -> None:
+        """ループ上での遅延の計測"""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.heartbeat = time.monotonic()
+            loop_lag.observe(max(0.0, self.heartbeat - started - self.interval))
+
+    def _watch(self) -> None:
+        """監視スレッド(停止1回につき1度だけ報告する)"""
+        reported = None
+        while not self._stop.wait(min(self.interval, self.threshold) / 2):
+            heartbeat = self.heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked > self.threshold and reported != heartbeat:
+                reported = heartbeat
+                self.report(blocked)
+
+    def report(self, blocked: float) -> None:
+        """停止中のループのスレッドのスタックの記録"""
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        loop_stalls.inc()
+        self.stalls.append(
+            {
+                "detected_at": datetime.now().isoformat(timespec="milliseconds"),
+                "blocked_ms": round(blocked * 1000, 1),
+                "stack": [line.rstrip() for line in stack],
+            }
+        )
+        logger.warning(
+            "event loop blocked for %.0fms, stack (most recent call last):\n%s",
+            blocked * 1000,
+            "".join(stack).rstrip(),
+        )
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """直近の停止(新しい順)"""
+        return list(reversed(self.stalls))
+
+
+loop_watchdog = LoopWatchdog()
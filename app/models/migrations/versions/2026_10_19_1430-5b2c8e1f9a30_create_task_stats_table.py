@@ -0,0 +1,232 @@
+"""create task stats table
+
+Revision ID: 5b2c8e1f9a30
+Revises: e85dfc42f48d
+Create Date: 2026-10-19 14:30:12.418520
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from app.models.segment_values import TaskStatus
+
+# revision identifiers, used by Alembic.
+revision = "5b2c8e1f9a30"
+down_revision = "e85dfc42f48d"
+branch_labels = None
+depends_on = None
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_task_stats_table() -> None:
+    op.create_table(
+        "task_stats",
+        sa.Column("id", sa.Integer, primary_key=True, comment="集計ID"),
+        sa.Column(
+            "status",
+            postgresql.ENUM(
+                *TaskStatus.list(), name="status", schema="todo", create_type=False
+            ),
+            nullable=False,
+            comment="タスクステータス",
+        ),
+        sa.Column("asaignee_id", sa.String(5), nullable=True, comment="担当者ID"),
+        sa.Column("is_significant", sa.Boolean, nullable=False, comment="重要タスク"),
+        sa.Column(
+            "task_count",
+            sa.Integer,
+            nullable=False,
+            server_default="0",
+            comment="タスク件数",
+        ),
+        schema="todo",
+    )
+    # NULLを同一値とみなす一意キー(ON CONFLICTの対象)
+    op.execute(
+        """
+        CREATE UNIQUE INDEX ix_task_stats_group
+            ON todo.task_stats (status, asaignee_id, is_significant)
+            NULLS NOT DISTINCT;
+        """
+    )
+
+    # 未完了タスクの締切日ごとの件数(期限切れ件数は参照時に当日より前の件数を合算する)
+    op.create_table(
+        "task_deadline_stats",
+        sa.Column("deadline", sa.Date, primary_key=True, comment="締切日"),
+        sa.Column(
+            "task_count",
+            sa.Integer,
+            nullable=False,
+            server_default="0",
+            comment="タスク件数",
+        ),
+        schema="todo",
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_task_stats_trigger() -> None:
+    # 件数の増減(0件になった集計行は削除する)
+    op.execute(
+        """
+        CREATE FUNCTION todo.add_task_stats(
+            _status todo.status,
+            _asaignee_id varchar,
+            _is_significant boolean,
+            _delta integer
+        ) RETURNS void AS $$
+        BEGIN
+            IF _delta < 0 THEN
+                DELETE FROM todo.task_stats
+                WHERE status = _status
+                    AND asaignee_id IS NOT DISTINCT FROM _asaignee_id
+                    AND is_significant = _is_significant
+                    AND task_count <= -_delta;
+                IF NOT FOUND THEN
+                    UPDATE todo.task_stats SET task_count = task_count + _delta
+                    WHERE status = _status
+                        AND asaignee_id IS NOT DISTINCT FROM _asaignee_id
+                        AND is_significant = _is_significant;
+                END IF;
+            ELSE
+                INSERT INTO todo.task_stats
+                    (status, asaignee_id, is_significant, task_count)
+                VALUES (_status, _asaignee_id, _is_significant, _delta)
+                ON CONFLICT (status, asaignee_id, is_significant)
+                DO UPDATE SET task_count = todo.task_stats.task_count + _delta;
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION todo.add_task_deadline_stats(_deadline date, _delta integer)
+        RETURNS void AS $$
+        BEGIN
+            IF _delta < 0 THEN
+                DELETE FROM todo.task_deadline_stats
+                WHERE deadline = _deadline AND task_count <= -_delta;
+                IF NOT FOUND THEN
+                    UPDATE todo.task_deadline_stats
+                    SET task_count = task_count + _delta
+                    WHERE deadline = _deadline;
+                END IF;
+            ELSE
+                INSERT INTO todo.task_deadline_stats (deadline, task_count)
+                VALUES (_deadline, _delta)
+                ON CONFLICT (deadline)
+                DO UPDATE SET task_count = todo.task_deadline_stats.task_count + _delta;
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    # 集計キーが変わらない更新では集計行に触れない(更新の多い行での競合を避ける)
+    op.execute(
+        """
+        CREATE FUNCTION todo.count_task_stats() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP <> 'UPDATE'
+                OR (OLD.status, OLD.asaignee_id, OLD.is_significant)
+                    IS DISTINCT FROM
+                    (NEW.status, NEW.asaignee_id, NEW.is_significant) THEN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM todo.add_task_stats(
+                        OLD.status, OLD.asaignee_id, OLD.is_significant, -1
+                    );
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM todo.add_task_stats(
+                        NEW.status, NEW.asaignee_id, NEW.is_significant, 1
+                    );
+                END IF;
+            END IF;
+
+            IF TG_OP <> 'UPDATE'
+                OR (OLD.status = 'DONE', OLD.deadline)
+                    IS DISTINCT FROM
+                    (NEW.status = 'DONE', NEW.deadline) THEN
+                IF TG_OP IN ('UPDATE', 'DELETE')
+                    AND OLD.status <> 'DONE' AND OLD.deadline IS NOT NULL THEN
+                    PERFORM todo.add_task_deadline_stats(OLD.deadline, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE')
+                    AND NEW.status <> 'DONE' AND NEW.deadline IS NOT NULL THEN
+                    PERFORM todo.add_task_deadline_stats(NEW.deadline, 1);
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER tasks_count_stats
+            AFTER INSERT OR UPDATE OR DELETE
+            ON todo.tasks
+            FOR EACH ROW
+        EXECUTE PROCEDURE todo.count_task_stats();
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION todo.truncate_task_stats() RETURNS TRIGGER AS $$
+        BEGIN
+            TRUNCATE todo.task_stats, todo.task_deadline_stats;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER tasks_truncate_stats
+            AFTER TRUNCATE
+            ON todo.tasks
+            FOR EACH STATEMENT
+        EXECUTE PROCEDURE todo.truncate_task_stats();
+        """
+    )
+
+    # 既存タスクの集計値を初期投入
+    op.execute(
+        """
+        INSERT INTO todo.task_stats
+            (status, asaignee_id, is_significant, task_count)
+        SELECT status, asaignee_id, is_significant, count(*)
+        FROM todo.tasks
+        GROUP BY status, asaignee_id, is_significant;
+
+        INSERT INTO todo.task_deadline_stats (deadline, task_count)
+        SELECT deadline, count(*)
+        FROM todo.tasks
+        WHERE status <> 'DONE' AND deadline IS NOT NULL
+        GROUP BY deadline;
+        """
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def upgrade() -> None:
+    create_task_stats_table()
+    create_task_stats_trigger()
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS tasks_truncate_stats ON todo.tasks;")
+    op.execute("DROP TRIGGER IF EXISTS tasks_count_stats ON todo.tasks;")
+    op.execute("DROP FUNCTION IF EXISTS todo.truncate_task_stats;")
+    op.execute("DROP FUNCTION IF EXISTS todo.count_task_stats;")
+    op.execute("DROP FUNCTION IF EXISTS todo.add_task_deadline_stats;")
+    op.execute("DROP FUNCTION IF EXISTS todo.add_task_stats;")
+    op.execute("DROP TABLE IF EXISTS todo.task_deadline_stats CASCADE;")
+    op.execute("DROP TABLE IF EXISTS todo.task_stats CASCADE;")
@@ -0,0 +1,142 @@
+"""create archive tables
+
+Revision ID: 9d4e7a2c61b8
+Revises: 5b2c8e1f9a30
+Create Date: 2026-10-19 15:10:47.902114
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from app.models.migrations.util import timestamps
+from app.models.segment_values import TaskStatus
+
+# revision identifiers, used by Alembic.
+revision = "9d4e7a2c61b8"
+down_revision = "5b2c8e1f9a30"
+branch_labels = None
+depends_on = None
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def archived_at() -> sa.Column:
+    return sa.Column(
+        "archived_at",
+        sa.TIMESTAMP(timezone=True),
+        server_default=sa.func.now(),
+        nullable=False,
+        comment="アーカイブ日時",
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_tasks_archive_table() -> None:
+    op.create_table(
+        "tasks_archive",
+        sa.Column("id", sa.Integer, primary_key=True, comment="タスクID"),
+        sa.Column("registrant_id", sa.String(5), nullable=True, comment="登録者ID"),
+        sa.Column("title", sa.String(30), nullable=False, comment="タイトル"),
+        sa.Column("description", sa.Text, nullable=True, comment="内容"),
+        sa.Column("asaignee_id", sa.String(5), nullable=True, comment="担当者ID"),
+        sa.Column(
+            "status",
+            postgresql.ENUM(
+                *TaskStatus.list(), name="status", schema="todo", create_type=False
+            ),
+            nullable=False,
+            comment="タスクステータス",
+        ),
+        sa.Column("is_significant", sa.Boolean, nullable=False, comment="重要タスク"),
+        sa.Column("deadline", sa.Date, nullable=True, comment="締切日"),
+        *timestamps(),
+        archived_at(),
+        schema="todo",
+    )
+    op.create_foreign_key(
+        "fk_registrant_id",
+        "tasks_archive",
+        "profiles",
+        ["registrant_id"],
+        ["account_id"],
+        ondelete="SET NULL",
+        source_schema="todo",
+        referent_schema="account",
+    )
+    op.create_foreign_key(
+        "fk_asaignee_id",
+        "tasks_archive",
+        "profiles",
+        ["asaignee_id"],
+        ["account_id"],
+        ondelete="SET NULL",
+        source_schema="todo",
+        referent_schema="account",
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_watcher_archive_table() -> None:
+    op.create_table(
+        "watcher_archive",
+        sa.Column("watcher_id", sa.String(5), primary_key=True, comment="観測者ID"),
+        sa.Column("task_id", sa.Integer, primary_key=True, index=True, comment="タスクID"),
+        sa.Column("note", sa.Text, nullable=True, comment="ノート"),
+        *timestamps(),
+        archived_at(),
+        schema="todo",
+    )
+    op.create_foreign_key(
+        "fk_account_id",
+        "watcher_archive",
+        "profiles",
+        ["watcher_id"],
+        ["account_id"],
+        ondelete="CASCADE",
+        source_schema="todo",
+        referent_schema="account",
+    )
+    op.create_foreign_key(
+        "fk_task_id",
+        "watcher_archive",
+        "tasks_archive",
+        ["task_id"],
+        ["id"],
+        ondelete="CASCADE",
+        source_schema="todo",
+        referent_schema="todo",
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_archive_target_index() -> None:
+    # アーカイブ対象(完了済みタスク)の抽出用部分インデックス
+    op.execute(
+        """
+        CREATE INDEX ix_tasks_done_modified_at
+            ON todo.tasks (modified_at)
+            WHERE status = 'DONE';
+        """
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def upgrade() -> None:
+    create_tasks_archive_table()
+    create_watcher_archive_table()
+    create_archive_target_index()
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS todo.ix_tasks_done_modified_at;")
+    op.execute("DROP TABLE IF EXISTS todo.watcher_archive CASCADE;")
+    op.execute("DROP TABLE IF EXISTS todo.tasks_archive CASCADE;")
@@ -0,0 +1,103 @@
+"""create change notify triggers
+
+Revision ID: c3f1a9e5d274
+Revises: 9d4e7a2c61b8
+Create Date: 2026-10-19 16:00:21.530871
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c3f1a9e5d274"
+down_revision = "9d4e7a2c61b8"
+branch_labels = None
+depends_on = None
+
+# 通知チャネル(app.core.notify.CHANNELと一致させること)
+CHANNEL = "megami_change"
+
+# 通知対象テーブル: (スキーマ, テーブル, キーカラム)
+TARGETS = [
+    ("todo", "tasks", ["id"]),
+    ("todo", "watcher", ["watcher_id", "task_id"]),
+    ("account", "profiles", ["account_id"]),
+    ("account", "authes", ["account_id"]),
+]
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_notify_function() -> None:
+    # 引数(TG_ARGV)で指定されたキーカラムの値を通知する
+    op.execute(
+        f"""
+        CREATE FUNCTION notify_change() RETURNS TRIGGER AS $$
+        DECLARE
+            rec jsonb;
+            keys jsonb := '{{}}';
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                rec := to_jsonb(OLD);
+            ELSIF TG_OP <> 'TRUNCATE' THEN
+                rec := to_jsonb(NEW);
+            END IF;
+            IF rec IS NOT NULL THEN
+                FOR i IN 0 .. TG_NARGS - 1 LOOP
+                    keys := keys || jsonb_build_object(TG_ARGV[i], rec -> TG_ARGV[i]);
+                END LOOP;
+            END IF;
+            PERFORM pg_notify(
+                '{CHANNEL}',
+                json_build_object(
+                    'schema', TG_TABLE_SCHEMA,
+                    'table', TG_TABLE_NAME,
+                    'op', TG_OP,
+                    'keys', keys
+                )::text
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_notify_triggers() -> None:
+    for schema, table, keys in TARGETS:
+        args = ", ".join(f"'{key}'" for key in keys)
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_notify_change
+                AFTER INSERT OR UPDATE OR DELETE
+                ON {schema}.{table}
+                FOR EACH ROW
+            EXECUTE PROCEDURE notify_change({args});
+            """
+        )
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_notify_truncate
+                AFTER TRUNCATE
+                ON {schema}.{table}
+                FOR EACH STATEMENT
+            EXECUTE PROCEDURE notify_change();
+            """
+        )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def upgrade() -> None:
+    create_notify_function()
+    create_notify_triggers()
+
+
+def downgrade() -> None:
+    for schema, table, _ in TARGETS:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_truncate ON {schema}.{table};")
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {schema}.{table};")
+    op.execute("DROP FUNCTION IF EXISTS notify_change;")
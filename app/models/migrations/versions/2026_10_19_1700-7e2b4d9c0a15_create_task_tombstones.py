@@ -0,0 +1,93 @@
+"""create task tombstones
+
+Revision ID: 7e2b4d9c0a15
+Revises: c3f1a9e5d274
+Create Date: 2026-10-19 17:00:12.418305
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7e2b4d9c0a15"
+down_revision = "c3f1a9e5d274"
+branch_labels = None
+depends_on = None
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_sync_index() -> None:
+    # 差分同期(更新日時/IDのキーセット)用
+    op.create_index(
+        "ix_tasks_modified_at_id", "tasks", ["modified_at", "id"], schema="todo"
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_task_tombstones_table() -> None:
+    op.create_table(
+        "task_tombstones",
+        sa.Column("id", sa.Integer, primary_key=True, comment="タスクID"),
+        sa.Column(
+            "deleted_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+            comment="削除日時",
+        ),
+        schema="todo",
+    )
+    op.create_index(
+        "ix_task_tombstones_deleted_at_id",
+        "task_tombstones",
+        ["deleted_at", "id"],
+        schema="todo",
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def create_tombstone_trigger() -> None:
+    # タスク削除(アーカイブを含む)時に削除記録を登録する(削除された行をまとめて登録)
+    op.execute(
+        """
+        CREATE FUNCTION record_task_tombstones() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO todo.task_tombstones (id)
+            SELECT id FROM deleted_tasks
+            ON CONFLICT (id) DO UPDATE SET deleted_at = now();
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER tasks_tombstone
+            AFTER DELETE
+            ON todo.tasks
+            REFERENCING OLD TABLE AS deleted_tasks
+            FOR EACH STATEMENT
+        EXECUTE PROCEDURE record_task_tombstones();
+        """
+    )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def upgrade() -> None:
+    create_sync_index()
+    create_task_tombstones_table()
+    create_tombstone_trigger()
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS tasks_tombstone ON todo.tasks;")
+    op.execute("DROP FUNCTION IF EXISTS record_task_tombstones;")
+    op.drop_table("task_tombstones", schema="todo")
+    op.drop_index("ix_tasks_modified_at_id", table_name="tasks", schema="todo")
@@ -17,6 +17,21 @@ td_Task = BaseTD.classes.tasks
 # Profileモデル
 td_Watcher = BaseTD.classes.watcher
 
+# TaskStatsモデル
+td_TaskStats = BaseTD.classes.task_stats
+
+# TaskDeadlineStatsモデル
+td_TaskDeadlineStats = BaseTD.classes.task_deadline_stats
+
+# Task(アーカイブ)モデル
+td_TaskArchive = BaseTD.classes.tasks_archive
+
+# Watcher(アーカイブ)モデル
+td_WatcherArchive = BaseTD.classes.watcher_archive
+
+# Task(削除記録)モデル
+td_TaskTombstone = BaseTD.classes.task_tombstones
+
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
 # accountスキーマ
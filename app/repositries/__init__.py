@@ -1,10 +1,106 @@
 #!/usr/bin/python3
 # __init__.py
 
-from typing import List
+import json
+from collections import OrderedDict
+from functools import lru_cache
+from enum import Enum
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+
+from pydantic import BaseModel
+from sqlalchemy import Text, asc, cast, desc, func, literal_column
+from sqlalchemy.sql import ColumnCollection, Select
+from sqlalchemy.sql.elements import ColumnElement, Label
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@lru_cache(maxsize=1024)
+def parse_sort(
+    sort: str, default_key: str, columns: Tuple[str, ...]
+) -> Tuple[Tuple[str, str], ...]:
+    """ソート文字列を(符号, カラム名)のタプルに分割する(同一文字列の解析結果はキャッシュ)"""
+    ls = sort.split(",")
+    if default_key not in ls:
+        ls.append(default_key)  # デフォルトのソート条件を追加
+
+    ls = [(v.strip()[0], v.strip()[1:]) for v in ls]  # 符号/値、のタプルに分割
+
+    err_ls = [v[1] for v in ls if v[1] not in columns]  # 許容されないカラムを抽出
+    if err_ls:
+        raise ValueError("[{}] is unacceptable for order_by param.".format(ls[0][1]))
+    return tuple(ls)
+
+
+def labeled(columns: ColumnCollection, prefix: str) -> List[Label]:
+    """カラムに接頭辞付きのラベルを付与する(結合したテーブルのカラム名の重複回避)"""
+    return [c.label(f"{prefix}{c.key}") for c in columns]
+
+
+def json_text(value: ColumnElement) -> ColumnElement:
+    """値をJSONテキストに変換する式(NULLはnull)"""
+    return func.coalesce(cast(func.to_json(value), Text), sql_string("null"))
+
+
+def json_object(members: Iterable[Tuple[str, ColumnElement]]) -> ColumnElement:
+    """
+    JSONオブジェクトのテキストを組み立てる式。members: (キー, JSONテキストの式)
+    ※json_build_objectは区切りに空白を含むため、アプリのシリアライズ結果(空白無し)と一致するよう連結で構築する
+    """
+    parts: List[ColumnElement] = []
+    for i, (key, value) in enumerate(members):
+        parts.append(sql_string(("," if i else "{") + json.dumps(key) + ":"))
+        parts.append(value)
+    return func.concat(*parts, sql_string("}"))
+
+
+def sql_string(value: str) -> ColumnElement:
+    """文字列定数(バインドパラメータにせずSQL文に埋め込む)"""
+    return literal_column("'{}'".format(value.replace("'", "''")), Text)
+
+
+def row_fields(
+    model: Type[BaseModel], *tables: Any, nested: Iterable[str] = ()
+) -> Tuple[str, ...]:
+    """
+    モデルを経由せずに行からレスポンスを構築する際の項目(モデルの項目順)。
+    行ごとの検証を行わない代わりに、項目に対応するカラムの型/NULL許容/列挙値がモデルの
+    項目と整合することを一度だけ検証する(不整合の場合はTypeError)。
+    文字列の長さ/形式の制約は登録/更新時の検証で保証されるため対象外とする。
+    tables: カラムを検索するテーブル(先に指定したテーブルを優先), nested: 検証対象外の項目
+    """
+    for name, field in model.__fields__.items():
+        if name in nested:
+            continue
+        columns = [t.__table__.c[name] for t in tables if name in t.__table__.c]
+        if not columns:
+            raise TypeError(f"{model.__name__}.{name}: column not found.")
+        column = columns[0]
+        if column.nullable and not field.allow_none:
+            raise TypeError(f"{model.__name__}.{name}: column is nullable.")
+        if not issubclass(field.type_, column.type.python_type):
+            raise TypeError(
+                f"{model.__name__}.{name}: {field.type_.__name__} is not compatible"
+                f" with {column.type.python_type.__name__}."
+            )
+        enums = getattr(column.type, "enums", None)
+        if enums is not None and not (
+            issubclass(field.type_, Enum)
+            and set(enums) <= {v.value for v in field.type_}
+        ):
+            raise TypeError(f"{model.__name__}.{name}: enum values mismatch.")
+    return tuple(model.__fields__)
 
-from sqlalchemy import asc, desc
-from sqlalchemy.sql.functions import FunctionElement
 
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
@@ -12,39 +108,114 @@ from sqlalchemy.sql.functions import FunctionElement
 class QueryParam:
     offset: int = 0
     limit: int = 10
-    sort: List[FunctionElement]
-    filter: List[FunctionElement]
+    sort: Tuple[Tuple[str, str], ...]
+    filter: Dict[str, Callable[[Any], ColumnElement]]
+    params: Dict[str, Any]
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
     def __init__(
         self,
         *,
-        columns: List[str],
+        columns: Iterable[str],
         offset: int,
         limit: int,
         sort: str,
         default_key: str = "+id"
     ) -> None:
-        ls = sort.split(",")
-        if default_key not in ls:
-            ls.append(default_key)  # デフォルトのソート条件を追加
+        self.sort = parse_sort(sort, default_key, tuple(columns))
+        self.limit = limit
+        self.offset = offset
+        self.filter = {}
+        self.params = {"offset": offset, "limit": limit}
 
-        ls = [(v.strip()[0], v.strip()[1:]) for v in ls]  # 符号/値、のタプルに分割
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
-        err_ls = [v[1] for v in ls if v[1] not in columns]  # 許容されないカラムを抽出
-        if err_ls:
-            raise ValueError(
-                "[{}] is unacceptable for order_by param.".format(ls[0][1])
-            )
+    def append_filter(
+        self, key: str, elem: Callable[[Any], ColumnElement], **params: Any
+    ) -> None:
+        """
+        検索条件を追加する。
+        key: 条件の形状を表すキー, elem: カラム集合(Table.c)を受け取り条件式を返す関数, params: バインド値
+        """
+        self.filter[key] = elem
+        self.params.update(params)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    @property
+    def shape(self) -> Tuple[Tuple[str, ...], Tuple[Tuple[str, str], ...]]:
+        """クエリの形状(指定された検索条件の種類とソート条件)"""
+        return tuple(self.filter), self.sort
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def where(self, model: Any) -> List[ColumnElement]:
+        """検索条件式を生成する"""
+        return [elem(model) for elem in self.filter.values()]
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def order_by(
+        self, columns: Optional[ColumnCollection] = None
+    ) -> List[ColumnElement]:
+        """ソート条件式を生成する(columns指定時はカラム名をテーブルで修飾する)"""
+        return [
+            (desc if v[0] == "-" else asc)(v[1] if columns is None else columns[v[1]])
+            for v in self.sort
+        ]
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
-        ls = [(desc(v[1]) if v[0] == "-" else asc(v[1])) for v in ls]  # 符号をasc/descに変換
-        self.sort = ls
-        self.limit = limit
-        self.offset = offset
-        self.filter = []
+
+class StatementCache:
+    """クエリ形状ごとにSelect文を保持するLRUキャッシュ(値はバインドパラメータで渡す)"""
+
+    maxsize: int
+    hits: int
+    misses: int
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._statements: OrderedDict[Hashable, Select] = OrderedDict()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def get(self, key: Hashable, build: Callable[[], Select]) -> Select:
+        """キャッシュ済みのSelect文を返却する。未登録の場合はbuildで生成して登録する"""
+        statement = self._statements.get(key)
+        if statement is not None:
+            self._statements.move_to_end(key)
+            self.hits += 1
+            return statement
+
+        self.misses += 1
+        statement = build()
+        self._statements[key] = statement
+        if len(self._statements) > self.maxsize:
+            self._statements.popitem(last=False)
+        return statement
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    def info(self) -> Dict[str, int]:
+        """キャッシュの利用状況"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._statements),
+            "maxsize": self.maxsize,
+        }
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
-    def append_filter(self, elem: FunctionElement) -> None:
-        self.filter.append(elem)
+    def clear(self) -> None:
+        self._statements.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+statement_cache = StatementCache()
@@ -1,15 +1,17 @@
 #!/usr/bin/python3
 # accouts.py
 
+from datetime import datetime
 from typing import List, Optional, Tuple
 
-from sqlalchemy import func, select, table
-from sqlalchemy.engine import Result
+from sqlalchemy import bindparam, func, select, table, update
+from sqlalchemy.engine import Result, Row, RowMapping
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
 from app.models.table_models import ac_Auth, ac_Profile
-from app.repositries import QueryParam
+from app.repositries import QueryParam, statement_cache
 from app.services import auth_service
 from app.services.authentication import AuthError
 
@@ -36,25 +38,37 @@ class AccountRepository:
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
     async def update(
-        self, *, session: AsyncSession, id: str, patch_params: dict[str, any]
-    ) -> Optional[ac_Profile]:
-
-        """アカウント更新"""
-        base_profile: ac_Profile = await self.get_profile_by_id(
-            session=session, id=id, for_update=True
-        )
-        if base_profile is None:
-            return None
+        self,
+        *,
+        session: AsyncSession,
+        id: str,
+        patch_params: dict[str, any],
+        modified_at: Optional[List[datetime]] = None,
+    ) -> Optional[Row]:
+
+        """
+        アカウント更新(行ロックを先行取得せず、1文の条件付きUPDATEで更新する)
+        modified_at指定時は更新日時がいずれかに一致する場合のみ更新する(楽観的排他制御)。
+        対象無し/不一致の場合はNone
+        """
+        columns = ac_Profile.__table__.c
+        condition = columns.account_id == id
+        if modified_at is not None:
+            condition &= columns.modified_at.in_(modified_at)
 
         # patch_paramsのフィールドを反映
-        {
-            setattr(base_profile, f, v)
-            for f, v in patch_params.items()
-            if f in base_profile.__dict__
-        }
-
-        await session.flush()
-        return base_profile
+        values = {f: v for f, v in patch_params.items() if f in columns}
+        if values:
+            query = (
+                update(ac_Profile.__table__)
+                .where(condition)
+                .values(values)
+                .returning(*columns)
+            )
+        else:
+            query = select(*columns).where(condition)
+        result: Result = await session.execute(query)
+        return result.first()
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
@@ -77,7 +91,7 @@ class AccountRepository:
         self, *, session: AsyncSession, id: str, for_update: bool = False
     ) -> Optional[ac_Profile]:
 
-        """アカウント取得"""
+        """アカウント取得(更新用。参照のみの場合はAccountReadRepositoryを使用すること)"""
         query = select(ac_Profile).filter(ac_Profile.account_id == id)
         if for_update:
             query = query.with_for_update()
@@ -87,6 +101,17 @@ class AccountRepository:
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
+    async def get_modified_at(
+        self, *, session: AsyncSession, id: str
+    ) -> Optional[datetime]:
+
+        """アカウントの更新日時のみ取得"""
+        query = select(ac_Profile.modified_at).filter(ac_Profile.account_id == id)
+        result: Result = await session.execute(query)
+        return result.scalar()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
     async def login_authentication(
         self, *, session: AsyncSession, id: str, password: str
     ) -> Optional[ac_Profile]:
@@ -164,16 +189,42 @@ class AccountRepository:
         auth: Optional[Tuple[ac_Auth]] = result.first()
         return auth[0] if auth else None
 
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class AccountReadRepository:
+    """
+    参照専用のアカウントリポジトリ。
+    ORMエンティティを経由せずカラムを明示してSELECTし、行はRowMapping(カラム名→値)で返却する。
+    """
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def get_profile_by_id(
+        self, *, session: AsyncSession, id: str
+    ) -> Optional[RowMapping]:
+
+        """アカウント取得"""
+        profile = ac_Profile.__table__
+        query = statement_cache.get(
+            ("profiles:get",),
+            lambda: select(*profile.c).where(
+                profile.c.account_id == bindparam("account_id")
+            ),
+        )
+        result: Result = await session.execute(query, {"account_id": id})
+        return result.mappings().first()
+
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
     async def count(self, *, session: AsyncSession, query_param: QueryParam) -> int:
         """プロフィール件数取得"""
-        query = select(func.count())
-        if query_param.filter:
-            query = query.where(*query_param.filter)
-        else:
-            query = query.select_from(table("profiles", schema="account"))
-        result: Result = await session.execute(query)
+        query = statement_cache.get(
+            ("profiles:count", query_param.shape[0]),
+            lambda: self._count_query(query_param),
+        )
+        result: Result = await session.execute(query, query_param.params)
         return result.scalar()
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
@@ -183,15 +234,31 @@ class AccountRepository:
         *,
         session: AsyncSession,
         query_param: QueryParam,
-    ) -> List[ac_Profile]:
+    ) -> List[RowMapping]:
         """プロフィール検索"""
-        query = (
-            select(ac_Profile)
-            .where(*query_param.filter)
-            .offset(query_param.offset)
-            .limit(query_param.limit)
-            .order_by(*query_param.sort)
+        query = statement_cache.get(
+            ("profiles:search", *query_param.shape),
+            lambda: self._search_query(query_param),
+        )
+        result: Result = await session.execute(query, query_param.params)
+        return result.mappings().all()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]件数取得クエリの作成
+    def _count_query(self, query_param: QueryParam) -> Select:
+        query = select(func.count())
+        if query_param.filter:
+            return query.where(*query_param.where(ac_Profile.__table__.c))
+        return query.select_from(table("profiles", schema="account"))
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]検索クエリの作成
+    def _search_query(self, query_param: QueryParam) -> Select:
+        profile = ac_Profile.__table__
+        return (
+            select(*profile.c)
+            .where(*query_param.where(profile.c))
+            .offset(bindparam("offset"))
+            .limit(bindparam("limit"))
+            .order_by(*query_param.order_by())
         )
-        result: Result = await session.execute(query)
-        profiles: List[Tuple[ac_Profile]] = result.all()
-        return [profile[0] for profile in profiles]
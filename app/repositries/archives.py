@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+# archives.py
+
+from sqlalchemy import text
+from sqlalchemy.engine import Result
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.segment_values import TaskStatus
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class ArchiveRepository:
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def archive_done_tasks(
+        self, *, session: AsyncSession, after_days: int, batch_size: int
+    ) -> int:
+        """完了タスクのアーカイブ(1バッチ分)"""
+
+        # 対象タスクの監視情報を退避してからタスクを削除する(監視情報はCASCADEで削除)
+        # 複数ワーカーで同時に実行しても、SKIP LOCKEDにより対象が重複しない
+        stmt = text(
+            """
+            WITH target AS (
+                SELECT id FROM todo.tasks
+                WHERE status = :status
+                    AND modified_at < now() - make_interval(days => :after_days)
+                ORDER BY modified_at
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            ), archived_watcher AS (
+                INSERT INTO todo.watcher_archive
+                    (watcher_id, task_id, note, created_at, modified_at)
+                SELECT w.watcher_id, w.task_id, w.note, w.created_at, w.modified_at
+                FROM todo.watcher w JOIN target ON w.task_id = target.id
+            ), deleted_task AS (
+                DELETE FROM todo.tasks t USING target
+                WHERE t.id = target.id
+                RETURNING t.*
+            ), archived_task AS (
+                INSERT INTO todo.tasks_archive
+                    (id, registrant_id, title, description, asaignee_id, status,
+                     is_significant, deadline, created_at, modified_at)
+                SELECT id, registrant_id, title, description, asaignee_id, status,
+                    is_significant, deadline, created_at, modified_at
+                FROM deleted_task
+                RETURNING id
+            )
+            SELECT count(*) FROM archived_task;
+            """
+        )
+        result: Result = await session.execute(
+            stmt,
+            {
+                "status": TaskStatus.done.value,
+                "after_days": after_days,
+                "batch_size": batch_size,
+            },
+        )
+        return result.scalar()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def purge_tombstones(
+        self, *, session: AsyncSession, retention_days: int
+    ) -> int:
+        """保持期間を経過したタスクの削除記録を削除"""
+        stmt = text(
+            """
+            DELETE FROM todo.task_tombstones
+            WHERE deleted_at < now() - make_interval(days => :retention_days)
+            """
+        )
+        result: Result = await session.execute(
+            stmt, {"retention_days": retention_days}
+        )
+        return result.rowcount
@@ -1,15 +1,52 @@
 #!/usr/bin/python3
 # tasks.py
 
-from typing import List, Optional, Tuple
-
-from sqlalchemy import func, select, table
-from sqlalchemy.engine import Result
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    Column,
+    Table,
+    bindparam,
+    case,
+    column,
+    func,
+    literal,
+    select,
+    table,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.engine import Result, Row, RowMapping
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import aliased
-
-from app.models.table_models import ac_Profile, td_Task, td_Watcher
-from app.repositries import QueryParam
+from sqlalchemy.types import TIMESTAMP, Integer, Text
+from sqlalchemy.sql import ColumnElement, FromClause, Select, Subquery
+
+from app.models.segment_values import TaskStatus
+from app.models.table_models import (
+    ac_Profile,
+    td_Task,
+    td_TaskArchive,
+    td_TaskDeadlineStats,
+    td_TaskStats,
+    td_TaskTombstone,
+    td_Watcher,
+)
+from app.repositries import (
+    QueryParam,
+    json_object,
+    json_text,
+    labeled,
+    sql_string,
+    statement_cache,
+)
+
+# 結合したアカウント(プロフィール)のカラム名の接頭辞
+REGISTRANT = "registrant__"
+ASAIGNEE = "asaignee__"
 
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
@@ -27,23 +64,36 @@ class TaskRepository:
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
     async def update(
-        self, *, session: AsyncSession, id: int, patch_params: dict[str, any]
-    ) -> Optional[td_Task]:
-        """タスク更新"""
-        result: td_Task = await self.get_by_id(session=session, id=id, for_update=True)
-        if result is None:
-            return None
+        self,
+        *,
+        session: AsyncSession,
+        id: int,
+        patch_params: dict[str, any],
+        modified_at: Optional[List[datetime]] = None,
+    ) -> Optional[Row]:
+        """
+        タスク更新(行ロックを先行取得せず、1文の条件付きUPDATEで更新する)
+        modified_at指定時は更新日時がいずれかに一致する場合のみ更新する(楽観的排他制御)。
+        対象無し/不一致の場合はNone
+        """
+        columns = td_Task.__table__.c
+        condition = columns.id == id
+        if modified_at is not None:
+            condition &= columns.modified_at.in_(modified_at)
 
-        base_task = result[0]
         # patch_paramsのフィールドを反映
-        {
-            setattr(base_task, f, v)
-            for f, v in patch_params.items()
-            if f in base_task.__dict__
-        }
-
-        await session.flush()
-        return base_task
+        values = {f: v for f, v in patch_params.items() if f in columns}
+        if values:
+            query = (
+                update(td_Task.__table__)
+                .where(condition)
+                .values(values)
+                .returning(*columns)
+            )
+        else:
+            query = select(*columns).where(condition)
+        result: Result = await session.execute(query)
+        return result.first()
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
@@ -60,70 +110,69 @@ class TaskRepository:
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
-    async def count(self, *, session: AsyncSession, query_param: QueryParam) -> int:
-        """タスク件数取得"""
-        query = select(func.count())
-        if query_param.filter:
-            query = query.where(*query_param.filter)
-        else:
-            query = query.select_from(table("tasks", schema="todo"))
-        result: Result = await session.execute(query)
-        return result.scalar()
-
-    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
-
-    async def search(
-        self,
-        *,
-        session: AsyncSession,
-        query_param: QueryParam,
-        inclide_account: bool = False
-    ) -> List[Tuple[td_Task, ac_Profile, ac_Profile]]:
-        """タスク検索"""
-        if inclide_account:
-            registrant = aliased(ac_Profile)
-            asaignee = aliased(ac_Profile)
-            query = (
-                select(td_Task, registrant, asaignee)
-                .outerjoin(registrant, td_Task.registrant_id == registrant.account_id)
-                .outerjoin(asaignee, td_Task.asaignee_id == asaignee.account_id)
+    async def stats(self, *, session: AsyncSession, live: bool = False) -> List[Row]:
+        """タスク集計"""
+        # live=Trueの場合は集計テーブルを使わずタスクテーブルから再集計する
+        if live:
+            source, weight = td_Task, literal(1)
+            is_overdue = (td_Task.deadline < func.current_date()) & (
+                td_Task.status != TaskStatus.done
             )
+            overdue = func.coalesce(func.sum(weight).filter(is_overdue), 0)
         else:
-            query = select(td_Task)
-        query = (
-            query.where(*query_param.filter)
-            .offset(query_param.offset)
-            .limit(query_param.limit)
-            .order_by(*query_param.sort)
+            # 期限切れ件数は締切日ごとの件数を当日より前について合算する(全体の件数のみ)
+            source, weight = td_TaskStats, td_TaskStats.task_count
+            overdue = (
+                select(func.coalesce(func.sum(td_TaskDeadlineStats.task_count), 0))
+                .filter(td_TaskDeadlineStats.deadline < func.current_date())
+                .scalar_subquery()
+            )
+        query = select(
+            source.status,
+            source.asaignee_id,
+            source.is_significant,
+            func.coalesce(func.sum(weight), 0).label("task_count"),
+            overdue.label("overdue"),
+            func.grouping(
+                source.status, source.asaignee_id, source.is_significant
+            ).label("grouping"),
+        ).group_by(
+            func.grouping_sets(
+                source.status, source.asaignee_id, source.is_significant, tuple_()
+            )
         )
-
         result: Result = await session.execute(query)
         return result.all()
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
     async def get_by_id(
-        self,
-        *,
-        session: AsyncSession,
-        id: int,
-        for_update: bool = False,
-        inclide_account: bool = False
-    ) -> Optional[Tuple[td_Task, ac_Profile, ac_Profile]]:
-        """タスク取得"""
+        self, *, session: AsyncSession, id: int, for_update: bool = False
+    ) -> Optional[Tuple[td_Task]]:
+        """タスク取得(更新用。参照のみの場合はTaskReadRepositoryを使用すること)"""
+        query = select(td_Task).filter(td_Task.id == id)
+        if for_update:
+            query = query.with_for_update()
+        result: Result = await session.execute(query)
+        return result.first()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def get_modified_at(
+        self, *, session: AsyncSession, id: int, inclide_account: bool = False
+    ) -> Optional[Row]:
+        """タスク(およびサブリソース)の更新日時のみ取得"""
         if inclide_account:
             registrant = aliased(ac_Profile)
             asaignee = aliased(ac_Profile)
             query = (
-                select(td_Task, registrant, asaignee)
+                select(td_Task.modified_at, registrant.modified_at, asaignee.modified_at)
                 .outerjoin(registrant, td_Task.registrant_id == registrant.account_id)
                 .outerjoin(asaignee, td_Task.asaignee_id == asaignee.account_id)
             )
         else:
-            query = select(td_Task)
+            query = select(td_Task.modified_at)
         query = query.filter(td_Task.id == id)
-        if for_update:
-            query = query.with_for_update()
         result: Result = await session.execute(query)
         return result.first()
 
@@ -171,18 +220,376 @@ class TaskRepository:
         await session.flush()
         return True
 
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TaskReadRepository:
+    """
+    参照専用のタスクリポジトリ。
+    ORMエンティティを経由せずカラムを明示してSELECTし、行はRowMapping(カラム名→値)で返却する。
+    (アカウントを結合する場合、プロフィールのカラムはREGISTRANT/ASAIGNEEの接頭辞付きで返却する)
+    *_documentはレスポンスのJSON文書をDBで生成し、テキストのまま返却する。
+    """
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def count(
+        self,
+        *,
+        session: AsyncSession,
+        query_param: QueryParam,
+        include_archived: bool = False
+    ) -> int:
+        """タスク件数取得"""
+        query = statement_cache.get(
+            ("tasks:count", query_param.shape[0], include_archived),
+            lambda: self._count_query(query_param, include_archived),
+        )
+        result: Result = await session.execute(query, query_param.params)
+        return result.scalar()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def search(
+        self,
+        *,
+        session: AsyncSession,
+        query_param: QueryParam,
+        inclide_account: bool = False,
+        include_archived: bool = False
+    ) -> List[RowMapping]:
+        """タスク検索"""
+        query = statement_cache.get(
+            ("tasks:search", *query_param.shape, inclide_account, include_archived),
+            lambda: self._search_query(query_param, inclide_account, include_archived),
+        )
+        result: Result = await session.execute(query, query_param.params)
+        return result.mappings().all()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def get_by_id(
+        self, *, session: AsyncSession, id: int, inclide_account: bool = False
+    ) -> Optional[RowMapping]:
+        """タスク取得"""
+        task = td_Task.__table__
+        query = statement_cache.get(
+            ("tasks:get", inclide_account),
+            lambda: self._select(task, inclide_account).where(
+                task.c.id == bindparam("id")
+            ),
+        )
+        result: Result = await session.execute(query, {"id": id})
+        return result.mappings().first()
+
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
     async def get_watch_tasks(
         self, *, session: AsyncSession, watcher_id: str
-    ) -> List[Tuple[td_Watcher, td_Task]]:
-        """監視タスク検索"""
+    ) -> List[RowMapping]:
+        """監視タスク検索(タスクのカラムに監視ノート(note)を加えて返却する)"""
+        task = td_Task.__table__
+        watcher = td_Watcher.__table__
+        query = statement_cache.get(
+            ("tasks:watch",),
+            lambda: select(*task.c, watcher.c.note)
+            .select_from(watcher.join(task, watcher.c.task_id == task.c.id))
+            .where(watcher.c.watcher_id == bindparam("watcher_id"))
+            .order_by(watcher.c.task_id),
+        )
+        result: Result = await session.execute(query, {"watcher_id": watcher_id})
+        return result.mappings().all()
 
-        query = (
-            select(td_Watcher, td_Task)
-            .outerjoin(td_Watcher, td_Watcher.task_id == td_Task.id)
-            .filter(td_Watcher.watcher_id == watcher_id)
-            .order_by("task_id")
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def get_watch_task_ids(
+        self, *, session: AsyncSession, watcher_id: str
+    ) -> List[int]:
+        """監視タスクのID検索"""
+        watcher = td_Watcher.__table__
+        query = statement_cache.get(
+            ("tasks:watch:ids",),
+            lambda: select(watcher.c.task_id).where(
+                watcher.c.watcher_id == bindparam("watcher_id")
+            ),
         )
+        result: Result = await session.execute(query, {"watcher_id": watcher_id})
+        return result.scalars().all()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def settled_timestamp(self, *, session: AsyncSession) -> datetime:
+        """
+        更新の確定済みの日時(この日時以前の更新日時/削除日時の行は今後コミットされない)。
+        更新日時/削除日時はnow()(トランザクションの開始日時)のため、実行中の他の
+        トランザクションの最古の開始日時の直前、実行中のトランザクションが無い場合は現在日時
+        """
+        query = statement_cache.get(("tasks:settled",), self._settled_query)
         result: Result = await session.execute(query)
-        return result.all()
+        return result.scalar()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def get_changes(
+        self,
+        *,
+        session: AsyncSession,
+        modified_at: datetime,
+        id: int,
+        until: datetime,
+        limit: int
+    ) -> List[RowMapping]:
+        """(更新日時, ID)が指定キーより後、かつ更新日時がuntil以前のタスクをキー順に取得"""
+        task = td_Task.__table__
+        query = statement_cache.get(
+            ("tasks:changes",),
+            lambda: self._keyset_query(task, task.c.modified_at, task.c.id),
+        )
+        params = {"key_at": modified_at, "key_id": id, "until": until, "limit": limit}
+        result: Result = await session.execute(query, params)
+        return result.mappings().all()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def get_tombstones(
+        self,
+        *,
+        session: AsyncSession,
+        deleted_at: datetime,
+        id: int,
+        until: datetime,
+        limit: int
+    ) -> List[RowMapping]:
+        """(削除日時, ID)が指定キーより後、かつ削除日時がuntil以前の削除記録をキー順に取得"""
+        tombstone = td_TaskTombstone.__table__
+        query = statement_cache.get(
+            ("tasks:tombstones",),
+            lambda: self._keyset_query(
+                tombstone, tombstone.c.deleted_at, tombstone.c.id
+            ),
+        )
+        params = {"key_at": deleted_at, "key_id": id, "until": until, "limit": limit}
+        result: Result = await session.execute(query, params)
+        return result.mappings().all()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def search_document(
+        self,
+        *,
+        session: AsyncSession,
+        query_param: QueryParam,
+        fields: Sequence[str],
+        profile_fields: Sequence[str] = (),
+        inclide_account: bool = False,
+        include_archived: bool = False
+    ) -> str:
+        """
+        タスク検索(レスポンスのJSON文書をDBで生成する)。
+        fields: タスクの出力項目, profile_fields: 登録者/担当者(registrant/asaignee項目)の出力項目
+        """
+        query = statement_cache.get(
+            (
+                "tasks:search:json",
+                *query_param.shape,
+                inclide_account,
+                include_archived,
+            ),
+            lambda: self._search_document_query(
+                query_param, fields, profile_fields, inclide_account, include_archived
+            ),
+        )
+        result: Result = await session.execute(query, query_param.params)
+        return result.scalar()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def get_document(
+        self,
+        *,
+        session: AsyncSession,
+        id: int,
+        fields: Sequence[str],
+        profile_fields: Sequence[str] = (),
+        inclide_account: bool = False
+    ) -> Optional[str]:
+        """タスク取得(レスポンスのJSON文書をDBで生成する。対象無しの場合はNone)"""
+        task = td_Task.__table__
+
+        def build() -> Select:
+            source, document = self._document(
+                task, fields, profile_fields, inclide_account
+            )
+            return (
+                select(document).select_from(source).where(task.c.id == bindparam("id"))
+            )
+
+        query = statement_cache.get(("tasks:get:json", inclide_account), build)
+        result: Result = await session.execute(query, {"id": id})
+        return result.scalar()
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]件数取得クエリの作成
+    def _count_query(self, query_param: QueryParam, include_archived: bool) -> Select:
+        query = select(func.count())
+        if include_archived:
+            task = self._with_archive()
+            return query.select_from(task).where(*query_param.where(task.c))
+        if query_param.filter:
+            return query.where(*query_param.where(td_Task.__table__.c))
+        return query.select_from(table("tasks", schema="todo"))
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]検索クエリの作成
+    def _search_query(
+        self, query_param: QueryParam, inclide_account: bool, include_archived: bool
+    ) -> Select:
+        task = self._with_archive() if include_archived else td_Task.__table__
+        return (
+            self._select(task, inclide_account)
+            .where(*query_param.where(task.c))
+            .offset(bindparam("offset"))
+            .limit(bindparam("limit"))
+            .order_by(*query_param.order_by())
+        )
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]タスク(およびアカウント)のカラムを選択するクエリの作成
+    def _select(self, task: FromClause, inclide_account: bool) -> Select:
+        if not inclide_account:
+            return select(*task.c)
+        registrant = ac_Profile.__table__.alias("registrant")
+        asaignee = ac_Profile.__table__.alias("asaignee")
+        return select(
+            *task.c,
+            *labeled(registrant.c, REGISTRANT),
+            *labeled(asaignee.c, ASAIGNEE),
+        ).select_from(
+            task.outerjoin(
+                registrant, task.c.registrant_id == registrant.c.account_id
+            ).outerjoin(asaignee, task.c.asaignee_id == asaignee.c.account_id)
+        )
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]検索結果のJSON文書({"count": 件数, "tasks": [...]})を生成するクエリの作成
+    def _search_document_query(
+        self,
+        query_param: QueryParam,
+        fields: Sequence[str],
+        profile_fields: Sequence[str],
+        inclide_account: bool,
+        include_archived: bool,
+    ) -> Select:
+        task = self._with_archive() if include_archived else td_Task.__table__
+        source, document = self._document(task, fields, profile_fields, inclide_account)
+        order_by = query_param.order_by(task.c)
+        page = (
+            select(
+                document.label("document"),
+                func.row_number().over(order_by=order_by).label("ord"),
+            )
+            .select_from(source)
+            .where(*query_param.where(task.c))
+            .offset(bindparam("offset"))
+            .limit(bindparam("limit"))
+            .order_by(*order_by)
+            .subquery("page")
+        )
+        count = self._count_query(query_param, include_archived).scalar_subquery()
+        tasks = func.string_agg(
+            page.c.document, aggregate_order_by(sql_string(","), page.c.ord)
+        )
+        return select(
+            func.concat(
+                sql_string('{"count":'),
+                count,
+                sql_string(',"tasks":['),
+                func.coalesce(tasks, sql_string("")),
+                sql_string("]}"),
+            )
+        ).select_from(page)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]タスク1件のJSON文書を生成する式の作成(戻り値: 結合したテーブル, JSON文書の式)
+    def _document(
+        self,
+        task: FromClause,
+        fields: Sequence[str],
+        profile_fields: Sequence[str],
+        inclide_account: bool,
+    ) -> Tuple[FromClause, ColumnElement]:
+        if not inclide_account:
+            return task, json_object((f, json_text(task.c[f])) for f in fields)
+        registrant = ac_Profile.__table__.alias("registrant")
+        asaignee = ac_Profile.__table__.alias("asaignee")
+        source = task.outerjoin(
+            registrant, task.c.registrant_id == registrant.c.account_id
+        ).outerjoin(asaignee, task.c.asaignee_id == asaignee.c.account_id)
+
+        accounts = {"registrant": registrant, "asaignee": asaignee}
+        members = []
+        for f in fields:
+            if f in accounts:
+                profile = accounts[f].c
+                value = case(
+                    (profile.account_id.is_(None), sql_string("null")),
+                    else_=json_object(
+                        (p, json_text(profile[p])) for p in profile_fields
+                    ),
+                )
+            else:
+                value = json_text(task.c[f])
+            members.append((f, value))
+        return source, json_object(members)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]確定済みの日時を取得するクエリ
+    def _settled_query(self) -> Select:
+        activity = table(
+            "pg_stat_activity",
+            column("datname", Text),
+            column("pid", Integer),
+            column("backend_type", Text),
+            column("xact_start", TIMESTAMP(timezone=True)),
+            schema="pg_catalog",
+        )
+        oldest = (
+            select(func.min(activity.c.xact_start))
+            .where(
+                activity.c.datname == func.current_database(),
+                activity.c.pid != func.pg_backend_pid(),
+                activity.c.backend_type == "client backend",
+            )
+            .scalar_subquery()
+        )
+        # leastはNULLを無視する(実行中のトランザクションが無い場合は現在日時)
+        return select(
+            func.least(func.clock_timestamp(), oldest - timedelta(microseconds=1))
+        )
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER](日時, ID)のキーセットで範囲を取得するクエリの作成
+    def _keyset_query(self, source: Table, at: Column, id: Column) -> Select:
+        return (
+            select(*source.c)
+            .where(
+                tuple_(at, id)
+                > tuple_(
+                    bindparam("key_at", type_=at.type),
+                    bindparam("key_id", type_=id.type),
+                ),
+                at <= bindparam("until", type_=at.type),
+            )
+            .order_by(at, id)
+            .limit(bindparam("limit"))
+        )
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]タスクとアーカイブ済みタスクを結合した副問合せの作成
+    def _with_archive(self) -> Subquery:
+        columns = td_Task.__table__.columns.keys()
+        return union_all(
+            select(*[td_Task.__table__.c[c] for c in columns]),
+            select(*[td_TaskArchive.__table__.c[c] for c in columns]),
+        ).subquery("tasks")
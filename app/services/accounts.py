@@ -1,15 +1,19 @@
 #!/usr/bin/python3
 # accounts.py
 
-from typing import List, Tuple
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from fastapi import HTTPException
+from sqlalchemy import bindparam
+from sqlalchemy.engine import Row, RowMapping
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import (
     HTTP_401_UNAUTHORIZED,
     HTTP_404_NOT_FOUND,
     HTTP_409_CONFLICT,
+    HTTP_412_PRECONDITION_FAILED,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
@@ -21,18 +25,25 @@ from app.api.schemas.accounts import (
     ProfileFilter,
     ProfileInDB,
     ProfilePublic,
-    ProfilePublicList,
     ProfilePublicWithInitPass,
     ProfileUpdate,
 )
-from app.api.schemas.tasks import TaskInDB, TaskWithWatchNote, WatchTask
+from app.api.schemas.tasks import TaskWithWatchNote, WatchTask
 from app.api.schemas.token import AccessToken
+from app.core.cache import result_cache
 from app.models.table_models import ac_Auth, ac_Profile, td_Task, td_Watcher
-from app.repositries import QueryParam
-from app.repositries.accounts import AccountRepository
-from app.repositries.tasks import TaskRepository
+from app.repositries import QueryParam, row_fields
+from app.repositries.accounts import AccountReadRepository, AccountRepository
+from app.repositries.tasks import TaskReadRepository, TaskRepository
 from app.services import auth_service
 
+# ソート可能なカラム
+PROFILE_COLUMNS = tuple(ac_Profile.__table__.columns.keys())
+
+# レスポンス項目(モデルを経由せずに行からレスポンスを構築する際の項目順。カラムとの整合は検証済み)
+PROFILE_FIELDS = row_fields(ProfileInDB, ac_Profile)
+WATCH_TASK_FIELDS = row_fields(TaskWithWatchNote, td_Task, td_Watcher)
+
 # 未認証例外
 not_authorized_exception: HTTPException = HTTPException(
     status_code=HTTP_401_UNAUTHORIZED,
@@ -46,6 +57,27 @@ not_found_exception: HTTPException = HTTPException(
     detail="Account resource not found by specified Id.",
 )
 
+# 更新競合例外(If-Matchの不一致: 他のユーザーにより更新済み)
+precondition_failed_exception: HTTPException = HTTPException(
+    status_code=HTTP_412_PRECONDITION_FAILED,
+    detail="Account resource has been modified. Get the latest version and retry.",
+)
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def profile_row(
+    profile: Optional[RowMapping], prefix: str = ""
+) -> Optional[Dict[str, Any]]:
+    """
+    プロフィールの行からレスポンス(ProfileInDBと同形式のdict)を構築する。
+    prefix: 結合したプロフィールのカラム名の接頭辞(外部結合で該当無しの場合はNoneを返却する)
+    """
+    if profile is None or profile[f"{prefix}account_id"] is None:
+        return None
+    return {f: profile[f"{prefix}{f}"] for f in PROFILE_FIELDS}
+
+
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
 
@@ -78,6 +110,7 @@ class AccountService:
                 session=session, profile=profile, auth=auth
             )
             await session.commit()
+            result_cache.bump("profiles")
         except IntegrityError as e:
             await session.rollback()
             self.ch_exception_detail(e)
@@ -91,43 +124,75 @@ class AccountService:
     async def get_by_id(self, *, session: AsyncSession, id: str) -> ProfilePublic:
 
         """アカウント取得"""
-        repo = AccountRepository()
-        profile: ac_Profile = await repo.get_profile_by_id(session=session, id=id)
+        repo = AccountReadRepository()
+        profile: RowMapping = await repo.get_profile_by_id(session=session, id=id)
         if not profile:
             raise not_found_exception
 
-        return ProfileInDB.from_orm(profile)
+        return ProfileInDB(**profile_row(profile))
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def get_version(self, *, session: AsyncSession, id: str) -> Optional[datetime]:
+
+        """アカウントの更新日時取得"""
+        repo = AccountRepository()
+        modified_at = await repo.get_modified_at(session=session, id=id)
+        if not modified_at:
+            raise not_found_exception
+
+        return modified_at
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
     async def patch_base_profile(
-        self, *, session: AsyncSession, id: str, patch_params: ProfileBaseUpdate
-    ) -> ProfilePublic:
+        self,
+        *,
+        session: AsyncSession,
+        id: str,
+        patch_params: ProfileBaseUpdate,
+        modified_at: Optional[List[datetime]] = None,
+    ) -> Tuple[ProfilePublic, datetime]:
 
-        """アカウント更新(base profile)"""
+        """アカウント更新(base profile)。更新後の更新日時を含む"""
         update_dict = patch_params.dict(exclude_unset=True)
-        return await self.update(session=session, id=id, update_dict=update_dict)
+        return await self.update(
+            session=session, id=id, update_dict=update_dict, modified_at=modified_at
+        )
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
-    # [INNER]patch処理を共通化
+    # [INNER]patch処理を共通化(modified_at指定時は更新日時の一致を条件とする)
     async def update(
-        self, *, session: AsyncSession, id: str, update_dict: dict
-    ) -> ProfilePublic:
+        self,
+        *,
+        session: AsyncSession,
+        id: str,
+        update_dict: dict,
+        modified_at: Optional[List[datetime]] = None,
+    ) -> Tuple[ProfilePublic, datetime]:
 
         repo = AccountRepository()
         try:
-            updated_profile: ac_Profile = await repo.update(
-                session=session, id=id, patch_params=update_dict
+            updated_profile: Optional[Row] = await repo.update(
+                session=session,
+                id=id,
+                patch_params=update_dict,
+                modified_at=modified_at,
             )
-            await session.commit()
         except IntegrityError as e:
             await session.rollback()
             self.ch_exception_detail(e)
         if not updated_profile:
+            await session.rollback()
+            if modified_at is not None and await repo.get_modified_at(
+                session=session, id=id
+            ):
+                raise precondition_failed_exception
             raise not_found_exception
 
-        await session.refresh(updated_profile)
-        return ProfileInDB.from_orm(updated_profile)
+        await session.commit()
+        result_cache.bump("profiles")
+        return ProfileInDB.from_orm(updated_profile), updated_profile.modified_at
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
@@ -141,6 +206,8 @@ class AccountService:
             raise not_found_exception
 
         await session.commit()
+        # 登録者/担当者はSET NULLで更新されるためタスクも無効化する
+        result_cache.bump("profiles", "tasks", "tasks_archive")
         return ProfileInDB.from_orm(deleted_profile)
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
@@ -177,6 +244,18 @@ class AccountService:
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
+    async def get_my_version(
+        self, *, session: AsyncSession, token: str
+    ) -> Tuple[str, Optional[datetime]]:
+
+        """ログインユーザーのアカウントIDとプロフィール更新日時取得"""
+
+        account_id = auth_service.get_id_from_token(token=token)
+        modified_at = await self.get_version(session=session, id=account_id)
+        return account_id, modified_at
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
     async def patch_my_profile(
         self, *, session: AsyncSession, token: str, patch_params: ProfileUpdate
     ) -> ProfilePublic:
@@ -185,9 +264,10 @@ class AccountService:
 
         account_id = auth_service.get_id_from_token(token=token)
         update_dict = patch_params.dict(exclude_unset=True)
-        return await self.update(
+        profile, _ = await self.update(
             session=session, id=account_id, update_dict=update_dict
         )
+        return profile
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
@@ -205,6 +285,7 @@ class AccountService:
             new_password=pass_change.new_password.get_secret_value(),
         )
         await session.commit()
+        result_cache.bump("profiles")
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
@@ -223,6 +304,7 @@ class AccountService:
         repo = AccountRepository()
         await repo.password_reset(session=session, id=id, password=init_password)
         await session.commit()
+        result_cache.bump("profiles")
 
         return PasswordReset(init_password=init_password)
 
@@ -236,21 +318,24 @@ class AccountService:
         *,
         session: AsyncSession,
         filter: ProfileFilter
-    ) -> ProfilePublicList:
-        """プロフィール照会"""
+    ) -> Dict[str, Any]:
+        """
+        プロフィール照会。
+        ※件数が多くなるため、モデルを経由せずProfilePublicListと同形式のdictを返却する
+        """
 
         query_param = self.New_QueryParam(
             offset=offset, limit=limit, sort=sort, filter=filter
         )
-        repo = AccountRepository()
-        searched_profiles: List[ac_Profile] = await repo.search(
+        repo = AccountReadRepository()
+        searched_profiles: List[RowMapping] = await repo.search(
             session=session, query_param=query_param
         )
-        profiles: List[ProfilePublic] = [
-            ProfileInDB.from_orm(profile) for profile in searched_profiles
-        ]
         count: int = await repo.count(session=session, query_param=query_param)
-        return ProfilePublicList(profiles=profiles, count=count)
+        return {
+            "count": count,
+            "profiles": [profile_row(profile) for profile in searched_profiles],
+        }
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
@@ -292,25 +377,33 @@ class AccountService:
 
     async def get_watch_tasks(
         self, *, session: AsyncSession, token: str
-    ) -> List[TaskWithWatchNote]:
+    ) -> List[Dict[str, Any]]:
 
-        """監視タスク取得"""
+        """監視タスク取得(TaskWithWatchNoteと同形式のdictを返却する)"""
         account_id = auth_service.get_id_from_token(token=token)
-        repo = TaskRepository()
-        watch_tasks: List[Tuple[td_Watcher, td_Task]] = await repo.get_watch_tasks(
+        repo = TaskReadRepository()
+        watch_tasks: List[RowMapping] = await repo.get_watch_tasks(
             session=session, watcher_id=account_id
         )
         return [self.New_TaskWithWatchNote(task) for task in watch_tasks]
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
-    # [INNER]ノート付タスククラスの作成
 
-    def New_TaskWithWatchNote(
-        self, src: Tuple[td_Watcher, td_Task]
-    ) -> TaskWithWatchNote:
-        task_dict = TaskInDB.from_orm(src[1]).dict()
-        task_dict["note"] = src[0].note
-        return TaskWithWatchNote(**task_dict)
+    async def get_watch_task_ids(
+        self, *, session: AsyncSession, token: str
+    ) -> Tuple[str, Set[int]]:
+
+        """監視タスクのID取得(ログインユーザーのID, 監視タスクIDの集合)"""
+        account_id = auth_service.get_id_from_token(token=token)
+        repo = TaskReadRepository()
+        task_ids = await repo.get_watch_task_ids(session=session, watcher_id=account_id)
+        return account_id, set(task_ids)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]ノート付タスクの作成
+
+    def New_TaskWithWatchNote(self, src: RowMapping) -> Dict[str, Any]:
+        return {f: src[f] for f in WATCH_TASK_FIELDS}
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
     # [INNER]クエリパラメータクラスの作成
@@ -319,7 +412,7 @@ class AccountService:
     ) -> QueryParam:
         try:
             queryParm = QueryParam(
-                columns=ac_Profile.__table__.columns,
+                columns=PROFILE_COLUMNS,
                 offset=offset,
                 limit=limit,
                 sort=sort,
@@ -329,28 +422,57 @@ class AccountService:
             raise HTTPException(
                 status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=e.args
             )
+        # 条件式はクエリ形状のキャッシュ対象とし、値はバインドパラメータで渡す
         if filter.account_id_sw is not None:
             queryParm.append_filter(
-                ac_Profile.account_id.startswith(filter.account_id_sw)
+                "account_id_sw",
+                lambda p: p.account_id.startswith(bindparam("account_id_sw")),
+                account_id_sw=filter.account_id_sw,
             )
         if filter.user_name_cn is not None:
-            queryParm.append_filter(ac_Profile.user_name.contains(filter.user_name_cn))
+            queryParm.append_filter(
+                "user_name_cn",
+                lambda p: p.user_name.contains(bindparam("user_name_cn")),
+                user_name_cn=filter.user_name_cn,
+            )
         if filter.nickname_cn is not None:
-            queryParm.append_filter(ac_Profile.nickname.contains(filter.nickname_cn))
+            queryParm.append_filter(
+                "nickname_cn",
+                lambda p: p.nickname.contains(bindparam("nickname_cn")),
+                nickname_cn=filter.nickname_cn,
+            )
         if filter.nickname_ex is True:
-            queryParm.append_filter(ac_Profile.nickname.is_not(None))
+            queryParm.append_filter(
+                "nickname_ex:true", lambda p: p.nickname.is_not(None)
+            )
         if filter.nickname_ex is False:
-            queryParm.append_filter(ac_Profile.nickname.is_(None))
+            queryParm.append_filter("nickname_ex:false", lambda p: p.nickname.is_(None))
         if filter.email_dm is not None:
-            queryParm.append_filter(ac_Profile.email.endswith("@" + filter.email_dm))
+            queryParm.append_filter(
+                "email_dm",
+                lambda p: p.email.endswith(bindparam("email_dm")),
+                email_dm="@" + filter.email_dm,
+            )
         if filter.verified_email_eq is not None:
             queryParm.append_filter(
-                ac_Profile.verified_email.is_(filter.verified_email_eq)
+                "verified_email_eq",
+                lambda p: p.verified_email == bindparam("verified_email_eq"),
+                verified_email_eq=filter.verified_email_eq,
             )
         if filter.account_type_in is not None:
-            queryParm.append_filter(ac_Profile.account_type.in_(filter.account_type_in))
+            queryParm.append_filter(
+                "account_type_in",
+                lambda p: p.account_type.in_(
+                    bindparam("account_type_in", expanding=True)
+                ),
+                account_type_in=filter.account_type_in,
+            )
         if filter.is_active_eq is not None:
-            queryParm.append_filter(ac_Profile.is_active.is_(filter.is_active_eq))
+            queryParm.append_filter(
+                "is_active_eq",
+                lambda p: p.is_active == bindparam("is_active_eq"),
+                is_active_eq=filter.is_active_eq,
+            )
         return queryParm
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
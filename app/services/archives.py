@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+# archives.py
+
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_ENABLED,
+    ARCHIVE_INTERVAL_SECONDS,
+    SYNC_TOMBSTONE_RETENTION_DAYS,
+)
+from app.core.cache import result_cache
+from app.core.database import AsyncCon
+from app.repositries.archives import ArchiveRepository
+
+logger = logging.getLogger(__name__)
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class ArchiveService:
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def archive_done_tasks(
+        self,
+        *,
+        session: AsyncSession,
+        after_days: int = ARCHIVE_AFTER_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE
+    ) -> int:
+        """完了後、指定日数が経過したタスクをアーカイブする(バッチ単位でコミット)"""
+        repo = ArchiveRepository()
+        total = 0
+        while True:
+            moved: int = await repo.archive_done_tasks(
+                session=session, after_days=after_days, batch_size=batch_size
+            )
+            await session.commit()
+            if moved:
+                result_cache.bump("tasks", "tasks_archive")
+            total += moved
+            if moved < batch_size:
+                return total
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def purge_tombstones(
+        self,
+        *,
+        session: AsyncSession,
+        retention_days: int = SYNC_TOMBSTONE_RETENTION_DAYS
+    ) -> int:
+        """保持期間を経過したタスクの削除記録(差分同期用)を削除する"""
+        repo = ArchiveRepository()
+        purged: int = await repo.purge_tombstones(
+            session=session, retention_days=retention_days
+        )
+        await session.commit()
+        return purged
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class ArchiveJob:
+    """完了タスクのアーカイブを定期実行するバックグラウンドジョブ"""
+
+    interval: int
+    task: Optional[asyncio.Task] = None
+
+    def __init__(self, interval: int = ARCHIVE_INTERVAL_SECONDS) -> None:
+        self.interval = interval
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def start(self) -> None:  # pragma: no cover
+        if not ARCHIVE_ENABLED or self.task is not None:
+            return
+        self.task = asyncio.create_task(self._run(), name="archive-job")
+
+    async def stop(self) -> None:  # pragma: no cover
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def _run(self) -> None:  # pragma: no cover
+        con = AsyncCon()
+        service = ArchiveService()
+        while True:
+            try:
+                async with con.session(echo=False)() as session:
+                    moved = await service.archive_done_tasks(session=session)
+                    purged = await service.purge_tombstones(session=session)
+                if moved:
+                    logger.info("archived %d done tasks.", moved)
+                if purged:
+                    logger.info("purged %d task tombstones.", purged)
+            except Exception:
+                logger.exception("archive job failed.")
+            await asyncio.sleep(self.interval)
+
+
+archive_job = ArchiveJob()
@@ -1,12 +1,16 @@
 #!/usr/bin/python3
 # permission.py
 
+from typing import Optional
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.accounts import AccountService
 from app.api.schemas.accounts import ProfileInDB
 from fastapi import HTTPException
 from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
 from app.models.segment_values import AccountTypes
+from app.services.authentication import current_principal
+from app.core.tracing import auth_timer
 
 
 # 非アクティベート例外
@@ -26,6 +30,7 @@ permission_exception: HTTPException = HTTPException(
 class CkPermission:
     session: AsyncSession
     token: str
+    profile: Optional[ProfileInDB] = None
 
     def __init__(self, session: AsyncSession, token: str) -> None:
         self.session = session
@@ -54,8 +59,15 @@ class CkPermission:
             raise permission_exception
 
     async def _profile(self) -> ProfileInDB:
+        # バッチ実行中は認証済みのアカウントを共有する
+        principal = current_principal.get()
+        if principal is not None and principal.token == self.token:
+            self.profile = principal.profile
+            return self.profile
+
         account_service = AccountService()
-        profile = await account_service.get_my_profile(
-            session=self.session, token=self.token
-        )
-        return profile
+        with auth_timer():
+            self.profile = await account_service.get_my_profile(
+                session=self.session, token=self.token
+            )
+        return self.profile
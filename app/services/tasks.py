@@ -1,31 +1,54 @@
 #!/usr/bin/python3
 # tasks.py
 
-from typing import List, Tuple, Union
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
 
 from fastapi import HTTPException
+from sqlalchemy import bindparam
+from sqlalchemy.engine import Row, RowMapping
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import (
     HTTP_400_BAD_REQUEST,
     HTTP_404_NOT_FOUND,
+    HTTP_410_GONE,
+    HTTP_412_PRECONDITION_FAILED,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
-from app.api.schemas.accounts import ProfileInDB
+from app.api.conditional import EPOCH, modified_at_of, version_of
 from app.api.schemas.tasks import (
     TaskCreate,
     TaskFilter,
     TaskInDB,
     TaskPublic,
-    TaskPublicList,
+    TaskStats,
     TaskUpdate,
     TaskWithAccount,
 )
-from app.models.table_models import ac_Profile, td_Task
-from app.repositries import QueryParam
-from app.repositries.tasks import TaskRepository
+from app.core.cache import result_cache
+from app.core.config import SYNC_SETTLE_SECONDS, SYNC_TOMBSTONE_RETENTION_DAYS
+from app.models.segment_values import TaskStatus
+from app.models.table_models import td_Task
+from app.repositries import QueryParam, row_fields
+from app.repositries.tasks import (
+    ASAIGNEE,
+    REGISTRANT,
+    TaskReadRepository,
+    TaskRepository,
+)
 from app.services import auth_service
+from app.services.accounts import PROFILE_FIELDS, profile_row
+
+# ソート可能なカラム
+TASK_COLUMNS = tuple(td_Task.__table__.columns.keys())
+
+# レスポンス項目(モデルを経由せずに行からレスポンスを構築する際の項目順。カラムとの整合は検証済み)
+TASK_FIELDS = row_fields(TaskInDB, td_Task)
+TASK_WITH_ACCOUNT_FIELDS = row_fields(
+    TaskWithAccount, td_Task, nested=("registrant", "asaignee")
+)
 
 # 対象無し例外
 not_found_exception: HTTPException = HTTPException(
@@ -33,6 +56,66 @@ not_found_exception: HTTPException = HTTPException(
     detail="Task resource not found by specified Id.",
 )
 
+# 更新競合例外(If-Matchの不一致: 他のユーザーにより更新済み)
+precondition_failed_exception: HTTPException = HTTPException(
+    status_code=HTTP_412_PRECONDITION_FAILED,
+    detail="Task resource has been modified. Get the latest version and retry.",
+)
+
+# 差分同期カーソル不正例外
+invalid_cursor_exception: HTTPException = HTTPException(
+    status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+    detail="Invalid sync cursor.",
+)
+
+# 差分同期カーソル期限切れ例外(削除記録の保持期間を超過: 全件の再同期が必要)
+expired_cursor_exception: HTTPException = HTTPException(
+    status_code=HTTP_410_GONE,
+    detail="Sync cursor expired. Full resync required.",
+)
+
+# IDの最大値(同一日時の全IDを通過済みとするキー)
+MAX_ID = 2**31 - 1
+
+# 集計行の種類(GROUPING関数の戻り値: 集約されたカラムのビットが立つ)
+GROUPING_STATUS = 0b011
+GROUPING_ASAIGNEE = 0b101
+GROUPING_SIGNIFICANT = 0b110
+GROUPING_TOTAL = 0b111
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class ChangeCursor(NamedTuple):
+    """
+    差分同期のカーソル。タスクは(更新日時, ID)、削除記録は(削除日時, ID)の
+    キーセットで取得済みの位置を保持する。
+    """
+
+    modified_at: datetime
+    id: int
+    deleted_at: datetime
+    deleted_id: int
+
+    def __str__(self) -> str:
+        return "{}.{}.{}.{}".format(
+            version_of(self.modified_at),
+            self.id,
+            version_of(self.deleted_at),
+            self.deleted_id,
+        )
+
+    @classmethod
+    def parse(cls, value: str) -> "ChangeCursor":
+        """文字列からカーソルを復元する(不正な形式の場合はValueError)"""
+        parts = [int(v) for v in value.split(".")]
+        if len(parts) != 4 or min(parts) < 0 or max(parts[1], parts[3]) > MAX_ID:
+            raise ValueError(value)
+        return cls(
+            modified_at_of(parts[0]), parts[1], modified_at_of(parts[2]), parts[3]
+        )
+
+
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
 
@@ -51,6 +134,7 @@ class TaskService:
         try:
             created_task: td_Task = await repo.create(session=session, task=task)
             await session.commit()
+            result_cache.bump("tasks")
         except IntegrityError as e:
             await session.rollback()
             self.ch_exception_detail(e)
@@ -68,9 +152,13 @@ class TaskService:
         sub_resources: str,
         *,
         session: AsyncSession,
-        filter: TaskFilter
-    ) -> TaskPublicList:
-        """タスク照会"""
+        filter: TaskFilter,
+        include_archived: bool = False
+    ) -> Dict[str, Any]:
+        """
+        タスク照会。
+        ※件数が多くなるため、モデルを経由せずTaskPublicListと同形式のdictを返却する
+        """
         inclide_account = (
             "account" in sub_resources.split(",") if sub_resources else False
         )
@@ -78,20 +166,51 @@ class TaskService:
         query_param = self.New_QueryParam(
             offset=offset, limit=limit, sort=sort, filter=filter
         )
-        repo = TaskRepository()
-        searched_tasks: List[
-            Tuple[td_Task, ac_Profile, ac_Profile]
-        ] = await repo.search(
-            session=session, query_param=query_param, inclide_account=inclide_account
+        repo = TaskReadRepository()
+        searched_tasks: List[RowMapping] = await repo.search(
+            session=session,
+            query_param=query_param,
+            inclide_account=inclide_account,
+            include_archived=include_archived,
+        )
+        count: int = await repo.count(
+            session=session, query_param=query_param, include_archived=include_archived
+        )
+        return {
+            "count": count,
+            "tasks": [self.row(task, inclide_account) for task in searched_tasks],
+        }
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def search_document(
+        self,
+        offset: int,
+        limit: int,
+        sort: str,
+        sub_resources: str,
+        *,
+        session: AsyncSession,
+        filter: TaskFilter,
+        include_archived: bool = False
+    ) -> str:
+        """タスク照会(TaskPublicListと同形式のJSON文書をDBで生成して返却する)"""
+        inclide_account = (
+            "account" in sub_resources.split(",") if sub_resources else False
+        )
+
+        query_param = self.New_QueryParam(
+            offset=offset, limit=limit, sort=sort, filter=filter
+        )
+        repo = TaskReadRepository()
+        return await repo.search_document(
+            session=session,
+            query_param=query_param,
+            fields=TASK_WITH_ACCOUNT_FIELDS if inclide_account else TASK_FIELDS,
+            profile_fields=PROFILE_FIELDS,
+            inclide_account=inclide_account,
+            include_archived=include_archived,
         )
-        tasks: List[Union[TaskInDB, TaskWithAccount]] = [
-            self.result(task, inclide_account).dict() for task in searched_tasks
-        ]
-        count: int = await repo.count(session=session, query_param=query_param)
-        # ※リスト要素が可変の場合にdictに変換してから投入する必要がある（要確認）
-        result = TaskPublicList(tasks=[], count=count)
-        result = result.copy(update={"tasks": tasks})
-        return result
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
@@ -103,8 +222,8 @@ class TaskService:
             "account" in sub_resources.split(",") if sub_resources else False
         )
 
-        repo = TaskRepository()
-        task: td_Task = await repo.get_by_id(
+        repo = TaskReadRepository()
+        task: RowMapping = await repo.get_by_id(
             session=session, id=id, inclide_account=inclide_account
         )
         if not task:
@@ -114,26 +233,178 @@ class TaskService:
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
+    async def get_document(
+        self, sub_resources: str, *, session: AsyncSession, id: int
+    ) -> str:
+        """タスク取得(TaskPublic/TaskWithAccountと同形式のJSON文書をDBで生成して返却する)"""
+        inclide_account = (
+            "account" in sub_resources.split(",") if sub_resources else False
+        )
+
+        repo = TaskReadRepository()
+        document: Optional[str] = await repo.get_document(
+            session=session,
+            id=id,
+            fields=TASK_WITH_ACCOUNT_FIELDS if inclide_account else TASK_FIELDS,
+            profile_fields=PROFILE_FIELDS,
+            inclide_account=inclide_account,
+        )
+        if document is None:
+            raise not_found_exception
+
+        return document
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def get_versions(
+        self, sub_resources: str, *, session: AsyncSession, id: int
+    ) -> List[Optional[datetime]]:
+        """タスク(およびサブリソース)の更新日時取得"""
+        inclide_account = (
+            "account" in sub_resources.split(",") if sub_resources else False
+        )
+
+        repo = TaskRepository()
+        versions = await repo.get_modified_at(
+            session=session, id=id, inclide_account=inclide_account
+        )
+        if not versions:
+            raise not_found_exception
+
+        return list(versions)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def stats(self, live: bool, *, session: AsyncSession) -> TaskStats:
+        """タスク集計"""
+        repo = TaskRepository()
+        rows = await repo.stats(session=session, live=live)
+
+        by_status = {status: 0 for status in TaskStatus.list()}
+        by_asaignee = []
+        by_significant = []
+        count, overdue = 0, 0
+        for row in rows:
+            if row.grouping == GROUPING_STATUS:
+                by_status[row.status] = row.task_count
+            elif row.grouping == GROUPING_ASAIGNEE:
+                by_asaignee.append(
+                    {"asaignee_id": row.asaignee_id, "count": row.task_count}
+                )
+            elif row.grouping == GROUPING_SIGNIFICANT:
+                by_significant.append(
+                    {"is_significant": row.is_significant, "count": row.task_count}
+                )
+            elif row.grouping == GROUPING_TOTAL:
+                count, overdue = row.task_count, row.overdue
+
+        return TaskStats(
+            count=count,
+            overdue=overdue,
+            by_status=[{"status": k, "count": v} for k, v in by_status.items()],
+            by_asaignee=sorted(
+                by_asaignee, key=lambda v: (v["asaignee_id"] is None, v["asaignee_id"])
+            ),
+            by_significant=sorted(by_significant, key=lambda v: v["is_significant"]),
+        )
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def changes(
+        self, since: Optional[str], limit: int, *, session: AsyncSession
+    ) -> Dict[str, Any]:
+        """
+        タスク差分取得(カーソル以降に登録/更新されたタスクと削除されたタスクのID)。
+        更新日時/削除日時はトランザクションの開始日時のため、実行中のトランザクションの
+        開始日時以降(およびSYNC_SETTLE_SECONDS秒の猶予)の更新は次回以降の取得対象とする
+        (長時間のトランザクションがカーソルより前の日時でコミットする場合の取りこぼし防止)。
+        """
+        repo = TaskReadRepository()
+        until: datetime = await repo.settled_timestamp(session=session)
+        until -= timedelta(seconds=SYNC_SETTLE_SECONDS)
+
+        if since is None:
+            # 初回は全タスクを対象とし、削除記録は現時点以降のみを対象とする
+            cursor = ChangeCursor(EPOCH, 0, until, MAX_ID)
+        else:
+            try:
+                cursor = ChangeCursor.parse(since)
+            except ValueError:
+                raise invalid_cursor_exception
+            horizon = until - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+            if cursor.deleted_at < horizon:
+                raise expired_cursor_exception
+
+        tasks: List[RowMapping] = await repo.get_changes(
+            session=session,
+            modified_at=cursor.modified_at,
+            id=cursor.id,
+            until=until,
+            limit=limit + 1,
+        )
+        tombstones: List[RowMapping] = await repo.get_tombstones(
+            session=session,
+            deleted_at=cursor.deleted_at,
+            id=cursor.deleted_id,
+            until=until,
+            limit=limit + 1,
+        )
+
+        more_tasks, more_tombstones = len(tasks) > limit, len(tombstones) > limit
+        tasks, tombstones = tasks[:limit], tombstones[:limit]
+        task_key = self.next_key(
+            (cursor.modified_at, cursor.id),
+            [(t["modified_at"], t["id"]) for t in tasks],
+            more_tasks,
+            until,
+        )
+        deleted_key = self.next_key(
+            (cursor.deleted_at, cursor.deleted_id),
+            [(t["deleted_at"], t["id"]) for t in tombstones],
+            more_tombstones,
+            until,
+        )
+        return {
+            "tasks": [self.row(task, False) for task in tasks],
+            "deleted": [tombstone["id"] for tombstone in tombstones],
+            "cursor": str(ChangeCursor(*task_key, *deleted_key)),
+            "has_more": more_tasks or more_tombstones,
+        }
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
     async def patch(
-        self, *, session: AsyncSession, id: int, patch_params: TaskUpdate
-    ) -> TaskPublic:
-        """タスク更新"""
+        self,
+        *,
+        session: AsyncSession,
+        id: int,
+        patch_params: TaskUpdate,
+        modified_at: Optional[List[datetime]] = None,
+    ) -> Tuple[TaskPublic, datetime]:
+        """タスク更新(modified_at指定時は更新日時の一致を条件とする)。更新後の更新日時を含む"""
         update_dict = patch_params.dict(exclude_unset=True)
         repo = TaskRepository()
         try:
-            updated_task: td_Task = await repo.update(
-                session=session, id=id, patch_params=update_dict
+            updated_task: Optional[Row] = await repo.update(
+                session=session,
+                id=id,
+                patch_params=update_dict,
+                modified_at=modified_at,
             )
         except IntegrityError as e:
             await session.rollback()
             self.ch_exception_detail(e)
         if not updated_task:
             await session.rollback()
+            if modified_at is not None and await repo.get_modified_at(
+                session=session, id=id
+            ):
+                raise precondition_failed_exception
             raise not_found_exception
 
         await session.commit()
-        await session.refresh(updated_task)
-        return TaskInDB.from_orm(updated_task)
+        result_cache.bump("tasks")
+        return TaskInDB.from_orm(updated_task), updated_task.modified_at
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
@@ -146,6 +417,7 @@ class TaskService:
             raise not_found_exception
 
         await session.commit()
+        result_cache.bump("tasks")
         return TaskInDB.from_orm(deleted_task)
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
@@ -155,7 +427,7 @@ class TaskService:
     ) -> QueryParam:
         try:
             queryParm = QueryParam(
-                columns=td_Task.__table__.columns,
+                columns=TASK_COLUMNS,
                 offset=offset,
                 limit=limit,
                 sort=sort,
@@ -165,26 +437,59 @@ class TaskService:
             raise HTTPException(
                 status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=e.args
             )
+        # 条件式はクエリ形状のキャッシュ対象とし、値はバインドパラメータで渡す
         if filter.title_cn is not None:
-            queryParm.append_filter(td_Task.title.contains(filter.title_cn))
+            queryParm.append_filter(
+                "title_cn",
+                lambda t: t.title.contains(bindparam("title_cn")),
+                title_cn=filter.title_cn,
+            )
         if filter.description_cn is not None:
-            queryParm.append_filter(td_Task.description.contains(filter.description_cn))
+            queryParm.append_filter(
+                "description_cn",
+                lambda t: t.description.contains(bindparam("description_cn")),
+                description_cn=filter.description_cn,
+            )
         if filter.asaignee_id_in is not None:
-            queryParm.append_filter(td_Task.asaignee_id.in_(filter.asaignee_id_in))
+            queryParm.append_filter(
+                "asaignee_id_in",
+                lambda t: t.asaignee_id.in_(
+                    bindparam("asaignee_id_in", expanding=True)
+                ),
+                asaignee_id_in=filter.asaignee_id_in,
+            )
         if filter.asaignee_id_ex is True:
-            queryParm.append_filter(td_Task.asaignee_id.is_not(None))
+            queryParm.append_filter(
+                "asaignee_id_ex:true", lambda t: t.asaignee_id.is_not(None)
+            )
         if filter.asaignee_id_ex is False:
-            queryParm.append_filter(td_Task.asaignee_id.is_(None))
+            queryParm.append_filter(
+                "asaignee_id_ex:false", lambda t: t.asaignee_id.is_(None)
+            )
         if filter.status_in is not None:
-            queryParm.append_filter(td_Task.status.in_(filter.status_in))
+            queryParm.append_filter(
+                "status_in",
+                lambda t: t.status.in_(bindparam("status_in", expanding=True)),
+                status_in=filter.status_in,
+            )
         if filter.is_significant_eq is not None:
             queryParm.append_filter(
-                td_Task.is_significant.is_(filter.is_significant_eq)
+                "is_significant_eq",
+                lambda t: t.is_significant == bindparam("is_significant_eq"),
+                is_significant_eq=filter.is_significant_eq,
             )
         if filter.deadline_from is not None:
-            queryParm.append_filter(td_Task.deadline >= filter.deadline_from)
+            queryParm.append_filter(
+                "deadline_from",
+                lambda t: t.deadline >= bindparam("deadline_from"),
+                deadline_from=filter.deadline_from,
+            )
         if filter.deadline_to is not None:
-            queryParm.append_filter(td_Task.deadline <= filter.deadline_to)
+            queryParm.append_filter(
+                "deadline_to",
+                lambda t: t.deadline <= bindparam("deadline_to"),
+                deadline_to=filter.deadline_to,
+            )
         return queryParm
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
@@ -211,15 +516,41 @@ class TaskService:
         filtered = [x for x in params if x in args]
         return filtered == params
 
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]差分同期の次回キー(続きがある場合は取得した最終行、それ以外は確定済みの日時まで)
+    def next_key(
+        self,
+        since: Tuple[datetime, int],
+        keys: List[Tuple[datetime, int]],
+        more: bool,
+        until: datetime,
+    ) -> Tuple[datetime, int]:
+        if more:
+            return keys[-1]
+        # 時刻の巻き戻りでカーソルが後退しないようにする
+        return max(since, (until, MAX_ID))
+
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
     # [INNER]検索結果からレスポンスモデルを構築する
     def result(
-        self, task: Tuple[td_Task, ac_Profile, ac_Profile], inclide_account: bool
+        self, task: RowMapping, inclide_account: bool
     ) -> Union[TaskPublic, TaskWithAccount]:
         if inclide_account:
-            result = TaskWithAccount.from_orm(task[0])
-            result.registrant = ProfileInDB.from_orm(task[1]) if task[1] else None
-            result.asaignee = ProfileInDB.from_orm(task[2]) if task[2] else None
-            return result
+            return TaskWithAccount(**self.row(task, inclide_account))
+        else:
+            return TaskInDB(**self.row(task, inclide_account))
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+    # [INNER]検索結果からレスポンス(dict)を構築する(モデルの生成/検証を行わない)
+    def row(self, task: RowMapping, inclide_account: bool) -> Dict[str, Any]:
+        if inclide_account:
+            accounts = {
+                "registrant": profile_row(task, REGISTRANT),
+                "asaignee": profile_row(task, ASAIGNEE),
+            }
+            return {
+                f: accounts[f] if f in accounts else task[f]
+                for f in TASK_WITH_ACCOUNT_FIELDS
+            }
         else:
-            return TaskInDB.from_orm(task[0])
+            return {f: task[f] for f in TASK_FIELDS}
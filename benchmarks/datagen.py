@@ -0,0 +1,462 @@
+#!/usr/bin/python3
+# datagen.py
+"""
+ベンチマーク用データの生成(本番規模のアカウント/タスク/監視タスクをCOPYで投入する)。
+
+    python -m benchmarks.datagen --accounts 20000 --tasks 1000000 --watches 500000 \\
+        --assignee-skew 1.1 --status-mix TODO=6,DOING=3,DONE=1 --deadline-days -30 180
+
+- DBは設定(.env)の接続先を使用する。生成するデータはアカウントIDがLで始まるデータで、
+  実行前に既存の生成データを削除する(他のデータには触れない)
+- パスワードのハッシュは全アカウントで共用する(bcryptは1回のみ)
+- 投入中は対象テーブルのユーザートリガー(集計/更新通知)を無効化し、投入後に
+  集計テーブルを再集計、更新通知はTRUNCATE相当を1件ずつ送信する(キャッシュの全件無効化)
+- 投入は1トランザクションで行う(投入中は対象テーブルが排他ロックされる)
+"""
+
+import argparse
+import csv
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import route_settings
+from app.core.database import SyncCon
+from app.core.notify import CHANNEL
+from app.models.segment_values import AccountTypes, TaskStatus
+from app.services import auth_service
+
+# 生成するアカウント(IDはL+36進数4桁)
+ACCOUNT_PREFIX = "L"
+ACCOUNT_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+MAX_ACCOUNTS = len(ACCOUNT_DIGITS) ** 4 - 1
+PASSWORD = "benchPassword"
+
+# タイトル/内容/ノートに使用する語句(部分一致検索の条件にも使用する)
+WORDS = ["宿題", "掃除", "買い物", "会議", "資料", "報告", "点検", "予約", "申請", "整理"]
+
+# ユーザートリガーを無効化するテーブル
+TABLES = ["todo.tasks", "todo.watcher", "account.profiles", "account.authes"]
+
+# アカウントを参照するタスクのカラム
+FOREIGN_KEYS = ["registrant_id", "asaignee_id"]
+
+# COPYの1回あたりの行数
+COPY_CHUNK = 50000
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class DatasetSpec(NamedTuple):
+    """生成するデータの件数と分布"""
+
+    accounts: int = 1000
+    tasks: int = 100000
+    watches: int = 50000
+    # アカウント種別/アクティベートの割合
+    admin_rate: float = 0.1
+    inactive_rate: float = 0.05
+    # 担当者の偏り(Zipf分布の指数。0で一様)と未割当の割合
+    assignee_skew: float = 1.1
+    unassigned_rate: float = 0.2
+    # ステータスの比率(ステータス=重み)と重要タスクの割合
+    status_mix: Dict[str, float] = {"TODO": 6, "DOING": 3, "DONE": 1}
+    significant_rate: float = 0.2
+    # 締切日の範囲(今日からの日数)と締切日なしの割合
+    deadline_days: Tuple[int, int] = (-30, 180)
+    no_deadline_rate: float = 0.1
+    # 内容/ノートの文字数の範囲(0文字はNULL)
+    description_length: Tuple[int, int] = (0, 400)
+    note_length: Tuple[int, int] = (0, 200)
+    seed: int = 2210
+
+
+def account_ids(count: int) -> List[str]:
+    """生成するアカウントのID(L0001, L0002, ...)"""
+    if count > MAX_ACCOUNTS:
+        raise ValueError(f"accounts must be <= {MAX_ACCOUNTS}")
+
+    def encode(n: int) -> str:
+        digits = ""
+        for _ in range(4):
+            n, r = divmod(n, len(ACCOUNT_DIGITS))
+            digits = ACCOUNT_DIGITS[r] + digits
+        return ACCOUNT_PREFIX + digits
+
+    return [encode(i) for i in range(1, count + 1)]
+
+
+class TextSource:
+    """指定範囲の文字数の文章(語句を連結した文章からランダムな位置を切り出す)"""
+
+    def __init__(self, rnd: random.Random, length: int = 4096) -> None:
+        words = []
+        while sum(map(len, words)) < length:
+            words.append(rnd.choice(WORDS))
+        self.corpus = "、".join(words)
+
+    def sample(self, rnd: random.Random, bounds: Tuple[int, int]) -> Optional[str]:
+        size = rnd.randint(*bounds)
+        if size <= 0:
+            return None
+        start = rnd.randrange(max(1, len(self.corpus) - size))
+        return self.corpus[start : start + size]
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def profile_rows(
+    spec: DatasetSpec, ids: List[str], rnd: random.Random
+) -> Iterator[Sequence]:
+    for i, id in enumerate(ids, 1):
+        yield (
+            id,
+            f"bench{i:07d}",
+            f"bench{i}@megami-bench.com",
+            "t",
+            AccountTypes.administrator.value
+            if rnd.random() < spec.admin_rate
+            else AccountTypes.general.value,
+            "f" if rnd.random() < spec.inactive_rate else "t",
+        )
+
+
+def auth_rows(ids: List[str], hashed_password: str, solt: str) -> Iterator[Sequence]:
+    for i, id in enumerate(ids, 1):
+        yield (id, f"bench{i}@megami-bench.com", solt, hashed_password)
+
+
+def task_rows(
+    spec: DatasetSpec, ids: List[str], rnd: random.Random
+) -> Iterator[Sequence]:
+    # 担当者: 順位r(アカウントの並びはシャッフル)の重みを1/r^skewとする
+    ranked = rnd.sample(ids, len(ids))
+    cum_weights = list(
+        accumulate(1 / r**spec.assignee_skew for r in range(1, len(ranked) + 1))
+    )
+    statuses, weights = zip(*spec.status_mix.items())
+    today = date.today()
+    deadlines = [
+        (today + timedelta(days=d)).isoformat()
+        for d in range(spec.deadline_days[0], spec.deadline_days[1] + 1)
+    ]
+    source = TextSource(rnd)
+
+    for i in range(1, spec.tasks + 1):
+        yield (
+            rnd.choice(ids),
+            f"bench {rnd.choice(WORDS)} {i}",
+            source.sample(rnd, spec.description_length),
+            None
+            if rnd.random() < spec.unassigned_rate
+            else rnd.choices(ranked, cum_weights=cum_weights)[0],
+            rnd.choices(statuses, weights=weights)[0],
+            "t" if rnd.random() < spec.significant_rate else "f",
+            None if rnd.random() < spec.no_deadline_rate else rnd.choice(deadlines),
+        )
+
+
+def watcher_rows(
+    spec: DatasetSpec, ids: List[str], task_ids: List[int], rnd: random.Random
+) -> Iterator[Sequence]:
+    source = TextSource(rnd)
+    pairs = set()
+    count = min(spec.watches, len(ids) * len(task_ids))
+    while len(pairs) < count:
+        pair = (rnd.choice(ids), rnd.choice(task_ids))
+        if pair in pairs:
+            continue
+        pairs.add(pair)
+        yield (*pair, source.sample(rnd, spec.note_length))
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def copy_rows(
+    con: Connection,
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence],
+    chunk: int = COPY_CHUNK,
+) -> int:
+    """COPY(CSV形式)での投入。Noneは空欄(NULL)として送信する"""
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = con.connection.cursor()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+
+    def flush() -> None:
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        buffer.seek(0)
+        buffer.truncate()
+
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % chunk == 0:
+            flush()
+    if count % chunk:
+        flush()
+    cursor.close()
+    return count
+
+
+def task_ids_of(con: Connection) -> List[int]:
+    return list(
+        con.execute(
+            text("SELECT id FROM todo.tasks WHERE registrant_id LIKE :prefix"),
+            {"prefix": f"{ACCOUNT_PREFIX}%"},
+        ).scalars()
+    )
+
+
+def set_triggers(con: Connection, enabled: bool) -> None:
+    """ユーザートリガー(集計/更新通知/削除記録)の有効化/無効化。外部キーは対象外"""
+    action = "ENABLE" if enabled else "DISABLE"
+    for table in TABLES:
+        con.execute(text(f"ALTER TABLE {table} {action} TRIGGER USER"))
+
+
+def cleanup(con: Connection) -> None:
+    """既存の生成データの削除(削除したタスクは削除記録に登録する)"""
+    prefix = {"prefix": f"{ACCOUNT_PREFIX}%"}
+    con.execute(
+        text(
+            "INSERT INTO todo.task_tombstones (id)"
+            " SELECT id FROM todo.tasks WHERE registrant_id LIKE :prefix"
+            " ON CONFLICT (id) DO UPDATE SET deleted_at = now()"
+        ),
+        prefix,
+    )
+    con.execute(text("DELETE FROM todo.tasks WHERE registrant_id LIKE :prefix"), prefix)
+    # 登録者/担当者(外部キーの参照元)には索引がなく、アカウントの削除時の参照の確認が
+    # アカウントごとのタスクの全件走査になるため、削除の間だけ索引を作成する
+    for column in FOREIGN_KEYS:
+        con.execute(
+            text(f"CREATE INDEX ix_bench_tasks_{column} ON todo.tasks ({column})")
+        )
+    con.execute(
+        text("DELETE FROM account.profiles WHERE account_id LIKE :prefix"), prefix
+    )
+    for column in FOREIGN_KEYS:
+        con.execute(text(f"DROP INDEX todo.ix_bench_tasks_{column}"))
+
+
+def rebuild_task_stats(con: Connection) -> None:
+    """集計テーブルの再集計(トリガー無効化中の増減を反映する)"""
+    con.execute(text("TRUNCATE todo.task_stats, todo.task_deadline_stats"))
+    con.execute(
+        text(
+            "INSERT INTO todo.task_stats"
+            " (status, asaignee_id, is_significant, task_count)"
+            " SELECT status, asaignee_id, is_significant, count(*)"
+            " FROM todo.tasks"
+            " GROUP BY status, asaignee_id, is_significant"
+        )
+    )
+    con.execute(
+        text(
+            "INSERT INTO todo.task_deadline_stats (deadline, task_count)"
+            " SELECT deadline, count(*)"
+            " FROM todo.tasks"
+            " WHERE status <> 'DONE' AND deadline IS NOT NULL"
+            " GROUP BY deadline"
+        )
+    )
+
+
+def notify_reload(con: Connection) -> None:
+    """対象テーブルの更新通知(TRUNCATE相当。購読者はキャッシュを全件無効化する)"""
+    for table in TABLES:
+        schema, name = table.split(".")
+        con.execute(
+            text(
+                "SELECT pg_notify(:channel, json_build_object("
+                "'schema', :schema, 'table', :table, 'op', 'TRUNCATE',"
+                " 'keys', '{}'::json)::text)"
+            ),
+            {"channel": CHANNEL, "schema": schema, "table": name},
+        )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def generate(engine: Engine, spec: DatasetSpec) -> Dict[str, Tuple[int, float]]:
+    """データの生成と投入。処理ごとの件数/処理時間(秒)を返却する"""
+    rnd = random.Random(spec.seed)
+    ids = account_ids(spec.accounts)
+    hashed_password, solt = auth_service.create_hash_password(PASSWORD)
+    timings: Dict[str, Tuple[int, float]] = {}
+
+    @contextmanager
+    def step(name: str) -> Iterator[List[int]]:
+        started = time.perf_counter()
+        count = [0]
+        yield count
+        timings[name] = (count[0], time.perf_counter() - started)
+
+    with engine.begin() as con:
+        set_triggers(con, enabled=False)
+        with step("cleanup"):
+            cleanup(con)
+        with step("account.profiles") as count:
+            count[0] = copy_rows(
+                con,
+                "account.profiles",
+                [
+                    "account_id",
+                    "user_name",
+                    "email",
+                    "verified_email",
+                    "account_type",
+                    "is_active",
+                ],
+                profile_rows(spec, ids, rnd),
+            )
+        with step("account.authes") as count:
+            count[0] = copy_rows(
+                con,
+                "account.authes",
+                ["account_id", "email", "solt", "password"],
+                auth_rows(ids, hashed_password, solt),
+            )
+        with step("todo.tasks") as count:
+            count[0] = copy_rows(
+                con,
+                "todo.tasks",
+                [
+                    "registrant_id",
+                    "title",
+                    "description",
+                    "asaignee_id",
+                    "status",
+                    "is_significant",
+                    "deadline",
+                ],
+                task_rows(spec, ids, rnd),
+            )
+        with step("todo.watcher") as count:
+            count[0] = copy_rows(
+                con,
+                "todo.watcher",
+                ["watcher_id", "task_id", "note"],
+                watcher_rows(spec, ids, task_ids_of(con), rnd),
+            )
+        with step("todo.task_stats"):
+            rebuild_task_stats(con)
+        set_triggers(con, enabled=True)
+        notify_reload(con)
+        with step("analyze"):
+            for table in [*TABLES, "todo.task_stats", "todo.task_deadline_stats"]:
+                con.execute(text(f"ANALYZE {table}"))
+    return timings
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    default = DatasetSpec()
+    parser = argparse.ArgumentParser(description="megami2210 dataset generator")
+    parser.add_argument("--accounts", type=int, default=default.accounts, help="アカウント数")
+    parser.add_argument("--tasks", type=int, default=default.tasks, help="タスク数")
+    parser.add_argument("--watches", type=int, default=default.watches, help="監視タスク数")
+    parser.add_argument(
+        "--admin-rate", type=float, default=default.admin_rate, help="管理ユーザーの割合"
+    )
+    parser.add_argument(
+        "--inactive-rate",
+        type=float,
+        default=default.inactive_rate,
+        help="未アクティベートの割合",
+    )
+    parser.add_argument(
+        "--assignee-skew",
+        type=float,
+        default=default.assignee_skew,
+        help="担当者の偏り(Zipf分布の指数。0で一様)",
+    )
+    parser.add_argument(
+        "--unassigned-rate",
+        type=float,
+        default=default.unassigned_rate,
+        help="担当者なしの割合",
+    )
+    parser.add_argument(
+        "--status-mix",
+        default=",".join(f"{k}={v:g}" for k, v in default.status_mix.items()),
+        help="ステータス=重み",
+    )
+    parser.add_argument(
+        "--significant-rate",
+        type=float,
+        default=default.significant_rate,
+        help="重要タスクの割合",
+    )
+    parser.add_argument(
+        "--deadline-days",
+        type=int,
+        nargs=2,
+        default=default.deadline_days,
+        help="締切日の範囲(今日からの日数)",
+    )
+    parser.add_argument(
+        "--no-deadline-rate",
+        type=float,
+        default=default.no_deadline_rate,
+        help="締切日なしの割合",
+    )
+    parser.add_argument(
+        "--description-length",
+        type=int,
+        nargs=2,
+        default=default.description_length,
+        help="内容の文字数の範囲",
+    )
+    parser.add_argument(
+        "--note-length",
+        type=int,
+        nargs=2,
+        default=default.note_length,
+        help="ノートの文字数の範囲",
+    )
+    parser.add_argument("--seed", type=int, default=default.seed, help="乱数のシード")
+    return parser.parse_args(argv)
+
+
+def spec_of(args: argparse.Namespace) -> DatasetSpec:
+    status_mix = route_settings(args.status_mix.split(","), float)
+    unknown = [v for v in status_mix if v not in TaskStatus.list()]
+    if unknown:
+        raise SystemExit(f"unknown status: {', '.join(unknown)}")
+    return DatasetSpec(
+        **{
+            name: tuple(value) if isinstance(value, list) else value
+            for name, value in vars(args).items()
+            if name in DatasetSpec._fields and name != "status_mix"
+        },
+        status_mix=status_mix,
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    spec = spec_of(parse_args())
+    engine = SyncCon().engine(echo=False)
+    started = time.perf_counter()
+    timings = generate(engine, spec)
+    engine.dispose()
+    for name, (count, seconds) in timings.items():
+        print(f"{name:<20}{count:>10}{seconds:>10.1f}s")
+    print(f"{'(total)':<20}{'':>10}{time.perf_counter() - started:>10.1f}s")
@@ -0,0 +1,397 @@
+#!/usr/bin/python3
+# loadtest.py
+"""
+負荷試験(シナリオの組み合わせでAPIを呼び出し、ルート名ごとのスループット/レイテンシを計測する)。
+
+    python -m benchmarks.loadtest --accounts 200 --tasks 20000 --duration 60 \\
+        --concurrency 32 --mix login=1,search=6,watch=2,patch=1 --output bench.json
+
+- 既定はアプリ(app.api.server.app)をプロセス内で呼び出す(--base-urlで起動済みのサーバー)
+- DBは設定(.env)の接続先を使用する。試験用データ(アカウントIDがLで始まるデータ)は
+  実行前にbenchmarks.datagenで作り直す(--no-seedで既存のデータを使用する)
+- 結果はJSONで出力し、--baselineで指定した前回の結果との差分を表示する
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+
+from httpx import AsyncClient, Limits
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.api.schemas.accounts import ProfileInDB
+from app.core.config import API_PREFIX, route_settings
+from app.core.database import SyncCon
+from app.models.segment_values import AccountTypes, TaskStatus
+from app.services import auth_service
+from benchmarks.datagen import (
+    ACCOUNT_PREFIX,
+    PASSWORD,
+    WORDS,
+    DatasetSpec,
+    generate,
+    task_ids_of,
+)
+
+# シナリオの既定の組み合わせ(シナリオ名=重み)
+DEFAULT_MIX = "login=1,search=6,watch=2,patch=1"
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def load_dataset(engine: Engine) -> Tuple[List[ProfileInDB], List[int]]:
+    """試験用のアカウント(アクティベート済み)/タスクIDの取得"""
+    with engine.connect() as con:
+        profiles = [
+            ProfileInDB(**row)
+            for row in con.execute(
+                text(
+                    "SELECT * FROM account.profiles"
+                    " WHERE account_id LIKE :prefix AND is_active"
+                    " ORDER BY account_id"
+                ),
+                {"prefix": f"{ACCOUNT_PREFIX}%"},
+            ).mappings()
+        ]
+        return profiles, task_ids_of(con)
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def percentile(values: List[float], p: float) -> float:
+    """パーセンタイル(最近傍順位法。valuesは昇順)"""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+class Recorder:
+    """ルート名ごとの応答時間/ステータスの記録"""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, route: str, status: int, seconds: float) -> None:
+        self.latencies[route].append(seconds)
+        self.statuses[route][status] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        routes = {
+            route: self.stats(latencies, self.statuses[route], elapsed)
+            for route, latencies in sorted(self.latencies.items())
+        }
+        total = self.stats(
+            [v for latencies in self.latencies.values() for v in latencies],
+            sum(self.statuses.values(), Counter()),
+            elapsed,
+        )
+        return {"routes": routes, "total": total}
+
+    @staticmethod
+    def stats(latencies: List[float], statuses: Counter, elapsed: float) -> dict:
+        latencies = sorted(latencies)
+        ms = [v * 1000 for v in latencies]
+        return {
+            "requests": len(latencies),
+            "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            "errors": sum(n for s, n in statuses.items() if s == 0 or s >= 500),
+            "status": {str(s): n for s, n in sorted(statuses.items())},
+            "mean_ms": round(sum(ms) / len(ms), 2) if ms else 0.0,
+            "p50_ms": round(percentile(ms, 50), 2),
+            "p95_ms": round(percentile(ms, 95), 2),
+            "p99_ms": round(percentile(ms, 99), 2),
+            "max_ms": round(ms[-1], 2) if ms else 0.0,
+        }
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class LoadTest:
+    """シナリオの実行(シナリオはscenario_<名前>メソッド。1回の呼び出しで1回分を実行する)"""
+
+    def __init__(
+        self,
+        client: AsyncClient,
+        profiles: List[ProfileInDB],
+        task_ids: List[int],
+        recorder: Recorder,
+        patch_size: int = 10,
+    ) -> None:
+        self.client = client
+        self.profiles = profiles
+        self.task_ids = task_ids
+        self.recorder = recorder
+        self.patch_size = patch_size
+        # ログインのシナリオ以外はトークンを事前に発行する(bcryptを負荷に含めない)
+        self.tokens = {
+            v.account_id: auth_service.create_token_for_user(account=v)
+            for v in profiles
+        }
+        self.writers = [
+            v.account_id
+            for v in profiles
+            if v.account_type in (AccountTypes.administrator, AccountTypes.general)
+        ]
+
+    async def call(self, route: str, method: str, path: str, **kwargs) -> int:
+        started = time.perf_counter()
+        try:
+            res = await self.client.request(method, API_PREFIX + path, **kwargs)
+            status = res.status_code
+        except Exception:
+            status = 0
+        self.recorder.record(route, status, time.perf_counter() - started)
+        return status
+
+    def auth(self, account_id: str) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[account_id]}"}
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def scenario_login(self, rnd: random.Random) -> None:
+        """ログインの集中(bcryptによるパスワードの照合)"""
+        profile = rnd.choice(self.profiles)
+        await self.call(
+            "mine:login",
+            "POST",
+            "/login",
+            data={"username": profile.account_id, "password": PASSWORD},
+        )
+
+    async def scenario_search(self, rnd: random.Random) -> None:
+        """条件/サブリソースの組み合わせでのタスク検索"""
+        filters: Dict[str, Any] = {}
+        if rnd.random() < 0.5:
+            filters["title_cn"] = rnd.choice(WORDS)
+        if rnd.random() < 0.4:
+            filters["status_in"] = rnd.sample(TaskStatus.list(), rnd.randint(1, 2))
+        if rnd.random() < 0.3:
+            asaignees = rnd.sample(self.profiles, min(3, len(self.profiles)))
+            filters["asaignee_id_in"] = [v.account_id for v in asaignees]
+        if rnd.random() < 0.2:
+            start = date.today() + timedelta(days=rnd.randint(-30, 90))
+            filters["deadline_from"] = start.isoformat()
+            filters["deadline_to"] = (start + timedelta(days=30)).isoformat()
+        params: Dict[str, Any] = {"limit": rnd.choice([10, 50, 100])}
+        if rnd.random() < 0.5:
+            params["sub-resources"] = "account"
+        if rnd.random() < 0.3:
+            params["sort"] = rnd.choice(["-id", "+deadline", "-deadline,+id"])
+        await self.call(
+            "tasks:search",
+            "POST",
+            "/tasks/search",
+            params=params,
+            json=filters,
+            headers=self.auth(rnd.choice(self.profiles).account_id),
+        )
+
+    async def scenario_watch(self, rnd: random.Random) -> None:
+        """監視タスクの登録/取得/解除"""
+        headers = self.auth(rnd.choice(self.profiles).account_id)
+        id = rnd.choice(self.task_ids)
+        await self.call(
+            "mine:put-watch-task",
+            "PUT",
+            f"/mine/watch-tasks/{id}/",
+            json={"note": "bench"},
+            headers=headers,
+        )
+        await self.call(
+            "mine:get-watch-tasks", "GET", "/mine/watch-tasks/", headers=headers
+        )
+        await self.call(
+            "mine:delete-watch-task",
+            "DELETE",
+            f"/mine/watch-tasks/{id}/",
+            headers=headers,
+        )
+
+    async def scenario_patch(self, rnd: random.Random) -> None:
+        """タスクの一括更新(バッチ)"""
+        deadline = date.today() + timedelta(days=rnd.randint(1, 180))
+        ids = rnd.sample(self.task_ids, min(self.patch_size, len(self.task_ids)))
+        requests = [
+            {
+                "method": "PATCH",
+                "path": f"/tasks/{id}/",
+                "body": {
+                    "status": rnd.choice(TaskStatus.list()),
+                    "deadline": deadline.isoformat(),
+                },
+            }
+            for id in ids
+        ]
+        await self.call(
+            "batch:run",
+            "POST",
+            "/batch",
+            json={"requests": requests},
+            headers=self.auth(rnd.choice(self.writers)),
+        )
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    async def run(
+        self, mix: Dict[str, int], concurrency: int, duration: float, seed: int
+    ) -> float:
+        """concurrency並列でduration秒間シナリオを実行し、経過時間を返却する"""
+        scenarios: List[Callable[[random.Random], Coroutine]] = [
+            getattr(self, f"scenario_{name}") for name in mix
+        ]
+        weights = list(mix.values())
+        deadline = time.monotonic() + duration
+
+        async def worker(n: int) -> None:
+            rnd = random.Random(seed + n)
+            while time.monotonic() < deadline:
+                await rnd.choices(scenarios, weights=weights)[0](rnd)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        return time.monotonic() - started
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """前回の結果との差分(スループット/p95/p99の変化率)"""
+
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "-"
+
+    lines = []
+    for route, stats in report["routes"].items():
+        old = baseline["routes"].get(route)
+        if old is None:
+            lines.append(f"{route}: (new)")
+            continue
+        lines.append(
+            f"{route}: throughput {change(stats['throughput'], old['throughput'])}"
+            f", p95 {change(stats['p95_ms'], old['p95_ms'])}"
+            f", p99 {change(stats['p99_ms'], old['p99_ms'])}"
+        )
+    return lines
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    header = f"{'route':<26}{'req':>8}{'rps':>9}{'err':>6}"
+    header += f"{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(header)
+    for route, v in [*report["routes"].items(), ("(total)", report["total"])]:
+        print(
+            f"{route:<26}{v['requests']:>8}{v['throughput']:>9.1f}{v['errors']:>6}"
+            f"{v['p50_ms']:>9.1f}{v['p95_ms']:>9.1f}{v['p99_ms']:>9.1f}"
+        )
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    mix = route_settings(args.mix.split(","), int)
+    unknown = [name for name in mix if not hasattr(LoadTest, f"scenario_{name}")]
+    if unknown:
+        raise SystemExit(f"unknown scenario: {', '.join(unknown)}")
+
+    engine = SyncCon().engine(echo=False)
+    if not args.no_seed:
+        spec = DatasetSpec(
+            accounts=args.accounts,
+            tasks=args.tasks,
+            watches=args.watches,
+            seed=args.seed,
+        )
+        generate(engine, spec)
+    profiles, task_ids = load_dataset(engine)
+    engine.dispose()
+    if not profiles or not task_ids:
+        raise SystemExit("no dataset. run without --no-seed.")
+
+    if args.base_url:
+        client = AsyncClient(
+            base_url=args.base_url,
+            timeout=args.timeout,
+            limits=Limits(max_connections=args.concurrency),
+        )
+    else:
+        from app.api.server import app
+
+        client = AsyncClient(app=app, base_url="http://bench", timeout=args.timeout)
+
+    recorder = Recorder()
+    async with client:
+        test = LoadTest(client, profiles, task_ids, recorder, args.patch_size)
+        if args.warmup:
+            await test.run(mix, args.concurrency, args.warmup, args.seed)
+            recorder = test.recorder = Recorder()
+        elapsed = await test.run(mix, args.concurrency, args.duration, args.seed)
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "target": args.base_url or "in-process",
+            "accounts": len(profiles),
+            "tasks": len(task_ids),
+            "mix": mix,
+            "concurrency": args.concurrency,
+            "duration": round(elapsed, 2),
+        },
+        **recorder.summary(elapsed),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="megami2210 load test")
+    parser.add_argument("--base-url", help="起動済みのサーバー(未指定時はプロセス内)")
+    parser.add_argument("--accounts", type=int, default=100, help="試験用アカウント数")
+    parser.add_argument("--tasks", type=int, default=5000, help="試験用タスク数")
+    parser.add_argument("--watches", type=int, default=2000, help="監視タスク数")
+    parser.add_argument("--no-seed", action="store_true", help="既存のデータを使用する")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="シナリオ名=重み")
+    parser.add_argument("--concurrency", type=int, default=16, help="並列数")
+    parser.add_argument("--duration", type=float, default=30, help="計測時間(秒)")
+    parser.add_argument("--warmup", type=float, default=5, help="計測前の実行時間(秒)")
+    parser.add_argument("--patch-size", type=int, default=10, help="一括更新の件数")
+    parser.add_argument("--timeout", type=float, default=60, help="リクエストのタイムアウト(秒)")
+    parser.add_argument("--seed", type=int, default=2210, help="乱数のシード")
+    parser.add_argument("--output", help="結果(JSON)の出力先")
+    parser.add_argument("--baseline", help="比較する前回の結果(JSON)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    args = parse_args()
+    report = asyncio.run(main(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print("\n".join(compare(report, json.load(f))))
@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+# micro.py
+"""
+マイクロベンチマーク(検索条件の構築/レスポンスの構築/トークンの発行・検証の1回あたりの処理時間)。
+
+    python -m benchmarks.micro --output micro.json           # 基準値の保存
+    python -m benchmarks.micro --baseline micro.json         # 基準値との比較
+
+- DBへの問い合わせは行わず、検索結果の行は擬似データを使用する
+  (サービスの読み込み時のテーブル定義の取得のみDBに接続する)
+- 各ベンチマークは自動で調整した回数の実行を繰り返し、最速の1回あたりの処理時間で比較する
+- --baselineで指定した基準値から--threshold(既定20%)を超えて遅くなった場合は終了コード1
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import timeit
+from datetime import date, datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.api.schemas.accounts import ProfileInDB
+from app.api.schemas.tasks import TaskFilter, TaskInDB
+from app.models.segment_values import AccountTypes, TaskStatus
+from app.repositries.tasks import ASAIGNEE, REGISTRANT
+from app.services import auth_service
+from app.services.accounts import PROFILE_FIELDS, AccountService
+from app.services.tasks import TaskService
+from benchmarks.loadtest import git_revision
+
+# ベンチマーク名: 計測する関数(引数無し)を返却する関数
+BENCHMARKS: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+# 既定の許容する処理時間の増加率
+DEFAULT_THRESHOLD = 0.2
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def benchmark(name: str) -> Callable:
+    """ベンチマークの登録(デコレータ)"""
+
+    def register(factory: Callable[[], Callable[[], Any]]) -> Callable:
+        BENCHMARKS[name] = factory
+        return factory
+
+    return register
+
+
+def fake_profile(prefix: str = "") -> Dict[str, Any]:
+    """プロフィールの行(prefix: 結合したプロフィールのカラム名の接頭辞)"""
+    profile = {
+        "account_id": "L0001",
+        "user_name": "bench0000001",
+        "nickname": None,
+        "email": "bench1@megami-bench.com",
+        "account_type": AccountTypes.general,
+        "is_active": True,
+        "verified_email": True,
+        "created_at": datetime(2022, 11, 1, 9, 0),
+        "modified_at": datetime(2022, 11, 1, 9, 0),
+    }
+    return {f"{prefix}{k}": v for k, v in profile.items()}
+
+
+def fake_task(**extra: Any) -> Dict[str, Any]:
+    """タスクの行(extra: 結合したテーブルのカラム)"""
+    return {
+        "id": 1,
+        "registrant_id": "L0001",
+        "title": "bench 会議 1",
+        "description": "会議、資料、報告" * 10,
+        "asaignee_id": "L0001",
+        "status": TaskStatus.doing,
+        "is_significant": False,
+        "deadline": date(2022, 12, 31),
+        "created_at": datetime(2022, 11, 1, 9, 0),
+        "modified_at": datetime(2022, 11, 1, 9, 0),
+        **extra,
+    }
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@benchmark("TaskService.New_QueryParam")
+def query_param() -> Callable[[], Any]:
+    service = TaskService()
+    filter = TaskFilter(
+        title_cn="会議",
+        asaignee_id_in=["L0001", "L0002", "L0003"],
+        status_in=[TaskStatus.todo, TaskStatus.doing],
+        deadline_from=date(2022, 12, 1),
+        deadline_to=date(2022, 12, 31),
+    )
+    return lambda: service.New_QueryParam(
+        offset=0, limit=50, sort="-deadline,+id", filter=filter
+    )
+
+
+@benchmark("TaskService.result")
+def task_result() -> Callable[[], Any]:
+    service = TaskService()
+    row = fake_task()
+    return lambda: service.result(row, False)
+
+
+@benchmark("TaskService.result[account]")
+def task_result_with_account() -> Callable[[], Any]:
+    service = TaskService()
+    row = fake_task(**fake_profile(REGISTRANT), **fake_profile(ASAIGNEE))
+    return lambda: service.result(row, True)
+
+
+@benchmark("TaskInDB.from_orm")
+def task_from_orm() -> Callable[[], Any]:
+    task = SimpleNamespace(**fake_task())
+    return lambda: TaskInDB.from_orm(task)
+
+
+@benchmark("AccountService.New_TaskWithWatchNote")
+def task_with_watch_note() -> Callable[[], Any]:
+    service = AccountService()
+    row = fake_task(note="bench")
+    return lambda: service.New_TaskWithWatchNote(row)
+
+
+@benchmark("AuthService.create_token_for_user")
+def create_token() -> Callable[[], Any]:
+    account = ProfileInDB(**{f: fake_profile()[f] for f in PROFILE_FIELDS})
+    return lambda: auth_service.create_token_for_user(account=account)
+
+
+@benchmark("AuthService.get_id_from_token")
+def get_id_from_token() -> Callable[[], Any]:
+    account = ProfileInDB(**{f: fake_profile()[f] for f in PROFILE_FIELDS})
+    token = auth_service.create_token_for_user(account=account)
+    return lambda: auth_service.get_id_from_token(token=token)
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def measure(func: Callable[[], Any], repeat: int = 5) -> Dict[str, Any]:
+    """1回あたりの処理時間(ナノ秒)。1セット0.2秒以上となる回数をrepeatセット実行する"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [v / number * 1e9 for v in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "number": number,
+        "best_ns": round(min(times), 1),
+        "median_ns": round(statistics.median(times), 1),
+    }
+
+
+def run(names: List[str], repeat: int = 5) -> Dict[str, Dict[str, Any]]:
+    return {name: measure(BENCHMARKS[name](), repeat) for name in names}
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[str]:
+    """基準値との比較(最速の処理時間がthresholdを超えて増加したベンチマーク名)"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is not None and result["best_ns"] > old["best_ns"] * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def print_results(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Optional[Dict[str, Dict[str, Any]]] = None,
+    regressions: Sequence[str] = (),
+) -> None:
+    print(f"{'benchmark':<40}{'best':>12}{'median':>12}{'change':>10}")
+    for name, v in results.items():
+        old = (baseline or {}).get(name)
+        change = f"{v['best_ns'] / old['best_ns'] * 100 - 100:+.1f}%" if old else "-"
+        mark = "  REGRESSION" if name in regressions else ""
+        print(
+            f"{name:<40}{v['best_ns'] / 1000:>10.2f}us{v['median_ns'] / 1000:>10.2f}us"
+            f"{change:>10}{mark}"
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="megami2210 micro benchmarks")
+    parser.add_argument("-k", dest="keyword", help="ベンチマーク名に含む文字列")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し数")
+    parser.add_argument("--output", help="結果(JSON。基準値として使用する)の出力先")
+    parser.add_argument("--baseline", help="比較する基準値(JSON)")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="許容する処理時間の増加率(0.2で20%%)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(args: argparse.Namespace) -> int:
+    names = [name for name in BENCHMARKS if not args.keyword or args.keyword in name]
+    results = run(names, args.repeat)
+
+    baseline = None
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+    print_results(results, baseline, regressions)
+
+    if args.output:
+        report = {
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main(parse_args()))
@@ -2,6 +2,7 @@
 # conftest.py
 
 
+import asyncio
 import os
 
 import alembic
@@ -14,8 +15,16 @@ from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.schemas.accounts import AccountCreate, ProfileInDB, ProfileBaseUpdate
-from app.core.config import ASYNC_DIALECT, JWT_TOKEN_PREFIX, SYNC_DIALECT, db_url
+from app.core.cache import result_cache
+from app.core.config import (
+    ASYNC_DIALECT,
+    JWT_TOKEN_PREFIX,
+    NATIVE_DIALECT,
+    SYNC_DIALECT,
+    db_url,
+)
 from app.core.database import AsyncCon, SyncCon, get_session
+from app.core.notify import ChangeBus
 from app.services import auth_service
 from app.services.accounts import AccountService
 from app.repositries.accounts import AccountRepository
@@ -24,6 +33,7 @@ from app.models.segment_values import AccountTypes
 SERVER = "testDB"
 SYNC_URL = db_url(dialect=SYNC_DIALECT, server=SERVER)
 ASYNC_URL = db_url(dialect=ASYNC_DIALECT, server=SERVER)
+NATIVE_URL = db_url(dialect=NATIVE_DIALECT, server=SERVER)
 
 config = Config("alembic.ini")
 
@@ -34,6 +44,8 @@ def schema() -> None:
     os.environ["CONTAINER_DSN"] = SYNC_URL
     alembic.command.downgrade(config, "base")
     alembic.command.upgrade(config, "head")
+    # DB再作成に合わせてプロセス内キャッシュを破棄
+    result_cache.clear()
 
 
 @pytest.fixture
@@ -50,6 +62,16 @@ def s_engine(schema) -> Engine:
     return con.engine()
 
 
+@pytest_asyncio.fixture
+async def change_bus(schema) -> ChangeBus:
+    # test用DBの更新通知を受信
+    bus = ChangeBus(dsn=NATIVE_URL, enabled=True)
+    await bus.start()
+    await asyncio.wait_for(bus.connected.wait(), timeout=10)
+    yield bus
+    await bus.stop()
+
+
 @pytest.fixture
 def app() -> FastAPI:
     from app.api.server import get_application
@@ -92,7 +114,7 @@ async def provisional_account(
     # アクティベート済（account_type:PROVISIONAL)
     patch_params = ProfileBaseUpdate(account_type=AccountTypes.provisional)
     service = AccountService()
-    account = await service.patch_base_profile(
+    account, _ = await service.patch_base_profile(
         session=session, id=general_account.account_id, patch_params=patch_params
     )
     yield account
@@ -105,7 +127,7 @@ async def admin_account(
     # アクティベート済（account_type:ADMINISTRATOR)
     patch_params = ProfileBaseUpdate(account_type=AccountTypes.administrator)
     service = AccountService()
-    account = await service.patch_base_profile(
+    account, _ = await service.patch_base_profile(
         session=session, id=general_account.account_id, patch_params=patch_params
     )
     yield account
@@ -6,6 +6,7 @@ from typing import List
 import pytest
 import pytest_asyncio
 from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
 from httpx import AsyncClient
 from pandas import DataFrame, read_csv
 from sqlalchemy.engine import Engine
@@ -13,10 +14,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.routing import NoMatchFound
 from starlette.status import (
     HTTP_200_OK,
+    HTTP_304_NOT_MODIFIED,
     HTTP_401_UNAUTHORIZED,
     HTTP_403_FORBIDDEN,
     HTTP_404_NOT_FOUND,
     HTTP_409_CONFLICT,
+    HTTP_412_PRECONDITION_FAILED,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
@@ -27,6 +30,7 @@ from app.api.schemas.accounts import (
     ProfileInDB,
     ProfilePublicList,
 )
+from app.core.cache import result_cache
 from app.models.segment_values import AccountTypes
 from app.services.accounts import AccountService
 from tests.conftest import assert_profile
@@ -377,6 +381,38 @@ class TestGet:
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
+    # 正常ケース(条件付きリクエスト)
+    @pytest.mark.ok
+    async def test_ok_conditional(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        account_for_update: ProfileInDB,
+    ) -> None:
+        url = app.url_path_for("accounts:get-profile", id=account_for_update.account_id)
+        res = await admin_client.get(url)
+        assert res.status_code == HTTP_200_OK
+        etag, last_modified = res.headers["ETag"], res.headers["Last-Modified"]
+
+        res = await admin_client.get(url, headers={"If-None-Match": etag})
+        assert res.status_code == HTTP_304_NOT_MODIFIED
+        res = await admin_client.get(url, headers={"If-Modified-Since": last_modified})
+        assert res.status_code == HTTP_304_NOT_MODIFIED
+
+        res = await admin_client.patch(
+            app.url_path_for(
+                "accounts:patch-profile", id=account_for_update.account_id
+            ),
+            data='{"user_name":"武田信玄"}',
+        )
+        assert res.status_code == HTTP_200_OK
+        res = await admin_client.get(url, headers={"If-None-Match": etag})
+        assert res.status_code == HTTP_200_OK
+        assert res.headers["ETag"] != etag
+        assert res.json()["user_name"] == "武田信玄"
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
     # 異常ケース（アクティベーションエラー）
     @pytest.mark.ng
     async def test_ng_activation(
@@ -473,6 +509,47 @@ class TestPatchProfile:
         expected = account_for_update.copy(update=update_dict)
         assert_profile(actual=updated_account, expected=expected)
 
+    # 正常ケース(If-Matchによる楽観的排他制御)
+    @pytest.mark.ok
+    async def test_ok_if_match(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        account_for_update: ProfileInDB,
+    ) -> None:
+        id = account_for_update.account_id
+        url = app.url_path_for("accounts:get-profile", id=id)
+        patch_url = app.url_path_for("accounts:patch-profile", id=id)
+        res = await admin_client.get(url)
+        etag = res.headers["ETag"]
+
+        res = await admin_client.patch(
+            patch_url, data='{"user_name":"徳川家光"}', headers={"If-Match": etag}
+        )
+        assert res.status_code == HTTP_200_OK
+        new_etag = res.headers["ETag"]
+        res = await admin_client.get(url)
+        assert res.headers["ETag"] == new_etag != etag
+
+        # 不一致(古いETag、他のアカウントのETag)
+        other = app.url_path_for("accounts:get-profile", id="T-901")
+        other_etag = (await admin_client.get(other)).headers["ETag"]
+        version = result_cache.version(("profiles",))
+        for stale in (etag, other_etag):
+            res = await admin_client.patch(
+                patch_url, data='{"user_name":"徳川綱吉"}', headers={"If-Match": stale}
+            )
+            assert res.status_code == HTTP_412_PRECONDITION_FAILED
+        res = await admin_client.patch(
+            app.url_path_for("accounts:patch-profile", id="T-999"),
+            data='{"user_name":"徳川綱吉"}',
+        )
+        assert res.status_code == HTTP_404_NOT_FOUND
+        # 更新しなかった場合はキャッシュを無効化しない
+        assert result_cache.version(("profiles",)) == version
+        res = await admin_client.get(url)
+        assert res.json()["user_name"] == "徳川家光"
+
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
     # 異常ケース（アクティベーションエラー）
@@ -1138,6 +1215,32 @@ class TestSearch:
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
+    # 正常ケース(モデルを経由しないレスポンスがモデルのシリアライズ結果と一致する)
+    @pytest.mark.ok
+    async def test_ok_fast_serialization(
+        self,
+        app: FastAPI,
+        general_client: AsyncClient,
+        import_profile: DataFrame,
+    ) -> None:
+        res = await general_client.post(
+            app.url_path_for("accounts:search-profile"),
+            params={"limit": 1000},
+            data="{}",
+        )
+        assert res.status_code == HTTP_200_OK
+        profiles = res.json()["profiles"]
+        # NULL/列挙値を含むこと
+        assert any(profile["nickname"] is None for profile in profiles)
+        assert {profile["account_type"] for profile in profiles} == {
+            v.value for v in AccountTypes
+        }
+        expected = [jsonable_encoder(ProfileInDB(**v)) for v in profiles]
+        assert [list(v) for v in profiles] == [list(v) for v in expected]
+        assert profiles == expected
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
     # 異常ケース（アクティベーションエラー）
     @pytest.mark.ng
     async def test_ng_activation(
@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+# test_batch.py
+
+import jwt
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.routing import NoMatchFound
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_401_UNAUTHORIZED,
+    HTTP_404_NOT_FOUND,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+from app.core.config import BATCH_MAX_REQUESTS
+from app.core.database import AsyncCon, get_session
+from app.services.accounts import AccountService
+from tests.conftest import ASYNC_URL
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def batch_client(app: FastAPI, admin_client: AsyncClient) -> AsyncClient:
+    # サブリクエストを並行実行するため、リクエストごとにsessionを作成する
+    factory = AsyncCon(url=ASYNC_URL).session()
+
+    async def get_test_session():
+        async with factory() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_test_session
+    yield admin_client
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestRouteExists:
+    async def test_run(self, app: FastAPI, client: AsyncClient) -> None:
+        try:
+            await client.post(app.url_path_for("batch:run"), data="{}")
+        except NoMatchFound:
+            pytest.fail("route not exist")
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestRun:
+
+    # 正常ケース(各サブリクエストのレスポンスが個別に呼び出した場合と一致する)
+    @pytest.mark.ok
+    async def test_ok(
+        self,
+        app: FastAPI,
+        batch_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        res = await batch_client.post(
+            app.url_path_for("tasks:create"), data='{"title": "バッチ"}'
+        )
+        assert res.status_code == HTTP_201_CREATED
+        task_id = res.json()["id"]
+
+        operations = [
+            {"id": "profile", "method": "GET", "path": "/mine/profile"},
+            {"id": "watch", "method": "GET", "path": "/mine/watch-tasks/"},
+            {
+                "id": "search1",
+                "method": "POST",
+                "path": "/tasks/search",
+                "query": {"sub-resources": "account"},
+                "body": {"title_cn": "バッチ"},
+            },
+            {
+                "id": "search2",
+                "method": "POST",
+                "path": "/tasks/search?limit=1",
+                "body": {},
+            },
+            {"id": "missing", "method": "GET", "path": f"/tasks/{task_id + 1}/"},
+        ]
+        expected = [
+            await batch_client.get(app.url_path_for("mine:get-profile")),
+            await batch_client.get(app.url_path_for("mine:get-watch-tasks")),
+            await batch_client.post(
+                app.url_path_for("tasks:search"),
+                params={"sub-resources": "account"},
+                data='{"title_cn": "バッチ"}',
+            ),
+            await batch_client.post(
+                app.url_path_for("tasks:search"), params={"limit": 1}, data="{}"
+            ),
+            await batch_client.get(app.url_path_for("tasks:get", id=task_id + 1)),
+        ]
+
+        # 認証(トークンの検証/アカウントの取得)はバッチで1回のみ
+        decode, get_my_profile = jwt.decode, AccountService.get_my_profile
+        calls = {"decode": 0, "profile": 0}
+
+        def counted_decode(*args, **kwargs):
+            calls["decode"] += 1
+            return decode(*args, **kwargs)
+
+        async def counted_get_my_profile(*args, **kwargs):
+            calls["profile"] += 1
+            return await get_my_profile(*args, **kwargs)
+
+        monkeypatch.setattr(jwt, "decode", counted_decode)
+        monkeypatch.setattr(AccountService, "get_my_profile", counted_get_my_profile)
+
+        res = await batch_client.post(
+            app.url_path_for("batch:run"), json={"requests": operations}
+        )
+        assert res.status_code == HTTP_200_OK
+        # アカウントの取得はバッチの権限確認と/mine/profileの取得結果のみ
+        assert calls == {"decode": 1, "profile": 2}
+
+        responses = res.json()["responses"]
+        assert [r["id"] for r in responses] == [op["id"] for op in operations]
+        for actual, exp in zip(responses, expected):
+            assert actual["status"] == exp.status_code
+            assert actual["body"] == exp.json()
+        assert responses[-1]["status"] == HTTP_404_NOT_FOUND
+        assert responses[0]["headers"]["etag"] == expected[0].headers["etag"]
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース(未認証)
+    @pytest.mark.ng
+    async def test_ng_not_authenticated(
+        self, app: FastAPI, client: AsyncClient
+    ) -> None:
+        res = await client.post(
+            app.url_path_for("batch:run"),
+            json={"requests": [{"method": "GET", "path": "/mine/profile"}]},
+        )
+        assert res.status_code == HTTP_401_UNAUTHORIZED
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース(リクエスト不正)
+    @pytest.mark.parametrize(
+        "requests",
+        [
+            [],
+            [{"method": "GET", "path": "/mine/profile"}] * (BATCH_MAX_REQUESTS + 1),
+            [{"method": "POST", "path": "/batch", "body": {"requests": []}}],
+            [{"method": "GET", "path": "mine/profile"}],
+            [{"method": "HEAD", "path": "/mine/profile"}],
+        ],
+        ids=["<BODY:requests>:空", "件数超過", "バッチの入れ子", "パス不正", "メソッド不正"],
+    )
+    @pytest.mark.ng
+    async def test_ng_request(
+        self, app: FastAPI, admin_client: AsyncClient, requests: list
+    ) -> None:
+        res = await admin_client.post(
+            app.url_path_for("batch:run"), json={"requests": requests}
+        )
+        assert res.status_code == HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+# test_cancellation.py
+
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.status import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
+from starlette.types import Message
+
+from app.api.cancellation import HTTP_499_CLIENT_CLOSED_REQUEST
+from app.core.config import ROUTE_TIMEOUTS
+from app.core.database import AsyncCon, get_session, request_backends
+from app.services.tasks import TaskService
+from tests.conftest import ASYNC_URL
+
+pytestmark = pytest.mark.asyncio
+
+# 実行中のスリープクエリの件数
+SLEEPING = """
+    SELECT count(*) FROM pg_stat_activity
+    WHERE state = 'active' AND query LIKE 'SELECT pg_sleep%'
+"""
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@pytest.fixture
+def app_session(app: FastAPI, client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    # リクエストごとにアプリのsession(get_session)を使用する
+    # ※文のタイムアウトの適用/使用中のDB接続の記録はリクエスト内での接続時に行われる
+    monkeypatch.delitem(app.dependency_overrides, get_session)
+
+
+@pytest.fixture
+def slow_stats(monkeypatch: pytest.MonkeyPatch) -> None:
+    # タスク集計を長時間のクエリに置き換える
+    async def stats(self, live: bool, *, session: AsyncSession) -> None:
+        await session.execute(text("SELECT pg_sleep(10)"))
+
+    monkeypatch.setattr(TaskService, "stats", stats)
+
+
+async def wait_cancelled(s_engine: Engine) -> int:
+    # サーバー側でのクエリのキャンセル完了を待つ
+    for _ in range(50):
+        with s_engine.connect() as con:
+            sleeping = con.execute(text(SLEEPING)).scalar()
+        if sleeping == 0:
+            break
+        await asyncio.sleep(0.1)
+    return sleeping
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestTrackBackend:
+
+    # 正常ケース(チェックアウト中の接続のみをキャンセルの対象とする)
+    @pytest.mark.ok
+    async def test_ok(self) -> None:
+        backends = set()
+        reset = request_backends.set(backends)
+        engine = AsyncCon(ASYNC_URL).engine(echo=False)
+        try:
+            async with engine.connect() as con:
+                pid = (await con.execute(text("SELECT pg_backend_pid()"))).scalar()
+                assert backends == {(ASYNC_URL, pid)}
+            # 返却済みの接続(プロセスIDは他のセッションで再利用され得る)は除く
+            assert backends == set()
+        finally:
+            request_backends.reset(reset)
+            await engine.dispose()
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestTimeout:
+
+    # 正常ケース(タイムアウト未満の処理はそのまま応答する)
+    @pytest.mark.ok
+    async def test_ok(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setitem(ROUTE_TIMEOUTS, "tasks:stats", 5)
+        res = await admin_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_200_OK
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース(タイムアウト時は実行中のクエリをキャンセルして503)
+    @pytest.mark.ng
+    async def test_ng_timeout(
+        self,
+        app: FastAPI,
+        s_engine: Engine,
+        admin_client: AsyncClient,
+        app_session: None,
+        slow_stats: None,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setitem(ROUTE_TIMEOUTS, "tasks:stats", 0.5)
+        started = time.monotonic()
+        res = await admin_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_503_SERVICE_UNAVAILABLE
+        assert time.monotonic() - started < 5
+        assert await wait_cancelled(s_engine) == 0
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース(文のタイムアウトを超過したクエリは503)
+    @pytest.mark.ng
+    async def test_ng_statement_timeout(
+        self,
+        app: FastAPI,
+        s_engine: Engine,
+        admin_client: AsyncClient,
+        app_session: None,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(
+            "app.api.cancellation.ROUTE_STATEMENT_TIMEOUTS", {"tasks:search": 200}
+        )
+        search = TaskService.search
+
+        async def slow_search(self, *args, session: AsyncSession, **kwargs):
+            await session.execute(text("SELECT pg_sleep(10)"))
+            return await search(self, *args, session=session, **kwargs)
+
+        monkeypatch.setattr(TaskService, "search", slow_search)
+
+        started = time.monotonic()
+        res = await admin_client.post(app.url_path_for("tasks:search"), data="{}")
+        assert res.status_code == HTTP_503_SERVICE_UNAVAILABLE
+        assert time.monotonic() - started < 5
+        assert await wait_cancelled(s_engine) == 0
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestDisconnect:
+
+    # 正常ケース(クライアント切断時は実行中のクエリをキャンセルして499)
+    @pytest.mark.ok
+    async def test_ok(
+        self,
+        app: FastAPI,
+        s_engine: Engine,
+        admin_client: AsyncClient,
+        app_session: None,
+        slow_stats: None,
+    ) -> None:
+        disconnected = asyncio.Event()
+        received = False
+
+        async def receive() -> Message:
+            nonlocal received
+            if received:
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        messages = []
+
+        async def send(message: Message) -> None:
+            messages.append(message)
+
+        path = app.url_path_for("tasks:stats")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("test", 80),
+            "client": ("127.0.0.1", 10000),
+            "root_path": "",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "headers": [
+                (b"host", b"test"),
+                (b"authorization", admin_client.headers["authorization"].encode()),
+            ],
+        }
+
+        started = time.monotonic()
+        request = asyncio.create_task(app(scope, receive, send))
+        await asyncio.sleep(0.5)
+        assert not request.done()
+        disconnected.set()
+        await asyncio.wait_for(request, timeout=5)
+
+        assert time.monotonic() - started < 5
+        assert messages[0]["status"] == HTTP_499_CLIENT_CLOSED_REQUEST
+        assert await wait_cancelled(s_engine) == 0
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# test_datagen.py
+
+from collections import Counter
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.services import auth_service
+from benchmarks.datagen import (
+    MAX_ACCOUNTS,
+    PASSWORD,
+    DatasetSpec,
+    account_ids,
+    generate,
+)
+
+pytestmark = pytest.mark.asyncio
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestAccountIds:
+
+    # 正常ケース(L+36進数4桁)
+    @pytest.mark.ok
+    async def test_ok(self) -> None:
+        ids = account_ids(37)
+        assert ids[:2] == ["L0001", "L0002"]
+        assert ids[9:11] == ["L000A", "L000B"]
+        assert ids[-1] == "L0011"
+        assert account_ids(MAX_ACCOUNTS)[-1] == "LZZZZ"
+
+    # 異常ケース(ID桁数の上限超過)
+    @pytest.mark.ng
+    async def test_ng(self) -> None:
+        with pytest.raises(ValueError):
+            account_ids(MAX_ACCOUNTS + 1)
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestGenerate:
+
+    spec = DatasetSpec(
+        accounts=30,
+        tasks=600,
+        watches=200,
+        assignee_skew=1.5,
+        unassigned_rate=0.1,
+        status_mix={"TODO": 1, "DONE": 1},
+        no_deadline_rate=0.5,
+        seed=1,
+    )
+
+    # 正常ケース(件数/分布、集計テーブルの再集計、トリガーの再有効化)
+    @pytest.mark.ok
+    async def test_ok(self, s_engine: Engine) -> None:
+        # 再実行時は前回の生成データを置き換える
+        generate(s_engine, self.spec)
+        timings = generate(s_engine, self.spec)
+        assert timings["todo.tasks"][0] == 600
+        assert timings["todo.watcher"][0] == 200
+
+        with s_engine.connect() as con:
+            tasks = con.execute(
+                text(
+                    "SELECT asaignee_id, status, deadline FROM todo.tasks"
+                    " WHERE registrant_id LIKE 'L%'"
+                )
+            ).all()
+            assert len(tasks) == 600
+            assert {v.status for v in tasks} == {"TODO", "DONE"}
+            assert 200 < sum(v.deadline is None for v in tasks) < 400
+            # 担当者の偏り(最多の担当者は平均の数倍)
+            counts = Counter(v.asaignee_id for v in tasks if v.asaignee_id)
+            assert counts.most_common(1)[0][1] > 3 * sum(counts.values()) / 30
+
+            assert con.execute(
+                text("SELECT count(*) FROM todo.watcher WHERE watcher_id LIKE 'L%'")
+            ).scalar() == 200
+
+            # 集計テーブルはタスクの集計と一致する
+            group = "status, asaignee_id, is_significant"
+            assert (
+                con.execute(
+                    text(
+                        f"SELECT {group}, count(*) FROM todo.tasks GROUP BY {group}"
+                        f" EXCEPT SELECT {group}, task_count FROM todo.task_stats"
+                    )
+                ).all()
+                == []
+            )
+            assert con.execute(
+                text("SELECT sum(task_count) FROM todo.task_stats")
+            ).scalar() == con.execute(text("SELECT count(*) FROM todo.tasks")).scalar()
+            assert (
+                con.execute(
+                    text(
+                        "SELECT deadline, count(*) FROM todo.tasks"
+                        " WHERE status <> 'DONE' AND deadline IS NOT NULL"
+                        " GROUP BY deadline"
+                        " EXCEPT SELECT deadline, task_count"
+                        " FROM todo.task_deadline_stats"
+                    )
+                ).all()
+                == []
+            )
+
+            disabled = con.execute(
+                text(
+                    "SELECT tgname FROM pg_trigger"
+                    " WHERE NOT tgisinternal AND tgenabled = 'D'"
+                )
+            ).all()
+            assert disabled == []
+
+            password = con.execute(
+                text("SELECT password FROM account.authes WHERE account_id = 'L0001'")
+            ).scalar()
+            assert auth_service.check_password(PASSWORD, password)
@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+# test_debug.py
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_403_FORBIDDEN,
+    HTTP_404_NOT_FOUND,
+    HTTP_409_CONFLICT,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+from app.core.memory import memory_profiler
+from app.core.sampling import StackSampler
+
+pytestmark = pytest.mark.asyncio
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@pytest.fixture
+def enabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("app.api.routes.debug.PROFILE_ENABLED", True)
+
+
+def busy(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+class TestStackSampler:
+
+    # 正常ケース(イベントループのスレッドは実行中のタスクを根元に付与する)
+    @pytest.mark.ok
+    async def test_ok(self) -> None:
+        sampler = StackSampler(0.001)
+        sampler.start()
+        busy(300000)
+        sampler.stop()
+
+        assert sampler.samples > 1
+        lines = sampler.collapsed().splitlines()
+        stacks = {line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1]) for line in lines}
+        assert sum(stacks.values()) >= sampler.samples
+        assert any(
+            "task:TestStackSampler.test_ok" in stack
+            and stack.endswith("tests.test_debug:busy.<locals>.<genexpr>")
+            for stack in stacks
+        )
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestProfile:
+
+    # 正常ケース(collapsed stack形式)
+    @pytest.mark.ok
+    async def test_ok(self, app: FastAPI, admin_client: AsyncClient, enabled) -> None:
+        res = await admin_client.get(
+            app.url_path_for("debug:profile"), params={"seconds": 0.2}
+        )
+        assert res.status_code == HTTP_200_OK
+        assert res.headers["content-type"] == "text/plain; charset=utf-8"
+        assert int(res.headers["x-profile-samples"]) > 0
+        assert all(
+            line.rsplit(" ", 1)[1].isdigit() for line in res.text.splitlines()
+        )
+        assert "MainThread;task:" in res.text
+
+    # 異常ケース
+    ng_params = {
+        "無効": (False, {"seconds": 0.2}, HTTP_404_NOT_FOUND),
+        "採取時間の上限超過": (True, {"seconds": 3600}, HTTP_422_UNPROCESSABLE_ENTITY),
+    }
+
+    @pytest.mark.parametrize(
+        "param", list(ng_params.values()), ids=list(ng_params.keys())
+    )
+    @pytest.mark.ng
+    async def test_ng(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+        param: tuple,
+    ) -> None:
+        monkeypatch.setattr("app.api.routes.debug.PROFILE_ENABLED", param[0])
+        res = await admin_client.get(app.url_path_for("debug:profile"), params=param[1])
+        assert res.status_code == param[2]
+
+    # 異常ケース(管理ユーザー以外)
+    @pytest.mark.ng
+    async def test_ng_permission(
+        self, app: FastAPI, general_client: AsyncClient, enabled
+    ) -> None:
+        res = await general_client.get(
+            app.url_path_for("debug:profile"), params={"seconds": 0.2}
+        )
+        assert res.status_code == HTTP_403_FORBIDDEN
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@pytest.fixture
+def tracing():
+    yield
+    memory_profiler.stop()
+
+
+class TestMemory:
+
+    # 正常ケース(開始から差分の取得、終了まで)
+    @pytest.mark.ok
+    async def test_ok(
+        self, app: FastAPI, admin_client: AsyncClient, enabled, tracing
+    ) -> None:
+        res = await admin_client.post(
+            app.url_path_for("debug:memory-start"), params={"frames": 10}
+        )
+        assert res.status_code == HTTP_200_OK
+        assert res.json()["tracing"] is True
+
+        # 検索(アプリのモジュールでの割り当て)
+        res = await admin_client.post(
+            app.url_path_for("tasks:search"),
+            params={"limit": 100, "sub-resources": "account"},
+            json={},
+        )
+        assert res.status_code == HTTP_200_OK
+
+        res = await admin_client.get(
+            app.url_path_for("debug:memory"), params={"top": 200, "rebase": True}
+        )
+        assert res.status_code == HTTP_200_OK
+        diff = res.json()
+        assert diff["traced"]["peak"] >= diff["traced"]["current"] > 0
+        assert 0 < len(diff["modules"]) <= 200
+        sizes = [module["size_diff"] for module in diff["modules"]]
+        assert sizes == sorted(sizes, reverse=True)
+        modules = {module["module"] for module in diff["modules"]}
+        assert any(module.startswith("app.") for module in modules)
+        site = diff["sites"][0]
+        assert set(site) == {
+            "module",
+            "file",
+            "line",
+            "size_diff",
+            "count_diff",
+            "size",
+            "count",
+        }
+
+        res = await admin_client.post(app.url_path_for("debug:memory-stop"))
+        assert res.status_code == HTTP_200_OK
+        assert memory_profiler.tracing is False
+
+    # 異常ケース
+    ng_params = {
+        "無効": (False, "debug:memory-start", HTTP_404_NOT_FOUND),
+        "未開始": (True, "debug:memory", HTTP_409_CONFLICT),
+    }
+
+    @pytest.mark.parametrize(
+        "param", list(ng_params.values()), ids=list(ng_params.keys())
+    )
+    @pytest.mark.ng
+    async def test_ng(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+        param: tuple,
+    ) -> None:
+        monkeypatch.setattr("app.api.routes.debug.PROFILE_ENABLED", param[0])
+        method = admin_client.post if param[1].endswith("start") else admin_client.get
+        res = await method(app.url_path_for(param[1]))
+        assert res.status_code == param[2]
+
+    # 異常ケース(差分の取得中に計測が終了された)
+    @pytest.mark.ng
+    async def test_ng_stopped(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+        enabled,
+        tracing,
+    ) -> None:
+        res = await admin_client.post(app.url_path_for("debug:memory-start"))
+        assert res.status_code == HTTP_200_OK
+
+        to_thread = asyncio.to_thread
+
+        async def stop_before(func, *args):
+            memory_profiler.stop()
+            return await to_thread(func, *args)
+
+        monkeypatch.setattr("app.api.routes.debug.asyncio.to_thread", stop_before)
+        res = await admin_client.get(app.url_path_for("debug:memory"))
+        assert res.status_code == HTTP_409_CONFLICT
+
+    # 異常ケース(管理ユーザー以外)
+    @pytest.mark.ng
+    async def test_ng_permission(
+        self, app: FastAPI, general_client: AsyncClient, enabled, tracing
+    ) -> None:
+        res = await general_client.post(app.url_path_for("debug:memory-start"))
+        assert res.status_code == HTTP_403_FORBIDDEN
+        assert memory_profiler.tracing is False
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+# test_limits.py
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
+
+from app.api.limits import AdaptiveLimit, route_group
+from app.services.tasks import TaskService
+
+pytestmark = pytest.mark.asyncio
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestRouteGroup:
+
+    # 正常ケースパラメータ
+    valid_params = {
+        "ログイン": ("POST", "/api/login", "login"),
+        "パスワード変更": ("PATCH", "/api/mine/password", "login"),
+        "タスク検索": ("POST", "/api/tasks/search", "search"),
+        "アカウント検索": ("POST", "/api/accounts/search/profile", "search"),
+        "タスク登録": ("POST", "/api/tasks/", "write"),
+        "タスク削除": ("DELETE", "/api/tasks/1/", "write"),
+        "参照系": ("GET", "/api/tasks/1/", None),
+        "バッチ": ("POST", "/api/batch", None),
+        "API外": ("POST", "/docs", None),
+    }
+
+    @pytest.mark.parametrize(
+        "param", list(valid_params.values()), ids=list(valid_params.keys())
+    )
+    @pytest.mark.ok
+    async def test_ok(self, param: tuple) -> None:
+        assert route_group(param[0], param[1]) == param[2]
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestAdaptiveLimit:
+
+    # 正常ケース(レイテンシが安定していれば上限まで拡大する)
+    @pytest.mark.ok
+    async def test_ok_increase(self) -> None:
+        limit = AdaptiveLimit(10, min_limit=1, max_limit=40)
+        for _ in range(200):
+            limit.inflight = int(limit.limit)
+            limit.release(0.01)
+        assert limit.limit == 40
+
+    # 正常ケース(レイテンシが悪化すると縮小する)
+    @pytest.mark.ok
+    async def test_ok_decrease(self) -> None:
+        limit = AdaptiveLimit(40, min_limit=2, max_limit=40)
+        for _ in range(10):
+            limit.inflight = int(limit.limit)
+            limit.release(0.01)
+        for _ in range(200):
+            limit.inflight = int(limit.limit)
+            limit.release(0.5)
+        # 縮小は待ち行列分(上限の平方根)を残した水準で収束する
+        assert limit.limit < 5
+
+    # 正常ケース(負荷が低い間は上限を変更しない)
+    @pytest.mark.ok
+    async def test_ok_idle(self) -> None:
+        limit = AdaptiveLimit(10, min_limit=1, max_limit=40)
+        for rtt in (0.01, 0.5, 0.01):
+            limit.inflight = 1
+            limit.release(rtt)
+        assert limit.limit == 10
+
+    # 正常ケース(失敗時は縮小する)
+    @pytest.mark.ok
+    async def test_ok_dropped(self) -> None:
+        limit = AdaptiveLimit(10, min_limit=1, max_limit=40)
+        limit.inflight = 1
+        limit.release(0.01, dropped=True)
+        assert limit.limit == 9
+        assert limit.inflight == 0
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestConcurrencyLimit:
+
+    # 異常ケース(上限を超えたリクエストは即時に503)
+    @pytest.mark.ng
+    async def test_ng_overload(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        limit = AdaptiveLimit(1, min_limit=1, max_limit=1)
+        app.state.concurrency_limits["search"] = limit
+        entered, release = asyncio.Event(), asyncio.Event()
+        search = TaskService.search
+
+        async def blocking_search(self, *args, **kwargs):
+            entered.set()
+            await release.wait()
+            return await search(self, *args, **kwargs)
+
+        monkeypatch.setattr(TaskService, "search", blocking_search)
+
+        running = asyncio.create_task(
+            admin_client.post(app.url_path_for("tasks:search"), data="{}")
+        )
+        await asyncio.wait_for(entered.wait(), timeout=5)
+
+        res = await admin_client.post(app.url_path_for("tasks:search"), data="{}")
+        assert res.status_code == HTTP_503_SERVICE_UNAVAILABLE
+        assert res.headers["retry-after"] == "1"
+        assert limit.rejected == 1
+
+        # 制限対象外のグループ(参照系)は影響を受けない
+        res = await admin_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_200_OK
+
+        release.set()
+        res = await running
+        assert res.status_code == HTTP_200_OK
+        assert limit.inflight == 0
+
+        res = await admin_client.post(app.url_path_for("tasks:search"), data="{}")
+        assert res.status_code == HTTP_200_OK
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+# test_loadtest.py
+
+import pytest
+
+from benchmarks.loadtest import Recorder, compare, percentile
+
+pytestmark = pytest.mark.asyncio
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestReport:
+
+    # 正常ケース(パーセンタイル)
+    @pytest.mark.parametrize(
+        "param",
+        [(50, 50), (95, 95), (99, 99), (100, 100)],
+        ids=["p50", "p95", "p99", "p100"],
+    )
+    @pytest.mark.ok
+    async def test_ok_percentile(self, param: tuple) -> None:
+        assert percentile([float(v) for v in range(1, 101)], param[0]) == param[1]
+
+    # 正常ケース(ルート名ごとの集計と前回の結果との差分)
+    @pytest.mark.ok
+    async def test_ok_summary(self) -> None:
+        recorder = Recorder()
+        for ms in range(1, 11):
+            recorder.record("tasks:search", 200, ms / 1000)
+        recorder.record("mine:login", 503, 0.5)
+
+        report = recorder.summary(elapsed=2)
+        search = report["routes"]["tasks:search"]
+        assert search["requests"] == 10
+        assert search["throughput"] == 5
+        assert search["errors"] == 0
+        assert search["p50_ms"] == 5
+        assert search["p95_ms"] == 10
+        assert report["routes"]["mine:login"]["status"] == {"503": 1}
+        assert report["total"]["requests"] == 11
+        assert report["total"]["errors"] == 1
+
+        baseline = {
+            "routes": {
+                "tasks:search": {**search, "throughput": 4, "p95_ms": 20, "p99_ms": 0}
+            }
+        }
+        assert compare(report, baseline) == [
+            "mine:login: (new)",
+            "tasks:search: throughput +25.0%, p95 -50.0%, p99 -",
+        ]
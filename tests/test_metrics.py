@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+# test_metrics.py
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK
+
+from app.core.metrics import (
+    CONTENT_TYPE,
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    Registry,
+    queries_per_request,
+    request_latency,
+)
+
+pytestmark = pytest.mark.asyncio
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestRegistry:
+
+    # 正常ケース(Prometheusテキスト形式での出力)
+    @pytest.mark.ok
+    async def test_ok(self) -> None:
+        registry = Registry()
+        counter = registry.register(Counter("c", "counter.", ["route"]))
+        gauge = registry.register(Gauge("g", "gauge."))
+        histogram = registry.register(Histogram("h", "histogram.", buckets=(1, 2)))
+        untyped = registry.register(Metric("u", "untyped."))
+
+        counter.labels('a"b\\').inc()
+        counter.labels('a"b\\').inc(2)
+        gauge.labels().inc()
+        gauge.labels().dec(0.5)
+        for value in (0.5, 1, 1.5, 3):
+            histogram.labels().observe(value)
+        untyped.labels().set(7)
+
+        assert registry.render().splitlines() == [
+            "# HELP c counter.",
+            "# TYPE c counter",
+            'c_total{route="a\\"b\\\\"} 3',
+            "# HELP g gauge.",
+            "# TYPE g gauge",
+            "g 0.5",
+            "# HELP h histogram.",
+            "# TYPE h histogram",
+            'h_bucket{le="1"} 2',
+            'h_bucket{le="2"} 3',
+            'h_bucket{le="+Inf"} 4',
+            "h_sum 6",
+            "h_count 4",
+            "# HELP u untyped.",
+            "# TYPE u untyped",
+            "u 7",
+        ]
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestMetrics:
+
+    # 正常ケース(ルート名ごとの処理時間/SQL文の実行件数)
+    @pytest.mark.ok
+    async def test_ok(self, app: FastAPI, admin_client: AsyncClient) -> None:
+        latency = request_latency.labels("tasks:stats")
+        queries = queries_per_request.labels("tasks:stats")
+        count, total = latency.count, queries.sum
+
+        res = await admin_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_200_OK
+        assert latency.count == count + 1
+        assert queries.sum > total
+
+        res = await admin_client.get(app.url_path_for("metrics"))
+        assert res.status_code == HTTP_200_OK
+        assert res.headers["content-type"] == CONTENT_TYPE
+        lines = res.text.splitlines()
+        route = '{route="tasks:stats"}'
+        assert f"megami_request_duration_seconds_count{route} {count + 1}" in lines
+        assert "megami_requests_in_flight 0" in lines
+        assert 'megami_concurrency_limit{group="login"} 4' in lines
+        for name in (
+            "megami_db_connections_checked_out ",
+            'megami_cache_hit_ratio{cache="result"} ',
+            'megami_cache_hit_ratio{cache="statement"} ',
+            "megami_event_loop_lag_seconds_count ",
+            "megami_event_loop_stalls_total ",
+        ):
+            assert any(line.startswith(name) for line in lines)
+
+        # メトリクス自体は計測対象外
+        assert ("metrics",) not in request_latency.children
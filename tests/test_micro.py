@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+# test_micro.py
+
+import pytest
+
+from benchmarks.micro import BENCHMARKS, compare, measure
+
+pytestmark = pytest.mark.asyncio
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestBenchmarks:
+
+    # 正常ケース(擬似データが現在のスキーマで処理できること)
+    @pytest.mark.parametrize("name", list(BENCHMARKS))
+    @pytest.mark.ok
+    async def test_ok(self, name: str) -> None:
+        assert BENCHMARKS[name]()() is not None
+
+    # 正常ケース(1回あたりの処理時間の計測)
+    @pytest.mark.ok
+    async def test_ok_measure(self) -> None:
+        result = measure(lambda: None, repeat=2)
+        assert result["number"] > 0
+        assert 0 < result["best_ns"] <= result["median_ns"]
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestCompare:
+
+    # 正常ケース(許容する増加率を超えたベンチマークのみ検出する)
+    @pytest.mark.ok
+    async def test_ok(self) -> None:
+        baseline = {"a": {"best_ns": 100.0}, "b": {"best_ns": 100.0}}
+        results = {
+            "a": {"best_ns": 119.0},
+            "b": {"best_ns": 121.0},
+            "c": {"best_ns": 1000.0},
+        }
+        assert compare(results, baseline, 0.2) == ["b"]
+        assert compare(results, baseline, 0.1) == ["a", "b"]
@@ -11,6 +11,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.routing import NoMatchFound
 from starlette.status import (
     HTTP_200_OK,
+    HTTP_304_NOT_MODIFIED,
     HTTP_401_UNAUTHORIZED,
     HTTP_409_CONFLICT,
     HTTP_422_UNPROCESSABLE_ENTITY,
@@ -326,6 +327,27 @@ class TestGetProfile:
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
+    # 正常ケース(条件付きリクエスト)
+    @pytest.mark.ok
+    async def test_ok_conditional(
+        self, app: FastAPI, provisional_client: AsyncClient
+    ) -> None:
+        url = app.url_path_for("mine:get-profile")
+        res = await provisional_client.get(url)
+        assert res.status_code == HTTP_200_OK
+        etag = res.headers["ETag"]
+
+        res = await provisional_client.get(url, headers={"If-None-Match": f"W/{etag}"})
+        assert res.status_code == HTTP_304_NOT_MODIFIED
+        res = await provisional_client.get(url, headers={"If-None-Match": '"0-0"'})
+        assert res.status_code == HTTP_200_OK
+        res = await provisional_client.get(
+            url, headers={"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"}
+        )
+        assert res.status_code == HTTP_200_OK
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
     # 異常ケース（認証エラー）
     @pytest.mark.ng
     async def test_ng_authentication(self, app: FastAPI, client: AsyncClient) -> None:
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+# test_notify.py
+
+import asyncio
+
+import asyncpg
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK, HTTP_201_CREATED
+
+from app.api.schemas.tasks import TaskCreate
+from app.core.cache import result_cache
+from app.core.notify import ChangeBus, ChangeEvent
+
+pytestmark = pytest.mark.asyncio
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestChangeBus:
+
+    # 正常ケース(タスク更新の通知を受信し、キャッシュを無効化する)
+    @pytest.mark.ok
+    async def test_ok(
+        self, app: FastAPI, admin_client: AsyncClient, change_bus: ChangeBus
+    ) -> None:
+        res = await admin_client.post(
+            app.url_path_for("tasks:create"),
+            data=TaskCreate(title="task").json(exclude_unset=True),
+        )
+        assert res.status_code == HTTP_201_CREATED
+        task_id = res.json()["id"]
+
+        events: asyncio.Queue = asyncio.Queue()
+        change_bus.subscribe(events.put_nowait)
+        change_bus.subscribe(result_cache.invalidate)
+        version = result_cache.version(("tasks",))
+
+        res = await admin_client.patch(
+            app.url_path_for("tasks:patch", id=task_id),
+            data='{"description":"changed"}',
+        )
+        assert res.status_code == HTTP_200_OK
+
+        event: ChangeEvent = await asyncio.wait_for(events.get(), timeout=10)
+        assert event == ChangeEvent(
+            schema="todo", table="tasks", op="UPDATE", keys={"id": task_id}
+        )
+        # サービス層と通知の双方でバージョンが進む
+        assert result_cache.version(("tasks",)) == (version[0] + 2,)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(通知の欠落時はキャッシュを全件破棄する)
+    @pytest.mark.ok
+    async def test_ok_gap(self, app: FastAPI, admin_client: AsyncClient) -> None:
+        res = await admin_client.post(app.url_path_for("tasks:search"), data="{}")
+        assert res.status_code == HTTP_200_OK
+        assert result_cache.info()["size"] == 1
+
+        result_cache.invalidate(None)
+        assert result_cache.info()["size"] == 0
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(アプリを複数生成しても購読者を重複して登録しない)
+    @pytest.mark.ok
+    async def test_ok_subscribe_once(self) -> None:
+        from app.api.server import get_application
+        from app.core.notify import change_bus as bus
+
+        get_application()
+        subscribers = list(bus.subscribers)
+        get_application()
+        assert bus.subscribers == subscribers
+        assert bus.subscribers.count(result_cache.invalidate) == 1
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(PostgresError以外の例外でも受信を終了せず再接続する)
+    @pytest.mark.ok
+    async def test_ok_reconnect(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        bus = ChangeBus(enabled=True)
+        calls = []
+
+        async def listen() -> None:
+            calls.append(None)
+            if len(calls) == 1:
+                raise asyncpg.InterfaceError("connection is closed")
+            bus.connected.set()
+            await asyncio.Event().wait()
+
+        monkeypatch.setattr(bus, "_listen", listen)
+        await bus.start()
+        try:
+            await asyncio.wait_for(bus.connected.wait(), timeout=10)
+            assert len(calls) == 2
+        finally:
+            await bus.stop()
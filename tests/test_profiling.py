@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+# test_profiling.py
+
+import pstats
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_401_UNAUTHORIZED,
+    HTTP_403_FORBIDDEN,
+)
+
+pytestmark = pytest.mark.asyncio
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@pytest.fixture
+def enabled(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Path:
+    monkeypatch.setattr("app.api.cancellation.PROFILE_ENABLED", True)
+    monkeypatch.setattr("app.api.profiling.PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+class TestProfile:
+
+    # 正常ケース(集計結果をレスポンスの代わりに返却する)
+    @pytest.mark.ok
+    async def test_ok_inline(
+        self, app: FastAPI, admin_client: AsyncClient, enabled: Path
+    ) -> None:
+        res = await admin_client.get(
+            app.url_path_for("tasks:stats"), headers={"X-Profile": "inline"}
+        )
+        assert res.status_code == HTTP_200_OK
+        assert res.headers["content-type"] == "text/plain; charset=utf-8"
+        assert res.text.startswith("tasks:stats status=200 total=")
+        assert "Ordered by: cumulative time" in res.text
+        assert "stats" in res.text
+
+    # 正常ケース(集計結果をファイルに出力する)
+    @pytest.mark.ok
+    async def test_ok_file(
+        self, app: FastAPI, admin_client: AsyncClient, enabled: Path
+    ) -> None:
+        res = await admin_client.get(
+            app.url_path_for("tasks:stats"), headers={"X-Profile": "file"}
+        )
+        assert res.status_code == HTTP_200_OK
+        assert "by_status" in res.json()
+        artifact = enabled / res.headers["x-profile-artifact"]
+        assert artifact.name.startswith("tasks_stats-")
+        assert pstats.Stats(str(artifact)).total_calls > 0
+
+    # 正常ケース(無効時はヘッダを無視する)
+    @pytest.mark.ok
+    async def test_ok_disabled(self, app: FastAPI, admin_client: AsyncClient) -> None:
+        res = await admin_client.get(
+            app.url_path_for("tasks:stats"), headers={"X-Profile": "inline"}
+        )
+        assert res.status_code == HTTP_200_OK
+        assert "by_status" in res.json()
+        assert "x-profile-artifact" not in res.headers
+
+    # 異常ケース(出力方法の指定誤り)
+    @pytest.mark.ng
+    async def test_ng_mode(
+        self, app: FastAPI, admin_client: AsyncClient, enabled: Path
+    ) -> None:
+        res = await admin_client.get(
+            app.url_path_for("tasks:stats"), headers={"X-Profile": "flame"}
+        )
+        assert res.status_code == HTTP_400_BAD_REQUEST
+
+    # 異常ケース(未認証)
+    @pytest.mark.ng
+    async def test_ng_unauthenticated(
+        self, app: FastAPI, client: AsyncClient, enabled: Path
+    ) -> None:
+        res = await client.get(
+            app.url_path_for("tasks:stats"), headers={"X-Profile": "inline"}
+        )
+        assert res.status_code == HTTP_401_UNAUTHORIZED
+
+    # 異常ケース(管理ユーザー以外)
+    @pytest.mark.ng
+    async def test_ng_permission(
+        self, app: FastAPI, general_client: AsyncClient, enabled: Path
+    ) -> None:
+        res = await general_client.get(
+            app.url_path_for("tasks:stats"), headers={"X-Profile": "inline"}
+        )
+        assert res.status_code == HTTP_403_FORBIDDEN
+        assert list(enabled.iterdir()) == []
@@ -1,14 +1,20 @@
 #!/usr/bin/python3
 # test_tasks.py
 
-from datetime import date
-from typing import List
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from enum import Enum
+from typing import List, Type
 
+import asyncpg
 import pytest
 import pytest_asyncio
 from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
 from httpx import AsyncClient
 from pandas import DataFrame, read_csv
+from pydantic import BaseModel
+from sqlalchemy import select
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.types import DATE
@@ -16,10 +22,13 @@ from starlette.routing import NoMatchFound
 from starlette.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
+    HTTP_304_NOT_MODIFIED,
     HTTP_400_BAD_REQUEST,
     HTTP_401_UNAUTHORIZED,
     HTTP_403_FORBIDDEN,
     HTTP_404_NOT_FOUND,
+    HTTP_410_GONE,
+    HTTP_412_PRECONDITION_FAILED,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
@@ -28,13 +37,20 @@ from app.api.schemas.tasks import (
     TaskCreate,
     TaskInDB,
     TaskPublicList,
+    TaskStats,
     TaskUpdate,
     TaskWithAccount,
 )
+from app.core.cache import result_cache
+from app.core.tracing import QueryBudget
 from app.models.segment_values import TaskStatus
+from app.models.table_models import td_Task, td_WatcherArchive
+from app.repositries import row_fields, statement_cache
 from app.services import auth_service
 from app.services.accounts import AccountService
-from app.services.tasks import TaskService
+from app.services.archives import ArchiveService
+from app.services.tasks import ChangeCursor, TaskService
+from tests.conftest import NATIVE_URL
 
 pytestmark = pytest.mark.asyncio
 
@@ -148,6 +164,18 @@ class TestRouteExists:
         except NoMatchFound:
             pytest.fail("route not exist")
 
+    async def test_changes(self, app: FastAPI, client: AsyncClient) -> None:
+        try:
+            await client.get(app.url_path_for("tasks:changes"))
+        except NoMatchFound:
+            pytest.fail("route not exist")
+
+    async def test_stats(self, app: FastAPI, client: AsyncClient) -> None:
+        try:
+            await client.get(app.url_path_for("tasks:stats"))
+        except NoMatchFound:
+            pytest.fail("route not exist")
+
     async def test_patch(self, app: FastAPI, client: AsyncClient) -> None:
         try:
             await client.get(app.url_path_for("tasks:patch", id=1))
@@ -356,6 +384,97 @@ class TestGet:
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
+    # 正常ケース(条件付きリクエスト)
+    @pytest.mark.ok
+    async def test_ok_conditional(
+        self, app: FastAPI, general_client: AsyncClient, fixed_task: TaskInDB
+    ) -> None:
+        url = app.url_path_for("tasks:get", id=fixed_task.id)
+        res = await general_client.get(url)
+        assert res.status_code == HTTP_200_OK
+        etag, last_modified = res.headers["ETag"], res.headers["Last-Modified"]
+
+        res = await general_client.get(url, headers={"If-None-Match": etag})
+        assert res.status_code == HTTP_304_NOT_MODIFIED
+        assert res.headers["ETag"] == etag
+        assert res.content == b""
+        res = await general_client.get(url, headers={"If-Modified-Since": last_modified})
+        assert res.status_code == HTTP_304_NOT_MODIFIED
+
+        # サブリソース指定時は別のETag
+        res = await general_client.get(
+            url, params={"sub-resources": "account"}, headers={"If-None-Match": etag}
+        )
+        assert res.status_code == HTTP_200_OK
+        account_etag = res.headers["ETag"]
+        assert account_etag != etag
+
+        # 登録者の更新でサブリソース指定時のETagのみ変更
+        res = await general_client.patch(
+            app.url_path_for("mine:patch-profile"), data='{"nickname":"changed"}'
+        )
+        assert res.status_code == HTTP_200_OK
+        res = await general_client.get(url, headers={"If-None-Match": etag})
+        assert res.status_code == HTTP_304_NOT_MODIFIED
+        res = await general_client.get(
+            url,
+            params={"sub-resources": "account"},
+            headers={"If-None-Match": account_etag},
+        )
+        assert res.status_code == HTTP_200_OK
+
+        # タスクの更新で再取得
+        res = await general_client.patch(url, data='{"description":"changed"}')
+        assert res.status_code == HTTP_200_OK
+        res = await general_client.get(url, headers={"If-None-Match": etag})
+        assert res.status_code == HTTP_200_OK
+        assert res.headers["ETag"] != etag
+        assert res.json()["description"] == "changed"
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(DBで生成したレスポンスがアプリでのシリアライズ結果とバイト単位で一致する)
+    @pytest.mark.parametrize(
+        "sub_resources", ["", "account"], ids=["<query:sub-resources>:無し", "account"]
+    )
+    @pytest.mark.ok
+    async def test_ok_db_rendering(
+        self,
+        app: FastAPI,
+        provisional_client: AsyncClient,
+        import_task: DataFrame,
+        monkeypatch: pytest.MonkeyPatch,
+        sub_resources: str,
+    ) -> None:
+        res = await provisional_client.post(
+            app.url_path_for("tasks:search"), params={"limit": 1000}, data="{}"
+        )
+        ids = [task["id"] for task in res.json()["tasks"]]
+        assert ids
+
+        params = {"sub-resources": sub_resources}
+        expected = [
+            await provisional_client.get(
+                app.url_path_for("tasks:get", id=id), params=params
+            )
+            for id in ids
+        ]
+        monkeypatch.setattr("app.api.routes.tasks.DB_RENDERED_ROUTES", ["tasks:get"])
+        for id, exp in zip(ids, expected):
+            res = await provisional_client.get(
+                app.url_path_for("tasks:get", id=id), params=params
+            )
+            assert res.status_code == HTTP_200_OK
+            assert res.content == exp.content
+            assert res.headers["ETag"] == exp.headers["ETag"]
+
+        res = await provisional_client.get(
+            app.url_path_for("tasks:get", id=9999), params=params
+        )
+        assert res.status_code == HTTP_404_NOT_FOUND
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
     # 異常ケース（アクティベーションエラー）
     @pytest.mark.ng
     async def test_ng_activation(
@@ -557,6 +676,142 @@ class TestSearch:
 
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
+    # 正常ケース(同一形状の検索はキャッシュ済みのクエリを再利用する)
+    @pytest.mark.ok
+    async def test_ok_statement_cache(
+        self,
+        app: FastAPI,
+        provisional_client: AsyncClient,
+        import_task: DataFrame,
+    ) -> None:
+        params = {"sort": "-deadline", "sub-resources": "account"}
+        res = await provisional_client.post(
+            app.url_path_for("tasks:search"),
+            params=params,
+            data='{"title_cn": "掃除"}',
+        )
+        assert res.status_code == HTTP_200_OK
+        before = statement_cache.info()
+
+        res = await provisional_client.post(
+            app.url_path_for("tasks:search"),
+            params=params,
+            data='{"title_cn": "宿題"}',
+        )
+        assert res.status_code == HTTP_200_OK
+        after = statement_cache.info()
+        assert after["misses"] == before["misses"]
+        assert after["hits"] == before["hits"] + 3  # 権限確認(アカウント取得)/検索/件数取得
+        # 値はバインドパラメータとして反映されること
+        result = TaskPublicList(**res.json())
+        assert result.count == 4
+        assert [task.id for task in result.tasks] == [3, 4, 1, 2]
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(モデルを経由しないレスポンスがモデルのシリアライズ結果と一致する)
+    @pytest.mark.parametrize(
+        "sub_resources", ["", "account"], ids=["<query:sub-resources>:無し", "account"]
+    )
+    @pytest.mark.ok
+    async def test_ok_fast_serialization(
+        self,
+        app: FastAPI,
+        provisional_client: AsyncClient,
+        import_task: DataFrame,
+        sub_resources: str,
+    ) -> None:
+        res = await provisional_client.post(
+            app.url_path_for("tasks:search"),
+            params={"limit": 1000, "sub-resources": sub_resources},
+            data="{}",
+        )
+        assert res.status_code == HTTP_200_OK
+        model = TaskWithAccount if sub_resources else TaskInDB
+        tasks = res.json()["tasks"]
+        expected = [jsonable_encoder(model(**task)) for task in tasks]
+        assert [list(task) for task in tasks] == [list(task) for task in expected]
+        assert tasks == expected
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(DBで生成したレスポンスがアプリでのシリアライズ結果とバイト単位で一致する)
+    @pytest.mark.parametrize(
+        "params, filter",
+        [
+            ({"limit": 1000}, "{}"),
+            ({"limit": 1000, "sub-resources": "account"}, "{}"),
+            (
+                {
+                    "offset": 2,
+                    "limit": 5,
+                    "sort": "-deadline,+title",
+                    "sub-resources": "account",
+                },
+                '{"status_in": ["TODO", "DOING"]}',
+            ),
+            ({"limit": 1000, "include-archived": True}, "{}"),
+            ({"sub-resources": "account"}, '{"title_cn": "該当無し"}'),
+        ],
+        ids=["サブリソース無し", "account", "条件/ソート/ページング", "アーカイブ含む", "該当無し"],
+    )
+    @pytest.mark.ok
+    async def test_ok_db_rendering(
+        self,
+        app: FastAPI,
+        provisional_client: AsyncClient,
+        import_task: DataFrame,
+        monkeypatch: pytest.MonkeyPatch,
+        params: dict,
+        filter: str,
+    ) -> None:
+        monkeypatch.setattr(result_cache, "enabled", False)
+        url = app.url_path_for("tasks:search")
+        expected = await provisional_client.post(url, params=params, data=filter)
+        assert expected.status_code == HTTP_200_OK
+
+        monkeypatch.setattr("app.api.routes.tasks.DB_RENDERED_ROUTES", ["tasks:search"])
+        res = await provisional_client.post(url, params=params, data=filter)
+        assert res.status_code == HTTP_200_OK
+        assert res.headers["content-type"] == "application/json"
+        assert res.content == expected.content
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(同一条件の検索結果はキャッシュから返却し、タスク更新で無効化する)
+    @pytest.mark.ok
+    async def test_ok_result_cache(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        import_task: DataFrame,
+    ) -> None:
+        url = app.url_path_for("tasks:search")
+        res = await admin_client.post(url, data='{"title_cn": "宿題"}')
+        assert res.status_code == HTTP_200_OK
+        before = result_cache.info()
+
+        res_cached = await admin_client.post(
+            url, params={"sort": "+id"}, data='{"title_cn": "宿題"}'
+        )
+        assert res_cached.status_code == HTTP_200_OK
+        assert res_cached.content == res.content
+        assert result_cache.info()["hits"] == before["hits"] + 1
+
+        res = await admin_client.patch(
+            app.url_path_for("tasks:patch", id=1), data='{"description":"changed"}'
+        )
+        assert res.status_code == HTTP_200_OK
+        res = await admin_client.post(url, data='{"title_cn": "宿題"}')
+        assert res.status_code == HTTP_200_OK
+        assert res.content != res_cached.content
+        result = TaskPublicList(**res.json())
+        assert [task.description for task in result.tasks if task.id == 1] == [
+            "changed"
+        ]
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
     # 異常ケース（アクティベーションエラー）
     @pytest.mark.ng
     async def test_ng_activation(
@@ -728,6 +983,58 @@ class TestSearch:
 # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
 
 
+class PartialStatus(str, Enum):
+    todo = "TODO"
+
+
+class MissingColumn(BaseModel):
+    unknown: str
+
+
+class NullableColumn(BaseModel):
+    description: str
+
+
+class TypeMismatch(BaseModel):
+    title: int
+
+
+class EnumMismatch(BaseModel):
+    status: PartialStatus
+
+
+class TestRowFields:
+
+    # 正常ケース(レスポンス項目はモデルの項目順)
+    @pytest.mark.ok
+    async def test_ok(self) -> None:
+        assert row_fields(TaskInDB, td_Task) == tuple(TaskInDB.__fields__)
+        assert row_fields(
+            TaskWithAccount, td_Task, nested=("registrant", "asaignee")
+        ) == tuple(TaskWithAccount.__fields__)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース(カラムとモデルの項目が整合しない)
+    @pytest.mark.parametrize(
+        "model, message",
+        [
+            (MissingColumn, "column not found"),
+            (NullableColumn, "column is nullable"),
+            (TypeMismatch, "is not compatible"),
+            (EnumMismatch, "enum values mismatch"),
+        ],
+        ids=["カラム無し", "NULL許容", "型", "列挙値"],
+    )
+    @pytest.mark.ng
+    async def test_ng(self, model: Type[BaseModel], message: str) -> None:
+        with pytest.raises(TypeError, match=message):
+            row_fields(model, td_Task)
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
 class TestPatch:
 
     # 正常ケースパラメータ
@@ -767,6 +1074,62 @@ class TestPatch:
         expected = task_for_update.copy(update=update_dict)
         assert updated_task == expected
 
+    # 正常ケース(If-Matchによる楽観的排他制御)
+    @pytest.mark.ok
+    async def test_ok_if_match(
+        self, app: FastAPI, general_client: AsyncClient, task_for_update: TaskInDB
+    ) -> None:
+        url = app.url_path_for("tasks:get", id=task_for_update.id)
+        patch_url = app.url_path_for("tasks:patch", id=task_for_update.id)
+        res = await general_client.get(url)
+        etag = res.headers["ETag"]
+        res = await general_client.get(url, params={"sub-resources": "account"})
+        account_etag = res.headers["ETag"]
+
+        # 一致(更新後のETagは取得時のETagと同じ)
+        res = await general_client.patch(
+            patch_url, data='{"status":"DOING"}', headers={"If-Match": etag}
+        )
+        assert res.status_code == HTTP_200_OK
+        new_etag = res.headers["ETag"]
+        assert new_etag != etag
+        res = await general_client.get(url)
+        assert res.headers["ETag"] == new_etag
+
+        # 不一致(他のユーザーによる更新後の古いETag、サブリソース指定時のETagを含む)
+        for stale in (etag, account_etag, f"W/{new_etag}", '"0-0"'):
+            res = await general_client.patch(
+                patch_url, data='{"status":"DONE"}', headers={"If-Match": stale}
+            )
+            assert res.status_code == HTTP_412_PRECONDITION_FAILED
+        res = await general_client.get(url)
+        assert res.json()["status"] == TaskStatus.doing
+        assert res.headers["ETag"] == new_etag
+
+        # 複数指定、「*」
+        res = await general_client.patch(
+            patch_url,
+            data='{"status":"DONE"}',
+            headers={"If-Match": f"{etag}, {new_etag}"},
+        )
+        assert res.status_code == HTTP_200_OK
+        res = await general_client.patch(
+            patch_url, data='{"status":"TODO"}', headers={"If-Match": "*"}
+        )
+        assert res.status_code == HTTP_200_OK
+
+    # 異常ケース(If-Match指定時の対象無し)
+    @pytest.mark.ng
+    async def test_ng_if_match_not_found(
+        self, app: FastAPI, general_client: AsyncClient
+    ) -> None:
+        res = await general_client.patch(
+            app.url_path_for("tasks:patch", id=500),
+            data='{"status":"DONE"}',
+            headers={"If-Match": '"0-0"'},
+        )
+        assert res.status_code == HTTP_404_NOT_FOUND
+
     # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
 
     # 異常ケース（アクティベーションエラー）
@@ -960,3 +1323,487 @@ class TestDelete:
     ) -> None:
         res = await general_client.delete(app.url_path_for("tasks:delete", id=param[0]))
         assert res.status_code == param[1]
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestStats:
+
+    # 正常ケース
+    @pytest.mark.ok
+    async def test_ok(
+        self, app: FastAPI, provisional_client: AsyncClient, import_task: DataFrame
+    ) -> None:
+        res = await provisional_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_200_OK
+        result = TaskStats(**res.json())
+        assert result.count == 20
+        assert result.overdue == 13
+        assert [(v.status, v.count) for v in result.by_status] == [
+            (TaskStatus.todo, 12),
+            (TaskStatus.doing, 5),
+            (TaskStatus.done, 3),
+        ]
+        assert [(v.asaignee_id, v.count) for v in result.by_asaignee] == [
+            ("T-901", 5),
+            ("T-902", 3),
+            ("T-903", 8),
+            (None, 4),
+        ]
+        assert [(v.is_significant, v.count) for v in result.by_significant] == [
+            (False, 15),
+            (True, 5),
+        ]
+
+        # 再集計結果と一致すること
+        res = await provisional_client.get(
+            app.url_path_for("tasks:stats"), params={"live": True}
+        )
+        assert res.status_code == HTTP_200_OK
+        assert TaskStats(**res.json()) == result
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(タスク更新/削除後も再集計結果と一致すること)
+    @pytest.mark.ok
+    async def test_ok_after_change(
+        self,
+        app: FastAPI,
+        general_client: AsyncClient,
+        fixed_task: TaskInDB,
+        task_for_delete: TaskInDB,
+    ) -> None:
+        res = await general_client.patch(
+            app.url_path_for("tasks:patch", id=fixed_task.id),
+            data='{"status":"DONE","asaignee_id":null}',
+        )
+        assert res.status_code == HTTP_200_OK
+        res = await general_client.delete(
+            app.url_path_for("tasks:delete", id=task_for_delete.id)
+        )
+        assert res.status_code == HTTP_200_OK
+
+        res = await general_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_200_OK
+        result = TaskStats(**res.json())
+        assert result.count == 1
+        assert [(v.asaignee_id, v.count) for v in result.by_asaignee] == [(None, 1)]
+
+        res = await general_client.get(
+            app.url_path_for("tasks:stats"), params={"live": True}
+        )
+        assert TaskStats(**res.json()) == result
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(完了/締切日の変更で期限切れ件数が再集計結果と一致すること)
+    @pytest.mark.ok
+    @pytest.mark.parametrize(
+        "data, overdue",
+        [
+            ('{"status":"DONE"}', 12),
+            ('{"deadline":null}', 12),
+            ('{"deadline":"2030-12-31"}', 12),
+            ('{"status":"DOING"}', 13),
+        ],
+        ids=["完了", "締切日なし", "締切日(未来)", "ステータスのみ"],
+    )
+    async def test_ok_overdue(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        import_task: DataFrame,
+        data: str,
+        overdue: int,
+    ) -> None:
+        res = await admin_client.patch(app.url_path_for("tasks:patch", id=7), data=data)
+        assert res.status_code == HTTP_200_OK
+
+        res = await admin_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_200_OK
+        result = TaskStats(**res.json())
+        assert result.count == 20
+        assert result.overdue == overdue
+
+        res = await admin_client.get(
+            app.url_path_for("tasks:stats"), params={"live": True}
+        )
+        assert TaskStats(**res.json()) == result
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース（アクティベーションエラー）
+    @pytest.mark.ng
+    async def test_ng_activation(
+        self, app: FastAPI, non_active_client: AsyncClient
+    ) -> None:
+        res = await non_active_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_401_UNAUTHORIZED
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestArchive:
+
+    # 正常ケース
+    @pytest.mark.ok
+    async def test_ok(
+        self,
+        app: FastAPI,
+        session: AsyncSession,
+        general_client: AsyncClient,
+        import_task: DataFrame,
+    ) -> None:
+        res = await general_client.put(
+            app.url_path_for("mine:put-watch-task", id=6), data='{"note":"archive"}'
+        )
+        assert res.status_code == HTTP_200_OK
+
+        # 完了タスク(id:6,11,12)がバッチ単位でアーカイブされること
+        service = ArchiveService()
+        moved = await service.archive_done_tasks(
+            session=session, after_days=30, batch_size=2
+        )
+        assert moved == 3
+        moved = await service.archive_done_tasks(session=session, after_days=30)
+        assert moved == 0
+
+        # 監視情報もアーカイブされること
+        result = await session.execute(select(td_WatcherArchive))
+        watchers = [watcher[0] for watcher in result.all()]
+        assert [(w.task_id, w.note) for w in watchers] == [(6, "archive")]
+        res = await general_client.get(app.url_path_for("mine:get-watch-tasks"))
+        assert res.json() == []
+
+        # 通常の検索ではアーカイブ済みのタスクを含まないこと
+        res = await general_client.post(
+            app.url_path_for("tasks:search"), params={"limit": 100}, data="{}"
+        )
+        result = TaskPublicList(**res.json())
+        assert result.count == 17
+        assert {6, 11, 12}.isdisjoint(task.id for task in result.tasks)
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケースパラメータ(アーカイブ済みを含めた検索)
+    valid_params = {
+        "パラメータ無し": ({}, "{}", 20, [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]),
+        "サブリソース(アカウント)": (
+            {"sub-resources": "account", "sort": "-id"},
+            "{}",
+            20,
+            [20, 19, 18, 17, 16, 15, 14, 13, 12, 11],
+        ),
+        "<body:status_in>:(DONE)": ({}, '{"status_in": ["DONE"]}', 3, [6, 11, 12]),
+        "<body:is_significant_eq>:(true)": (
+            {"sort": "+deadline"},
+            '{"is_significant_eq": true}',
+            5,
+            [1, 2, 15, 12, 13],
+        ),
+    }
+
+    @pytest.mark.parametrize(
+        "param", list(valid_params.values()), ids=list(valid_params.keys())
+    )
+    # 正常ケース
+    @pytest.mark.ok
+    async def test_ok_include_archived(
+        self,
+        app: FastAPI,
+        session: AsyncSession,
+        provisional_client: AsyncClient,
+        import_task: DataFrame,
+        param: tuple[any, str, int, List[int]],
+    ) -> None:
+        service = ArchiveService()
+        await service.archive_done_tasks(session=session, after_days=30)
+
+        res = await provisional_client.post(
+            app.url_path_for("tasks:search"),
+            params={**param[0], "include-archived": True},
+            data=param[1],
+        )
+        assert res.status_code == HTTP_200_OK
+        result = TaskPublicList(**res.json())
+        assert result.count == param[2]
+        assert [task.id for task in result.tasks] == param[3]
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestChanges:
+    @pytest.fixture(autouse=True)
+    def no_settle(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        # 直前の更新も取得対象とする
+        monkeypatch.setattr("app.services.tasks.SYNC_SETTLE_SECONDS", 0)
+
+    # 正常ケース(初回は全件、以降はカーソル以降の更新/削除のみ)
+    @pytest.mark.ok
+    async def test_ok(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        import_task: DataFrame,
+    ) -> None:
+        res = await admin_client.get(
+            app.url_path_for("tasks:changes"), params={"limit": 100}
+        )
+        assert res.status_code == HTTP_200_OK
+        result = res.json()
+        assert [task["id"] for task in result["tasks"]] == list(range(1, 21))
+        assert result["tasks"][0]["title"] == import_task.iloc[0]["title"]
+        assert result["deleted"] == []
+        assert result["has_more"] is False
+        cursor = result["cursor"]
+
+        res = await admin_client.patch(
+            app.url_path_for("tasks:patch", id=3), data='{"description":"changed"}'
+        )
+        assert res.status_code == HTTP_200_OK
+        res = await admin_client.delete(app.url_path_for("tasks:delete", id=5))
+        assert res.status_code == HTTP_200_OK
+
+        res = await admin_client.get(
+            app.url_path_for("tasks:changes"), params={"since": cursor}
+        )
+        assert res.status_code == HTTP_200_OK
+        result = res.json()
+        assert [task["id"] for task in result["tasks"]] == [3]
+        assert result["tasks"][0]["description"] == "changed"
+        assert result["deleted"] == [5]
+        assert result["has_more"] is False
+
+        # 取得済みの差分は再取得されないこと
+        res = await admin_client.get(
+            app.url_path_for("tasks:changes"), params={"since": result["cursor"]}
+        )
+        result = res.json()
+        assert (result["tasks"], result["deleted"]) == ([], [])
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(実行中のトランザクションの更新はコミット後に取りこぼさず取得する)
+    @pytest.mark.ok
+    async def test_ok_open_transaction(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        import_task: DataFrame,
+    ) -> None:
+        url = app.url_path_for("tasks:changes")
+        res = await admin_client.get(url, params={"limit": 100})
+        cursor = res.json()["cursor"]
+
+        con: asyncpg.Connection = await asyncpg.connect(NATIVE_URL)
+        try:
+            # 更新日時は開始日時(後から開始した更新より前の日時)でコミットされる
+            transaction = con.transaction()
+            await transaction.start()
+            await con.execute(
+                "UPDATE todo.tasks SET description = 'long' WHERE id = 7"
+            )
+            await asyncio.sleep(0.1)
+            res = await admin_client.patch(
+                app.url_path_for("tasks:patch", id=8), data='{"description":"short"}'
+            )
+            assert res.status_code == HTTP_200_OK
+
+            # 実行中のトランザクションの開始日時以降はカーソルを進めない
+            res = await admin_client.get(url, params={"since": cursor})
+            result = res.json()
+            assert result["tasks"] == []
+            cursor = result["cursor"]
+            await transaction.commit()
+        finally:
+            await con.close()
+
+        res = await admin_client.get(url, params={"since": cursor})
+        result = res.json()
+        assert [task["id"] for task in result["tasks"]] == [7, 8]
+        assert [task["description"] for task in result["tasks"]] == ["long", "short"]
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(同一更新日時のタスク/削除記録も件数上限で分割して漏れなく取得する)
+    @pytest.mark.ok
+    async def test_ok_paging(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        import_task: DataFrame,
+    ) -> None:
+        res = await admin_client.get(
+            app.url_path_for("tasks:changes"), params={"limit": 100}
+        )
+        cursor = res.json()["cursor"]
+        for id in (20, 4, 9):
+            res = await admin_client.delete(app.url_path_for("tasks:delete", id=id))
+            assert res.status_code == HTTP_200_OK
+
+        pages = []
+        since = None
+        while True:
+            params = {"limit": 7, "since": since} if since else {"limit": 7}
+            res = await admin_client.get(
+                app.url_path_for("tasks:changes"), params=params
+            )
+            assert res.status_code == HTTP_200_OK
+            result = res.json()
+            pages.append([task["id"] for task in result["tasks"]])
+            since = result["cursor"]
+            if not result["has_more"]:
+                break
+        remains = sorted(set(range(1, 21)) - {20, 4, 9})
+        assert pages == [remains[:7], remains[7:14], remains[14:]]
+
+        deleted = []
+        since = cursor
+        while True:
+            res = await admin_client.get(
+                app.url_path_for("tasks:changes"), params={"limit": 2, "since": since}
+            )
+            result = res.json()
+            deleted.append(result["deleted"])
+            since = result["cursor"]
+            if not result["has_more"]:
+                break
+        # 削除順に取得されること
+        assert deleted == [[20, 4], [9]]
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(保持期間を経過した削除記録はアーカイブ処理で削除される)
+    @pytest.mark.ok
+    async def test_ok_purge(
+        self,
+        app: FastAPI,
+        session: AsyncSession,
+        admin_client: AsyncClient,
+        import_task: DataFrame,
+    ) -> None:
+        res = await admin_client.get(app.url_path_for("tasks:changes"))
+        cursor = res.json()["cursor"]
+        res = await admin_client.delete(app.url_path_for("tasks:delete", id=5))
+        assert res.status_code == HTTP_200_OK
+
+        service = ArchiveService()
+        assert await service.purge_tombstones(session=session) == 0
+        assert await service.purge_tombstones(session=session, retention_days=-1) == 1
+
+        res = await admin_client.get(
+            app.url_path_for("tasks:changes"), params={"since": cursor}
+        )
+        assert res.json()["deleted"] == []
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース(削除記録の保持期間を超過したカーソル)
+    @pytest.mark.ng
+    async def test_ng_expired(
+        self, app: FastAPI, admin_client: AsyncClient, import_task: DataFrame
+    ) -> None:
+        old = datetime.now(timezone.utc) - timedelta(days=365)
+        cursor = ChangeCursor(old, 0, old, 0)
+        res = await admin_client.get(
+            app.url_path_for("tasks:changes"), params={"since": str(cursor)}
+        )
+        assert res.status_code == HTTP_410_GONE
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース(カーソル不正)
+    @pytest.mark.parametrize(
+        "since",
+        ["abc", "1.2.3", "1.2.3.4.5", "1.-2.3.4", "1.2.3.2147483648", "1.2.3.x"],
+        ids=["形式不正", "要素数不足", "要素数超過", "負数", "ID範囲外", "数値以外"],
+    )
+    @pytest.mark.ng
+    async def test_ng_cursor(
+        self, app: FastAPI, admin_client: AsyncClient, since: str
+    ) -> None:
+        res = await admin_client.get(
+            app.url_path_for("tasks:changes"), params={"since": since}
+        )
+        assert res.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース（アクティベーションエラー）
+    @pytest.mark.ng
+    async def test_ng_activation(
+        self, app: FastAPI, non_active_client: AsyncClient
+    ) -> None:
+        res = await non_active_client.get(app.url_path_for("tasks:changes"))
+        assert res.status_code == HTTP_401_UNAUTHORIZED
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestQueryBudget:
+
+    # 正常ケースパラメータ(メソッド, ルート名, パスパラメータ, クエリパラメータ, ボディ, 予算)
+    # ※取得件数/サブリソースの有無でSQL文の件数が増えないこと(N+1の検知)
+    valid_params = {
+        "タスク検索": ("POST", "tasks:search", {}, {"limit": 100}, "{}", 3),
+        "タスク検索(サブリソース:アカウント)": (
+            "POST",
+            "tasks:search",
+            {},
+            {"limit": 100, "sub-resources": "account"},
+            "{}",
+            3,
+        ),
+        "タスク取得": ("GET", "tasks:get", {"id": 1}, {}, None, 3),
+        "タスク取得(サブリソース:アカウント)": (
+            "GET",
+            "tasks:get",
+            {"id": 1},
+            {"sub-resources": "account"},
+            None,
+            3,
+        ),
+        "タスク集計": ("GET", "tasks:stats", {}, {}, None, 2),
+        "差分取得": ("GET", "tasks:changes", {}, {"limit": 100}, None, 4),
+        "タスク更新": (
+            "PATCH",
+            "tasks:patch",
+            {"id": 20},
+            {},
+            '{"description":"changed"}',
+            4,
+        ),
+        "タスク削除": ("DELETE", "tasks:delete", {"id": 20}, {}, None, 3),
+    }
+
+    @pytest.mark.parametrize(
+        "param", list(valid_params.values()), ids=list(valid_params.keys())
+    )
+    @pytest.mark.ok
+    async def test_ok(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        import_task: DataFrame,
+        param: tuple,
+    ) -> None:
+        method, name, path_params, params, data, budget = param
+        with QueryBudget(budget, strict=True, name=name):
+            res = await admin_client.request(
+                method, app.url_path_for(name, **path_params), params=params, data=data
+            )
+        assert res.status_code == HTTP_200_OK
+
+    # 正常ケース(タスク登録)
+    @pytest.mark.ok
+    async def test_ok_create(self, app: FastAPI, admin_client: AsyncClient) -> None:
+        with QueryBudget(3, strict=True, name="tasks:create"):
+            res = await admin_client.post(
+                app.url_path_for("tasks:create"),
+                data=TaskCreate(title="task").json(exclude_unset=True),
+            )
+        assert res.status_code == HTTP_201_CREATED
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+# test_tracing.py
+
+import logging
+import re
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.status import HTTP_200_OK
+
+from app.core.tracing import (
+    QueryBudget,
+    QueryBudgetExceeded,
+    RequestTrace,
+    fingerprint,
+    request_trace,
+)
+
+pytestmark = pytest.mark.asyncio
+
+# Server-Timingヘッダの各項目
+TIMING = re.compile(r'(\w+)(?:;desc="([^"]*)")?;dur=([\d.]+)')
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestFingerprint:
+
+    # 正常ケースパラメータ
+    valid_params = {
+        "バインドパラメータ": (
+            "SELECT * FROM tasks WHERE id = $1",
+            "SELECT * FROM tasks WHERE id = ?",
+        ),
+        "IN句": (
+            "SELECT * FROM tasks WHERE id IN ($1, $2, $3)",
+            "SELECT * FROM tasks WHERE id IN (?)",
+        ),
+        "リテラル": (
+            "SELECT * FROM tasks WHERE title = 'it''s' LIMIT 10",
+            "SELECT * FROM tasks WHERE title = ? LIMIT ?",
+        ),
+        "空白": (
+            "SELECT id\n    FROM tasks_1",
+            "SELECT id FROM tasks_1",
+        ),
+    }
+
+    @pytest.mark.parametrize(
+        "param", list(valid_params.values()), ids=list(valid_params.keys())
+    )
+    @pytest.mark.ok
+    async def test_ok(self, param: tuple) -> None:
+        assert fingerprint(param[0]) == param[1]
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestServerTiming:
+
+    # 正常ケース(DB/認証/シリアライズ/全体の処理時間を返却する)
+    @pytest.mark.ok
+    async def test_ok(self, app: FastAPI, admin_client: AsyncClient) -> None:
+        res = await admin_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_200_OK
+        timings = {
+            name: (desc, float(dur))
+            for name, desc, dur in TIMING.findall(res.headers["server-timing"])
+        }
+        assert list(timings) == ["db", "auth", "serialize", "total"]
+        queries, rows = map(int, re.findall(r"\d+", timings["db"][0]))
+        assert queries > 0
+        assert rows > 0
+        assert timings["auth"][1] > 0
+        assert timings["db"][1] <= timings["total"][1]
+
+    # 正常ケース(予算を超えたリクエストは実行した文をログ出力する)
+    @pytest.mark.ok
+    async def test_ok_over_budget(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        res = await admin_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_200_OK
+        assert "request over budget" not in caplog.text
+
+        monkeypatch.setattr("app.core.tracing.REQUEST_QUERY_BUDGET", 0)
+        # alembicのログ設定(スキーマ作成時)で無効化されたロガーを戻す
+        monkeypatch.setattr(logging.getLogger("app.core.tracing"), "disabled", False)
+        with caplog.at_level(logging.WARNING, logger="app.core.tracing"):
+            res = await admin_client.get(app.url_path_for("tasks:stats"))
+        assert res.status_code == HTTP_200_OK
+        messages = [
+            r.getMessage() for r in caplog.records if r.name == "app.core.tracing"
+        ]
+        assert len(messages) == 1
+        assert messages[0].startswith("request over budget: tasks:stats")
+        assert "SELECT" in messages[0]
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+@pytest_asyncio.fixture
+async def db(session: AsyncSession) -> AsyncSession:
+    async with session:
+        yield session
+
+
+async def select_one(session: AsyncSession, times: int) -> None:
+    for _ in range(times):
+        await session.execute(text("SELECT 1"))
+
+
+class TestRows:
+
+    # 正常ケース(取得した行数を記録し、結果は変わらないこと)
+    @pytest.mark.ok
+    async def test_ok(self, db: AsyncSession) -> None:
+        trace = RequestTrace()
+        token = request_trace.set(trace)
+        try:
+            result = await db.execute(text("SELECT generate_series(1, 5) AS v"))
+            assert result.scalars().all() == [1, 2, 3, 4, 5]
+            result = await db.execute(text("SELECT 1 WHERE false"))
+            assert result.first() is None
+            # 行を返さない文は件数のみ(rowcountは参照できること)
+            result = await db.execute(text("SET LOCAL work_mem = '4MB'"))
+            assert result.rowcount == -1
+        finally:
+            request_trace.reset(token)
+        assert trace.queries == 3
+        assert trace.rows == 5
+
+    # 正常ケース(計測中のリクエストが無い場合は記録しない)
+    @pytest.mark.ok
+    async def test_ok_without_trace(self, db: AsyncSession) -> None:
+        result = await db.execute(text("SELECT generate_series(1, 5)"))
+        assert len(result.all()) == 5
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestQueryBudget:
+
+    # 正常ケース(予算内)
+    @pytest.mark.ok
+    async def test_ok(self, db: AsyncSession) -> None:
+        with QueryBudget(3, strict=True) as outer:
+            with QueryBudget(2, strict=True) as inner:
+                await select_one(db, 2)
+            await select_one(db, 1)
+        assert inner.used == 2
+        # 内側のブロックで実行した文は外側のブロックにも数える
+        assert outer.used == 3
+
+    # 正常ケース(デコレータ)
+    @pytest.mark.ok
+    async def test_ok_decorator(self, db: AsyncSession) -> None:
+        budgeted = QueryBudget(1, strict=True)(select_one)
+        await budgeted(db, 1)
+        with pytest.raises(QueryBudgetExceeded, match="select_one 2 > 1 queries"):
+            await budgeted(db, 2)
+
+    # 正常ケース(本番用。超過時はログ出力のみ)
+    @pytest.mark.ok
+    async def test_ok_log(
+        self,
+        db: AsyncSession,
+        monkeypatch: pytest.MonkeyPatch,
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        monkeypatch.setattr(logging.getLogger("app.core.tracing"), "disabled", False)
+        with caplog.at_level(logging.WARNING, logger="app.core.tracing"):
+            with QueryBudget(1, name="loop"):
+                await select_one(db, 3)
+        messages = [
+            r.getMessage() for r in caplog.records if r.name == "app.core.tracing"
+        ]
+        assert len(messages) == 1
+        assert messages[0].startswith("query budget exceeded: loop 3 > 1 queries")
+        assert "3x" in messages[0] and "SELECT ?" in messages[0]
+
+    # 異常ケース(予算超過。実行件数の多い文を示す)
+    @pytest.mark.ng
+    async def test_ng(self, db: AsyncSession) -> None:
+        with pytest.raises(QueryBudgetExceeded) as e:
+            with QueryBudget(2, strict=True, name="loop"):
+                await select_one(db, 3)
+        assert "loop 3 > 2 queries" in str(e.value)
+        assert "3x" in str(e.value) and "SELECT ?" in str(e.value)
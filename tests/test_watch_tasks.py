@@ -1,10 +1,13 @@
 #!/usr/bin/python3
 # test_watch_tasks.py
 
+import asyncio
+from datetime import date
 from typing import List
 
 import pytest
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
 from httpx import AsyncClient
 from starlette.routing import NoMatchFound
 from starlette.status import (
@@ -13,14 +16,21 @@ from starlette.status import (
     HTTP_401_UNAUTHORIZED,
     HTTP_404_NOT_FOUND,
     HTTP_422_UNPROCESSABLE_ENTITY,
+    HTTP_503_SERVICE_UNAVAILABLE,
 )
 
+from app.api.events import WatchTaskStream
+from app.api.schemas.accounts import ProfileInDB
 from app.api.schemas.tasks import (
     TaskCreate,
     TaskInDB,
     TaskPublicList,
     TaskWithWatchNote,
+    WatchTask,
 )
+from app.core.notify import ChangeBus, ChangeEvent, change_bus
+from app.core.tracing import QueryBudget
+from app.services.accounts import AccountService
 
 pytestmark = pytest.mark.asyncio
 
@@ -172,6 +182,45 @@ class TestDelete:
 
 class TestGet:
 
+    # 正常ケース(モデルを経由しないレスポンスがモデルのシリアライズ結果と一致する)
+    @pytest.mark.ok
+    async def test_ok_fast_serialization(
+        self, app: FastAPI, general_client: AsyncClient
+    ) -> None:
+        for new_task, note in [
+            (TaskCreate(title="task1"), "note"),
+            (
+                TaskCreate(
+                    title="task2",
+                    description="description",
+                    asaignee_id="T-000",
+                    is_significant=True,
+                    deadline=date(2030, 12, 31),
+                ),
+                "",
+            ),
+        ]:
+            res = await general_client.post(
+                app.url_path_for("tasks:create"),
+                data=new_task.json(exclude_unset=True),
+            )
+            assert res.status_code == HTTP_201_CREATED
+            res = await general_client.put(
+                app.url_path_for("mine:put-watch-task", id=res.json()["id"]),
+                data=WatchTask(note=note).json(),
+            )
+            assert res.status_code == HTTP_200_OK
+
+        res = await general_client.get(app.url_path_for("mine:get-watch-tasks"))
+        assert res.status_code == HTTP_200_OK
+        tasks = res.json()
+        assert len(tasks) == 2
+        expected = [jsonable_encoder(TaskWithWatchNote(**v)) for v in tasks]
+        assert [list(v) for v in tasks] == [list(v) for v in expected]
+        assert tasks == expected
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
     # 異常ケース（認証エラー）
     @pytest.mark.ng
     async def test_ng_authentication(self, app: FastAPI, client: AsyncClient) -> None:
@@ -313,3 +362,209 @@ class TestUsecase:
         assert res.status_code == HTTP_200_OK
         watch_list: List[TaskWithWatchNote] = res.json()
         assert watch_list == []
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestEvents:
+
+    # 正常ケース(監視タスクの更新のみ配信し、通知の欠落でresyncを送信して終了する)
+    @pytest.mark.ok
+    async def test_ok(
+        self,
+        app: FastAPI,
+        general_client: AsyncClient,
+        general_account: ProfileInDB,
+    ) -> None:
+        ids = []
+        for title in ("task1", "task2"):
+            res = await general_client.post(
+                app.url_path_for("tasks:create"),
+                data=TaskCreate(title=title).json(exclude_unset=True),
+            )
+            assert res.status_code == HTTP_201_CREATED
+            ids.append(res.json()["id"])
+        task1, task2 = ids
+        res = await general_client.put(
+            app.url_path_for("mine:put-watch-task", id=task1), data='{"note":"note"}'
+        )
+        assert res.status_code == HTTP_200_OK
+
+        subscribers = len(change_bus.subscribers)
+        stream = asyncio.create_task(
+            general_client.get(app.url_path_for("mine:watch-task-events"))
+        )
+        for _ in range(100):
+            if len(change_bus.subscribers) > subscribers:
+                break
+            await asyncio.sleep(0.05)
+        else:
+            stream.cancel()
+            pytest.fail("stream not subscribed")
+
+        me, other = general_account.account_id, "T-999"
+        for event in [
+            ChangeEvent("todo", "tasks", "UPDATE", {"id": task1}),
+            ChangeEvent("todo", "tasks", "UPDATE", {"id": task2}),  # 監視対象外
+            ChangeEvent(
+                "todo", "watcher", "INSERT", {"watcher_id": other, "task_id": task2}
+            ),
+            ChangeEvent(
+                "todo", "watcher", "INSERT", {"watcher_id": me, "task_id": task2}
+            ),
+            ChangeEvent("todo", "tasks", "DELETE", {"id": task2}),
+            ChangeEvent("account", "profiles", "UPDATE", {"account_id": me}),
+            None,
+        ]:
+            change_bus.publish(event)
+
+        res = await asyncio.wait_for(stream, timeout=10)
+        assert res.status_code == HTTP_200_OK
+        assert res.headers["content-type"].startswith("text/event-stream")
+        messages = [m for m in res.text.split("\n\n") if m.startswith("event:")]
+        assert messages == [
+            f'event: task\ndata: {{"id":{task1},"op":"UPDATE"}}',
+            f'event: watch\ndata: {{"id":{task2},"op":"INSERT"}}',
+            f'event: task\ndata: {{"id":{task2},"op":"DELETE"}}',
+            "event: resync\ndata: {}",
+        ]
+        assert len(change_bus.subscribers) == subscribers
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(監視タスクIDの取得中の更新も配信すること)
+    @pytest.mark.ok
+    async def test_ok_during_load(
+        self,
+        app: FastAPI,
+        general_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        res = await general_client.post(
+            app.url_path_for("tasks:create"),
+            data=TaskCreate(title="task1").json(exclude_unset=True),
+        )
+        assert res.status_code == HTTP_201_CREATED
+        task1 = res.json()["id"]
+        res = await general_client.put(
+            app.url_path_for("mine:put-watch-task", id=task1), data='{"note":"note"}'
+        )
+        assert res.status_code == HTTP_200_OK
+
+        get_watch_task_ids = AccountService.get_watch_task_ids
+
+        async def notify_after_load(self, **kwargs):
+            result = await get_watch_task_ids(self, **kwargs)
+            # 取得後、ストリームの開始前に届いた通知
+            change_bus.publish(ChangeEvent("todo", "tasks", "UPDATE", {"id": task1}))
+            change_bus.publish(None)
+            return result
+
+        monkeypatch.setattr(AccountService, "get_watch_task_ids", notify_after_load)
+        subscribers = len(change_bus.subscribers)
+        res = await asyncio.wait_for(
+            general_client.get(app.url_path_for("mine:watch-task-events")), timeout=10
+        )
+        assert res.status_code == HTTP_200_OK
+        messages = [m for m in res.text.split("\n\n") if m.startswith("event:")]
+        assert messages == [
+            f'event: task\ndata: {{"id":{task1},"op":"UPDATE"}}',
+            "event: resync\ndata: {}",
+        ]
+        assert len(change_bus.subscribers) == subscribers
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(ストリームの開始前にエラーとなった場合も購読を終了すること)
+    @pytest.mark.ok
+    async def test_ok_unsubscribe_on_error(
+        self,
+        app: FastAPI,
+        general_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        async def fail(self, **kwargs):
+            raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+
+        monkeypatch.setattr(AccountService, "get_watch_task_ids", fail)
+        subscribers = len(change_bus.subscribers)
+        res = await general_client.get(app.url_path_for("mine:watch-task-events"))
+        assert res.status_code == HTTP_404_NOT_FOUND
+        assert len(change_bus.subscribers) == subscribers
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 正常ケース(キューが溢れた場合はresyncを送信して終了する)
+    @pytest.mark.ok
+    async def test_ok_overflow(self) -> None:
+        bus = ChangeBus(enabled=False)
+        stream = WatchTaskStream("T-000", {1}, bus=bus, queue_size=1)
+        events = stream.events()
+        assert (await events.__anext__()).startswith(b"retry:")
+
+        bus.publish(ChangeEvent("todo", "tasks", "UPDATE", {"id": 1}))
+        bus.publish(ChangeEvent("todo", "tasks", "UPDATE", {"id": 1}))
+        assert await events.__anext__() == b"event: resync\ndata: {}\n\n"
+        with pytest.raises(StopAsyncIteration):
+            await events.__anext__()
+        assert bus.subscribers == []
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース（認証エラー）
+    @pytest.mark.ng
+    async def test_ng_authentication(self, app: FastAPI, client: AsyncClient) -> None:
+        res = await client.get(app.url_path_for("mine:watch-task-events"))
+        assert res.status_code == HTTP_401_UNAUTHORIZED
+
+    # ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----
+
+    # 異常ケース(更新通知が無効)
+    @pytest.mark.ng
+    async def test_ng_disabled(
+        self,
+        app: FastAPI,
+        general_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(change_bus, "enabled", False)
+        res = await general_client.get(app.url_path_for("mine:watch-task-events"))
+        assert res.status_code == HTTP_503_SERVICE_UNAVAILABLE
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestQueryBudget:
+
+    # 正常ケース(監視タスクの件数でSQL文の件数が増えないこと)
+    @pytest.mark.ok
+    async def test_ok(self, app: FastAPI, general_client: AsyncClient) -> None:
+        ids = []
+        for title in ("task1", "task2", "task3", "task4", "task5"):
+            res = await general_client.post(
+                app.url_path_for("tasks:create"),
+                data=TaskCreate(title=title).json(exclude_unset=True),
+            )
+            assert res.status_code == HTTP_201_CREATED
+            ids.append(res.json()["id"])
+
+        for id in ids:
+            with QueryBudget(2, strict=True, name="mine:put-watch-task"):
+                res = await general_client.put(
+                    app.url_path_for("mine:put-watch-task", id=id),
+                    data='{"note":"note"}',
+                )
+            assert res.status_code == HTTP_200_OK
+
+        with QueryBudget(2, strict=True, name="mine:get-watch-tasks"):
+            res = await general_client.get(app.url_path_for("mine:get-watch-tasks"))
+        assert res.status_code == HTTP_200_OK
+        assert len(res.json()) == 5
+
+        with QueryBudget(4, strict=True, name="mine:delete-watch-task"):
+            res = await general_client.delete(
+                app.url_path_for("mine:delete-watch-task", id=ids[0])
+            )
+        assert res.status_code == HTTP_200_OK
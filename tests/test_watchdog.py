@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# test_watchdog.py
+
+import asyncio
+import logging
+import time
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK
+
+from app.core.metrics import loop_lag, loop_stalls
+from app.core.watchdog import LoopWatchdog, loop_watchdog
+
+pytestmark = pytest.mark.asyncio
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+def blocking_call() -> None:
+    time.sleep(0.3)
+
+
+class TestLoopWatchdog:
+
+    # 正常ケース(遅延の記録と、停止中のループのスタックのログ出力)
+    @pytest.mark.ok
+    async def test_ok(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        monkeypatch.setattr(logging.getLogger("app.core.watchdog"), "disabled", False)
+        watchdog = LoopWatchdog(interval=0.01, threshold=0.05, enabled=True)
+        count, lag, stalls = loop_lag.count, loop_lag.sum, loop_stalls.value
+
+        with caplog.at_level(logging.WARNING, logger="app.core.watchdog"):
+            await watchdog.start()
+            await asyncio.sleep(0.05)
+            blocking_call()
+            await asyncio.sleep(0.05)
+            await watchdog.stop()
+
+        assert loop_lag.count > count
+        assert loop_lag.sum - lag >= 0.2
+        # 停止1回につき1度だけ報告する
+        assert loop_stalls.value == stalls + 1
+        stall = watchdog.recent()[0]
+        assert stall["blocked_ms"] >= 50
+        assert any("in blocking_call" in line for line in stall["stack"])
+        messages = [
+            r.getMessage() for r in caplog.records if r.name == "app.core.watchdog"
+        ]
+        assert len(messages) == 1
+        assert messages[0].startswith("event loop blocked for ")
+        assert "time.sleep(0.3)" in messages[0]
+
+    # 正常ケース(無効時は監視しない)
+    @pytest.mark.ok
+    async def test_ok_disabled(self) -> None:
+        watchdog = LoopWatchdog(enabled=False)
+        await watchdog.start()
+        assert watchdog.task is None
+        await watchdog.stop()
+
+
+# ----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+----+
+
+
+class TestLoopStalls:
+
+    # 正常ケース(直近の停止を新しい順に返却する)
+    @pytest.mark.ok
+    async def test_ok(
+        self,
+        app: FastAPI,
+        admin_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr("app.api.routes.debug.PROFILE_ENABLED", True)
+        monkeypatch.setattr(loop_watchdog, "stalls", type(loop_watchdog.stalls)())
+        loop_watchdog.stalls.append({"blocked_ms": 120.0, "stack": []})
+        loop_watchdog.stalls.append({"blocked_ms": 300.0, "stack": []})
+
+        res = await admin_client.get(app.url_path_for("debug:loop-stalls"))
+        assert res.status_code == HTTP_200_OK
+        assert [v["blocked_ms"] for v in res.json()] == [300.0, 120.0]